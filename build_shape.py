@@ -1,5 +1,12 @@
+import argparse
+import ast
+import os
+import shlex
+
 import combine_functions
 import marble_path
+import mesh_cache
+import profiler
 import slope_function
 
 def print_stats(x_t, y_t, z_t, r_t, num_time_steps):
@@ -22,7 +29,7 @@ def print_stats(x_t, y_t, z_t, r_t, num_time_steps):
     print("Begin rotation: %.4f" % r_t(0))
     print("End rotation:   %.4f" % r_t(num_time_steps))
 
-def generate_shape(module, args):
+def build_centerline(module, args):
     module.describe_curve(args)
 
     if getattr(module, 'build_time_t', None) is not None:
@@ -30,15 +37,32 @@ def generate_shape(module, args):
     else:
         time_t = lambda t: t
 
+    # a module can provide build_dx_dy_t, which returns the
+    # derivatives of x_t and y_t with respect to the time step, or
+    # None if they are not known for these args.  Otherwise the
+    # rotation and arclength are calculated numerically
+    derivatives = None
     if getattr(module, 'build_x_y_r_t', None) is not None:
         x_t, y_t, r_t = module.build_x_y_r_t(args)
-    elif getattr(module, 'build_x_y_t', None) is not None:
-        x_t, y_t = module.build_x_y_t(args)
-        r_t = marble_path.numerical_rotation_function(x_t, y_t)
+        x_t = profiler.counted('x_t', x_t)
+        y_t = profiler.counted('y_t', y_t)
     else:
-        x_t = module.build_x_t(args)
-        y_t = module.build_y_t(args)
-        r_t = marble_path.numerical_rotation_function(x_t, y_t)
+        if getattr(module, 'build_x_y_t', None) is not None:
+            x_t, y_t = module.build_x_y_t(args)
+        else:
+            x_t = module.build_x_t(args)
+            y_t = module.build_y_t(args)
+        # counted before the rotation is built, so that its finite
+        # differences are counted as well
+        x_t = profiler.counted('x_t', x_t)
+        y_t = profiler.counted('y_t', y_t)
+        if getattr(module, 'build_dx_dy_t', None) is not None:
+            derivatives = module.build_dx_dy_t(args)
+        if derivatives is not None:
+            r_t = marble_path.derivative_rotation_function(*derivatives)
+        else:
+            r_t = marble_path.numerical_rotation_function(x_t, y_t)
+    r_t = profiler.counted('r_t', r_t)
 
     num_time_steps = args.num_time_steps
 
@@ -47,44 +71,143 @@ def generate_shape(module, args):
     # in generate_hypotrochoid's closest_approach.  For now, those
     # arguments are incompatible
     if getattr(args, 'kink_replace_circle', None):
-        x_t, y_t, r_t = combine_functions.replace_kinks_with_circles(args=args,
-                                                                     time_t=time_t,
-                                                                     x_t=x_t,
-                                                                     y_t=y_t,
-                                                                     r_t=r_t,
-                                                                     kink_args=args,
-                                                                     num_time_steps=num_time_steps)
-
-    slope_angle_t = slope_function.slope_function(x_t=x_t,
-                                                  y_t=y_t,
-                                                  time_t=time_t,
-                                                  slope_angle=args.slope_angle,
-                                                  num_time_steps=num_time_steps,
-                                                  overlap_args=args,
-                                                  kink_args=args)
+        with profiler.stage("replace_kinks_with_circles"):
+            x_t, y_t, r_t = combine_functions.replace_kinks_with_circles(args=args,
+                                                                         time_t=time_t,
+                                                                         x_t=x_t,
+                                                                         y_t=y_t,
+                                                                         r_t=r_t,
+                                                                         kink_args=args,
+                                                                         num_time_steps=num_time_steps)
+        derivatives = None
+
+    dx_t, dy_t = derivatives if derivatives is not None else (None, None)
+    path_samples = marble_path.PathSamples(x_t, y_t, num_time_steps, args.arclength_substeps,
+                                           dx_t=dx_t, dy_t=dy_t)
+    with profiler.stage("slope_function"):
+        slope_angle_t = slope_function.slope_function(x_t=x_t,
+                                                      y_t=y_t,
+                                                      time_t=time_t,
+                                                      slope_angle=args.slope_angle,
+                                                      num_time_steps=num_time_steps,
+                                                      overlap_args=args,
+                                                      kink_args=args,
+                                                      arclength_substeps=args.arclength_substeps,
+                                                      path_samples=path_samples)
 
     if getattr(args, 'zero_circle', None):
-        updated_functions = combine_functions.add_both_zero_circles(args=args,
-                                                                    num_time_steps=num_time_steps,
-                                                                    x_t=x_t,
-                                                                    y_t=y_t,
-                                                                    slope_angle_t=slope_angle_t,
-                                                                    r_t=r_t)
+        with profiler.stage("add_both_zero_circles"):
+            updated_functions = combine_functions.add_both_zero_circles(args=args,
+                                                                        num_time_steps=num_time_steps,
+                                                                        x_t=x_t,
+                                                                        y_t=y_t,
+                                                                        slope_angle_t=slope_angle_t,
+                                                                        r_t=r_t)
         num_time_steps, x_t, y_t, slope_angle_t, r_t = updated_functions
 
-    z_t = marble_path.arclength_height_function(x_t, y_t, num_time_steps, slope_angle_t=slope_angle_t)
+    with profiler.stage("arclength_height_function"):
+        z_t = marble_path.arclength_height_function(x_t, y_t, num_time_steps, slope_angle_t=slope_angle_t,
+                                                    arclength_substeps=args.arclength_substeps,
+                                                    path_samples=path_samples)
+    z_t = profiler.counted('z_t', z_t)
+
+    with profiler.stage("print_stats"):
+        print_stats(x_t, y_t, z_t, r_t, num_time_steps)
+
+    centerline = marble_path.Centerline(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
+                                        num_time_steps=num_time_steps,
+                                        time_t=time_t,
+                                        slope_angle_t=slope_angle_t)
+    if args.adaptive_tolerance > 0:
+        with profiler.stage("adaptive_centerline"):
+            centerline = marble_path.adaptive_centerline(centerline, args.tube_radius, args.slope_angle,
+                                                         args.adaptive_tolerance)
+    return centerline
+
+def generate_shape(module, args):
+    return marble_path.sweep_centerline(build_centerline(module, args), args)
+
+# tube arguments a variant cannot change, since they change the centerline
+# or are set by the variant itself
+CENTERLINE_ARGS = ('slope_angle', 'arclength_substeps', 'output_name')
+
+def parse_tube_overrides(tube_args):
+    """
+    Parses tube arguments such as '--tube_end_angle 360' into a dict
+    of only the arguments which were given
+    """
+    if isinstance(tube_args, str):
+        tube_args = shlex.split(tube_args)
+    parser = argparse.ArgumentParser(prog='--variants', exit_on_error=False)
+    marble_path.add_tube_arguments(parser)
+    # argparse only fills in defaults for arguments not already in
+    # the namespace, so anything still unset was not given
+    unset = object()
+    namespace = argparse.Namespace(**dict.fromkeys(vars(parser.parse_args([])), unset))
+    try:
+        namespace, unknown = parser.parse_known_args([str(arg) for arg in tube_args], namespace=namespace)
+    except argparse.ArgumentError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    if unknown:
+        raise argparse.ArgumentTypeError("Variants can only change tube arguments, not %s" % " ".join(unknown))
+    overrides = {arg: value for arg, value in vars(namespace).items() if value is not unset}
+    for arg in CENTERLINE_ARGS:
+        if arg in overrides:
+            raise argparse.ArgumentTypeError("Variants cannot change --%s" % arg)
+    return overrides
+
+def parse_variants(arg):
+    variants = ast.literal_eval(arg)
+    if not isinstance(variants, dict):
+        raise argparse.ArgumentTypeError("--variants must be a dict of output_name: tube arguments")
+    return {output_name: parse_tube_overrides(tube_args) for output_name, tube_args in variants.items()}
+
+def add_variant_args(parser):
+    parser.add_argument('--variants', default=None, type=parse_variants,
+                        help='Other tubes to sweep along the same path, each written to its own file.  A dict of output_name: tube arguments, such as "{\'hole.stl\': \'--tube_radius 10.5 --wall_thickness 11 --tube_end_angle 360\'}".  Relative names go in the same directory as --output_name')
+
+def variant_args(args, output_name, overrides):
+    """
+    A copy of args with the variant's tube arguments and output_name.
+
+    Anything calculated in parse_args, such as a scale from
+    closest_approach, keeps the value from the original arguments
+    """
+    variant = argparse.Namespace(**vars(args))
+    for arg, value in overrides.items():
+        setattr(variant, arg, value)
+    variant.output_name = os.path.join(os.path.dirname(args.output_name), output_name)
+    variant.variants = None
+    return variant
+
+def write_variants(module, args, build_centerline):
+    """
+    Writes the model for args and then a model for each of args.variants.
 
-    print_stats(x_t, y_t, z_t, r_t, num_time_steps)
+    The centerline from build_centerline() is only built once, and not
+    at all if every model is already cached.  Returns the name of the
+    file written for args
+    """
+    centerlines = []
+    def sweep(tube_args):
+        if not centerlines:
+            with profiler.stage("centerline"):
+                centerlines.append(build_centerline())
+        with profiler.stage("generate_path"):
+            return marble_path.sweep_centerline(centerlines[0], tube_args)
 
-    for triangle in marble_path.generate_path(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
-                                              tube_args=args,
-                                              num_time_steps=num_time_steps,
-                                              time_t=time_t,
-                                              slope_angle_t=slope_angle_t):
-        yield triangle
+    output_format = getattr(args, 'output_format', marble_path.OutputFormat.STL)
+    # one report for all of the variants
+    with profiler.profiling(args, marble_path.output_filename(args.output_name, output_format)):
+        filename = mesh_cache.write_output(module, args, lambda: sweep(args))
+        for output_name, overrides in (getattr(args, 'variants', None) or {}).items():
+            tube_args = variant_args(args, output_name, overrides)
+            print("Variant %s: %s" % (tube_args.output_name, overrides))
+            mesh_cache.write_output(module, tube_args, lambda: sweep(tube_args))
+    return filename
 
 def main(module, sys_args=None):
     args = module.parse_args(sys_args)
     marble_path.print_args(args)
 
-    marble_path.write_stl(generate_shape(module, args), args.output_name)
+    return write_variants(module, args, lambda: build_centerline(module, args))
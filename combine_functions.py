@@ -1,14 +1,114 @@
 import argparse
+import bisect
 import math
 
+from collections import namedtuple
+
+import numpy as np
+
 import generate_helix
 import marble_util
 
+Segment = namedtuple('Segment', ['start', 'end', 'f_t', 'shifts', 'offsets'])
+
+def segment_evaluator(segment):
+    """
+    Returns a function t -> the value of one Segment at t.  t is
+    shifted by each of the shifts in turn, then each of the offsets
+    is added in turn
+
+    The usual cases of at most one shift and one offset get their own
+    closures, since these are called for every sample of the path
+    """
+    f_t = segment.f_t
+    if len(segment.shifts) > 1 or len(segment.offsets) > 1:
+        def evaluate_t(t):
+            for shift in segment.shifts:
+                t = t - shift
+            value = f_t(t)
+            for offset in segment.offsets:
+                value = value + offset
+            return value
+        return evaluate_t
+
+    if not segment.shifts and not segment.offsets:
+        return f_t
+    if not segment.offsets:
+        shift = segment.shifts[0]
+        return lambda t: f_t(t - shift)
+    offset = segment.offsets[0]
+    if not segment.shifts:
+        return lambda t: f_t(t) + offset
+    shift = segment.shifts[0]
+    return lambda t: f_t(t - shift) + offset
+
+class PiecewiseFunction:
+    """
+    A function of t made of pieces of other functions.
+
+    Each Segment covers start <= t < end.  Combining piecewise
+    functions builds a new flat table of segments rather than a
+    closure which calls the previous closures, so a path put together
+    from many pieces costs one bisect per call.
+
+    The shifts and offsets of a segment are applied one at a time in
+    the order the pieces were combined, which is the same arithmetic
+    as calling the nested functions would be.
+    """
+    def __init__(self, segments):
+        self.segments = segments
+        self.evaluators = [segment_evaluator(segment) for segment in segments]
+        # the first segment always starts at -inf
+        self.starts = [segment.start for segment in segments[1:]]
+
+    @staticmethod
+    def from_function(f_t):
+        if isinstance(f_t, PiecewiseFunction):
+            return f_t
+        return PiecewiseFunction([Segment(-math.inf, math.inf, f_t, (), ())])
+
+    def __call__(self, t):
+        return self.evaluators[bisect.bisect_right(self.starts, t)](t)
+
+    def evaluate(self, times):
+        """
+        Returns a list of the values at each of times, evaluating all
+        of the times which fall in the same segment together
+        """
+        values = [None] * len(times)
+        segment_indices = np.searchsorted(self.starts, times, side='right')
+        for segment_index in np.unique(segment_indices).tolist():
+            evaluate_t = self.evaluators[segment_index]
+            for i in np.flatnonzero(segment_indices == segment_index).tolist():
+                values[i] = evaluate_t(times[i])
+        return values
+
+    def shift(self, shift, offset=None):
+        """
+        Returns the function t -> self(t - shift) + offset
+        """
+        shifts = () if shift == 0 else (shift,)
+        offsets = () if offset is None else (offset,)
+        return PiecewiseFunction([Segment(segment.start + shift, segment.end + shift, segment.f_t,
+                                          shifts + segment.shifts, segment.offsets + offsets)
+                                  for segment in self.segments])
+
+    def append(self, other, inflection_t):
+        """
+        Returns the function which is self before inflection_t and other after
+        """
+        segments = [segment._replace(end=min(segment.end, inflection_t))
+                    for segment in self.segments if segment.start < inflection_t]
+        segments.extend(segment._replace(start=max(segment.start, inflection_t))
+                        for segment in other.segments if segment.end > inflection_t)
+        segments[0] = segments[0]._replace(start=-math.inf)
+        return PiecewiseFunction(segments)
+
 def translate_function(x_t, x_0):
     """
     Translates an x_t (or y_t) by x_0
     """
-    return lambda t: x_t(t) + x_0
+    return PiecewiseFunction.from_function(x_t).shift(0, x_0)
 
 def append_functions(x1_t, y1_t, slope1_t, r1_t,
                      x2_t, y2_t, slope2_t, r2_t,
@@ -22,43 +122,26 @@ def append_functions(x1_t, y1_t, slope1_t, r1_t,
 
     r_t must be combined as the "arclength" manner of generating it
     will have a very noticeable discontinuity at inflection_t otherwise
+
+    The results are PiecewiseFunctions
     """
     x_off = x1_t(inflection_t) - x2_t(0)
     y_off = y1_t(inflection_t) - y2_t(0)
-    def x_t(t):
-        if t < inflection_t:
-            return x1_t(t)
-        else:
-            return x2_t(t - inflection_t) + x_off
-
-    def y_t(t):
-        if t < inflection_t:
-            return y1_t(t)
-        else:
-            return y2_t(t - inflection_t) + y_off
 
     if isinstance(slope1_t, (int, float)):
-        s1_t = lambda x: slope1_t
-    else:
-        s1_t = slope1_t
+        slope1_t = (lambda slope: lambda x: slope)(slope1_t)
     if isinstance(slope2_t, (int, float)):
-        s2_t = lambda x: slope2_t
-    else:
-        s2_t = slope2_t
-        
-    def slope_t(t):
-        if t < inflection_t:
-            return s1_t(t)
-        else:
-            return s2_t(t - inflection_t)
+        slope2_t = (lambda slope: lambda x: slope)(slope2_t)
 
-    def r_t(t):
-        if t < inflection_t:
-            return r1_t(t)
-        else:
-            return r2_t(t - inflection_t)
-        
-    return x_t, y_t, slope_t, r_t
+    def combine(f1_t, f2_t, offset=None):
+        f1_t = PiecewiseFunction.from_function(f1_t)
+        f2_t = PiecewiseFunction.from_function(f2_t).shift(inflection_t, offset)
+        return f1_t.append(f2_t, inflection_t)
+
+    return (combine(x1_t, x2_t, x_off),
+            combine(y1_t, y2_t, y_off),
+            combine(slope1_t, slope2_t),
+            combine(r1_t, r2_t))
 
 def splice_functions(x1_t, y1_t, slope1_t, r1_t,
                      x2_t, y2_t, slope2_t, r2_t,
@@ -79,11 +162,15 @@ def splice_functions(x1_t, y1_t, slope1_t, r1_t,
                                               x2_t, y2_t, slope2_t, r2_t,
                                               start_splice)
 
+    # function 1 picks up again from end_splice: t -> f1_t(t + end_splice)
+    def resume(f1_t):
+        return PiecewiseFunction.from_function(f1_t).shift(-end_splice)
+
     x_f, y_f, slope_f, r_f = append_functions(x_s, y_s, slope_s, r_s,
-                                              lambda t: x1_t(t + end_splice),
-                                              lambda t: y1_t(t + end_splice),
-                                              lambda t: slope1_t(t + end_splice),
-                                              lambda t: r1_t(t + end_splice),
+                                              resume(x1_t),
+                                              resume(y1_t),
+                                              resume(slope1_t),
+                                              resume(r1_t),
                                               end_splice)
 
     return x_f, y_f, slope_f, r_f
@@ -111,11 +198,11 @@ def replace_kinks_with_circles(args, time_t, x_t, y_t, r_t, kink_args, num_time_
 
     Assumes kinks are less than 180 degrees.
     """
-    times = [time_t(t) for t in range(num_time_steps+1)]
+    time_grid = marble_util.TimeGrid.from_time_t(time_t, num_time_steps)
     kink_locations = kink_args.kink_replace_circle    
     for kink in kink_locations:
-        start_time = marble_util.get_time_step(times, kink[0])
-        end_time = marble_util.get_time_step(times, kink[1])
+        start_time = time_grid.time_step(kink[0])
+        end_time = time_grid.time_step(kink[1])
 
         if start_time == end_time:
             print("Kink from %.4f to %.4f represents no time steps" % (kink[0], kink[1]))
@@ -37,10 +37,16 @@ def build_time_t(start_t, end_t, num_time_steps, extension_args):
     return time_t
 
 
-def build_extension(base_f_t, t0):
+def extension_derivative(base_f_t, t0):
+    """
+    The slope of the straight line used to extend base_f_t at t0
+    """
     epsilon = 0.001
+    return (base_f_t(t0 + epsilon) - base_f_t(t0 - epsilon)) / (epsilon * 2)
+
+def build_extension(base_f_t, t0):
     f0 = base_f_t(t0)
-    derivative = (base_f_t(t0 + epsilon) - base_f_t(t0 - epsilon)) / (epsilon * 2)
+    derivative = extension_derivative(base_f_t, t0)
     print("Extenstion at %.4f.  Derivative %.4f f0 %.4f" % (t0, derivative, f0))
     def extension_t(t):
         return f0 + derivative * (t - t0)
@@ -63,6 +69,30 @@ def extend_f_t(time_t, base_f_t, start_t, end_t, extension_args):
 
     return f_t
 
+def extend_df_t(time_t, base_f_t, base_df_t, start_t, end_t, extension_args):
+    """
+    The derivative of extend_f_t with respect to the time step.
+
+    base_df_t is the derivative of base_f_t with respect to t.
+    time_t is assumed to be linear, as built by build_time_t.
+    """
+    begin_derivative = extension_derivative(base_f_t, start_t)
+    end_derivative = extension_derivative(base_f_t, end_t)
+    dt = time_t(1) - time_t(0)
+
+    extra_start_t, extra_end_t = get_extensions(extension_args)
+
+    def df_t(time_step):
+        t = time_t(time_step)
+        if extra_start_t and t < start_t:
+            return begin_derivative * dt
+        elif extra_end_t and t > end_t:
+            return end_derivative * dt
+        else:
+            return base_df_t(t) * dt
+
+    return df_t
+
 def add_extend_args(parser, default_extra_t=None):
     parser.add_argument('--extra_t', default=default_extra_t, type=float,
                         help='Extra time to build the model as a straight line before & after the domain')
@@ -1,6 +1,8 @@
 import argparse
 import math
+import sys
 import marble_path
+import mesh_cache
 
 from enum import Enum
 
@@ -186,7 +188,8 @@ def generate_astroid(args):
                             time_step=time_step + time_step_offset,
                             subdivisions_per_side=args.subdivisions_per_side)[1]
 
-    z_t = marble_path.arclength_height_function(x_t, y_t, num_time_steps, args.slope_angle)
+    z_t = marble_path.arclength_height_function(x_t, y_t, num_time_steps, args.slope_angle,
+                                                arclength_substeps=args.arclength_substeps)
 
     def r_t(time_step):
         return tube_angle(outer_radius=args.outer_radius,
@@ -197,10 +200,9 @@ def generate_astroid(args):
                           time_step=time_step + time_step_offset,
                           subdivisions_per_side=args.subdivisions_per_side)
 
-    for triangle in marble_path.generate_path(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
-                                              tube_args=args,
-                                              num_time_steps=num_time_steps):
-        yield triangle
+    return marble_path.generate_path(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
+                                     tube_args=args,
+                                     num_time_steps=num_time_steps)
 
 
 def closest_approach_to_radius(cusp_method, tube_radius, closest_approach, astroid_power):
@@ -222,7 +224,7 @@ def closest_approach_to_radius(cusp_method, tube_radius, closest_approach, astro
     return closest_approach * 2 ** ((astroid_power - 1) / 2)
      
 
-def parse_args():
+def parse_args(sys_args=None):
     parser = argparse.ArgumentParser(description='Arguments for an stl astroid.')
 
     marble_path.add_tube_arguments(parser, default_slope_angle=7.0, default_output_name='astroid.stl')
@@ -241,7 +243,7 @@ def parse_args():
     parser.add_argument('--cusp_method', default=Cusp.OFFSET, type=lambda x: Cusp[x.upper()],
                         help='How to handle the corners.  OFFSET = offset by tube width, CHOP = chop when the cusp is too close to the axis')
 
-    args = parser.parse_args()
+    args = parser.parse_args(args=sys_args)
 
     if args.closest_approach is not None:
         args.outer_radius = closest_approach_to_radius(args.cusp_method, args.tube_radius,
@@ -253,12 +255,12 @@ def parse_args():
     return args
 
 
-def main():
-    args = parse_args()
+def main(sys_args=None):
+    args = parse_args(sys_args)
     marble_path.print_args(args)
 
     #generate_astroid(args)
-    marble_path.write_stl(generate_astroid(args), args.output_name)
+    return mesh_cache.write_output(sys.modules[__name__], args, lambda: generate_astroid(args))
 
             
 if __name__ == '__main__':
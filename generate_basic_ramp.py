@@ -68,6 +68,8 @@ def parse_args(sys_args=None):
 
     marble_path.add_tube_arguments(parser, default_slope_angle=2.9, default_output_name='ramp.stl')
     combine_functions.add_post_args(parser, post_entrance=False)
+    marble_path.add_adaptive_args(parser)
+    build_shape.add_variant_args(parser)
 
     parser.add_argument('--num_time_steps', default=200, type=int,
                         help='Number of time steps in the whole ramp')
@@ -87,7 +89,7 @@ def parse_args(sys_args=None):
 
 def main(sys_args=None):
     module = sys.modules[__name__]
-    build_shape.main(module, sys_args)
+    return build_shape.main(module, sys_args)
 
 if __name__ == '__main__':
     main()
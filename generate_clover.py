@@ -124,6 +124,49 @@ def build_y_t(args):
         return scale * ((math.cos(t) ** 2) ** flower_power + (math.sin(t) ** 2) ** flower_power) ** pinch_power * math.sin(twist * (t + args.twist_wiggle * math.sin (8 * t)))
     return y_t
 
+def build_dx_dy_t(args):
+    """
+    Derivatives of x_t and y_t with respect to the time step.
+
+    (cos^2 t)^(A/2) has an infinite derivative where cos t is 0 when
+    A < 2, so in that case there are no derivatives.
+    """
+    flower_power = args.flower_power / 2
+    if flower_power < 1:
+        return None
+    pinch_power = args.pinch_power
+    scale = args.scale
+
+    time_t = build_time_t(args)
+    dt = time_t(1) - time_t(0)
+    twist = args.twist_numerator / args.twist_denominator
+
+    def radius_angle(t):
+        """
+        Returns the radius, its derivative, the twist angle, and its derivative at t
+        """
+        cos2 = math.cos(t) ** 2
+        sin2 = math.sin(t) ** 2
+        petals = cos2 ** flower_power + sin2 ** flower_power
+        # d/dt cos^2 t = -2 sin t cos t = -d/dt sin^2 t
+        dcos2 = -2 * math.sin(t) * math.cos(t)
+        dpetals = flower_power * dcos2 * (cos2 ** (flower_power - 1) - sin2 ** (flower_power - 1))
+        radius = scale * petals ** pinch_power
+        dradius = scale * pinch_power * petals ** (pinch_power - 1) * dpetals
+        angle = twist * (t + args.twist_wiggle * math.sin(8 * t))
+        dangle = twist * (1 + 8 * args.twist_wiggle * math.cos(8 * t))
+        return radius, dradius, angle, dangle
+
+    def dx_t(time_step):
+        radius, dradius, angle, dangle = radius_angle(time_t(time_step))
+        return (dradius * math.cos(angle) - radius * math.sin(angle) * dangle) * dt
+
+    def dy_t(time_step):
+        radius, dradius, angle, dangle = radius_angle(time_t(time_step))
+        return (dradius * math.sin(angle) + radius * math.cos(angle) * dangle) * dt
+
+    return dx_t, dy_t
+
 def describe_curve(args):
     print("Building flower")
     flower_power = marble_util.simplify_float_to_string(args.flower_power / 2)
@@ -151,6 +194,8 @@ def parse_args(sys_args=None):
 
     marble_path.add_tube_arguments(parser, default_slope_angle=6.0, default_output_name='clover.stl')
     combine_functions.add_zero_circle_args(parser)
+    marble_path.add_adaptive_args(parser)
+    build_shape.add_variant_args(parser)
 
     parser.add_argument('--flower_power', default=4, type=float,
                         help='Coefficient A of (cos^A theta + sin^A theta)^B')
@@ -185,7 +230,7 @@ def parse_args(sys_args=None):
 
 def main(sys_args=None):
     module = sys.modules[__name__]
-    build_shape.main(module, sys_args)
+    return build_shape.main(module, sys_args)
 
     
 if __name__ == '__main__':
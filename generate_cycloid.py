@@ -108,6 +108,41 @@ def build_base_y_t(args):
     return y_t
     
 
+def regularization_derivative(reg_amount, reg_power, t):
+    """
+    Derivative of (1 - r) + r e^(p t^2) / (1 + e^(p t^2)), the regularization used in x_t and y_t
+    """
+    sigmoid = math.exp(reg_power * t ** 2) / (1.0 + math.exp(reg_power * t ** 2))
+    return reg_amount * sigmoid * (1.0 - sigmoid) * 2 * reg_power * t
+
+def build_base_dx_t(args):
+    scale = args.scale
+
+    def dx_t(t):
+        reg = (1.0 - args.reg_x) + args.reg_x * math.exp(args.reg_power * t ** 2) / (1.0 + math.exp(args.reg_power * t ** 2))
+        dreg = regularization_derivative(args.reg_x, args.reg_power, t)
+        return (1 + dreg * args.x_coeff * math.sin(args.x_t_coeff * t) +
+                reg * args.x_coeff * args.x_t_coeff * math.cos(args.x_t_coeff * t)) * scale
+
+    return dx_t
+
+def build_base_dy_t(args):
+    scale = args.scale
+    use_sign = args.use_sign
+
+    def dy_t(t):
+        if t < 0 and use_sign:
+            sign = -1
+        else:
+            sign = 1
+        reg = (1.0 - args.reg_y) + args.reg_y * math.exp(args.reg_power * t ** 2) / (1.0 + math.exp(args.reg_power * t ** 2))
+        dreg = regularization_derivative(args.reg_y, args.reg_power, t)
+        y = args.y0 + args.y_coeff * math.cos(args.y_t_coeff * t + args.y_phase)
+        dy = -args.y_coeff * args.y_t_coeff * math.sin(args.y_t_coeff * t + args.y_phase)
+        return sign * (dy * reg + y * dreg) * scale * args.y_scale
+
+    return dy_t
+
 def build_time_t(args):
     return extend_function.build_time_t(args.min_domain, args.max_domain, args.num_time_steps, args)
 
@@ -125,6 +160,19 @@ def build_y_t(args):
                                       args.min_domain, args.max_domain,
                                       args)
 
+def build_dx_dy_t(args):
+    """
+    Derivatives of x_t and y_t with respect to the time step
+    """
+    time_t = build_time_t(args)
+    dx_t = extend_function.extend_df_t(time_t, build_base_x_t(args), build_base_dx_t(args),
+                                       args.min_domain, args.max_domain,
+                                       args)
+    dy_t = extend_function.extend_df_t(time_t, build_base_y_t(args), build_base_dy_t(args),
+                                       args.min_domain, args.max_domain,
+                                       args)
+    return dx_t, dy_t
+
 def describe_curve(args):
     print("Building cycloid")
     print("  x(t) = t + %.4f sin(%.4f t)" % (args.x_coeff, args.x_t_coeff))
@@ -138,6 +186,8 @@ def parse_args(sys_args=None):
     slope_function.add_overlap_args(parser)
     combine_functions.add_kink_circle_args(parser)
     extend_function.add_extend_args(parser, default_extra_t=0.1)
+    marble_path.add_adaptive_args(parser)
+    build_shape.add_variant_args(parser)
 
     # Start & end times for the curve
     parser.add_argument('--domain', default=None, type=float,
@@ -207,7 +257,7 @@ def parse_args(sys_args=None):
 
 def main(sys_args=None):
     module = sys.modules[__name__]
-    build_shape.main(module, sys_args)
+    return build_shape.main(module, sys_args)
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,8 @@
 import argparse
 import math
+import sys
 import marble_path
+import mesh_cache
 
 def calculate_slope_angle(helix_radius, vertical_displacement):
     """
@@ -96,10 +98,9 @@ def generate_helix(args):
         # negative sign in slope is on account of the decision that positive slope means down
         return args.tube_radius - math.sin(args.slope_angle / 180 * math.pi) * 2 * math.pi * args.helix_radius * helix_subdivision / args.helix_sides
 
-    for triangle in marble_path.generate_path(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
-                                              tube_args=args,
-                                              num_time_steps=num_helix_subdivisions):
-        yield triangle
+    return marble_path.generate_path(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
+                                     tube_args=args,
+                                     num_time_steps=num_helix_subdivisions)
 
     
 def parse_args(sys_args=None):
@@ -144,7 +145,7 @@ def main(sys_args=None):
     args = parse_args(sys_args)
     marble_path.print_args(args)
 
-    marble_path.write_stl(generate_helix(args), args.output_name)
+    return mesh_cache.write_output(sys.modules[__name__], args, lambda: generate_helix(args))
 
             
 if __name__ == '__main__':
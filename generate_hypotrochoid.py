@@ -1,11 +1,13 @@
 import argparse
 import math
+import sys
 
 from enum import Enum
 
 import build_shape
 import combine_functions
 import marble_path
+import profiler
 import regularization
 import slope_function
 
@@ -222,16 +224,11 @@ def build_time_t(args):
         return args.start_t + time_step * (args.end_t - args.start_t) / args.num_time_steps
     return time_t
 
-def build_reg_f_t(args):
+def build_base_f_t(args):
     """
     Using the given args, builds a pair of functions for x & y
 
     x, y will take time steps and convert them to the correct span before calculating.
-
-    The functions apply regularization to the x & y values.
-
-    Not scaled yet, though.  This is refactored so that the method
-    which calculates the scaling can do so
     """
     time_t = build_time_t(args)
 
@@ -258,6 +255,21 @@ def build_reg_f_t(args):
     else:
         raise ValueError("Unhandled trochoid type: " + args.trochoid)
 
+    return x_t, y_t
+
+def build_reg_f_t(args):
+    """
+    Using the given args, builds a pair of functions for x & y
+
+    x, y will take time steps and convert them to the correct span before calculating.
+
+    The functions apply regularization to the x & y values.
+
+    Not scaled yet, though.  This is refactored so that the method
+    which calculates the scaling can do so
+    """
+    x_t, y_t = build_base_f_t(args)
+
     regularization.describe_regularization(args)
     reg_x_t, reg_y_t = regularization.regularize(x_t, y_t, args)
 
@@ -275,6 +287,48 @@ def build_f_t(args):
     return scale_x_t, scale_y_t
 
 
+def build_df_t(args):
+    """
+    Derivatives of the functions from build_f_t with respect to the time step
+    """
+    x_t, y_t = build_base_f_t(args)
+
+    time_t = build_time_t(args)
+    dt = time_t(1) - time_t(0)
+
+    A = args.hypoA
+    B = args.hypoB
+    C = args.hypoC
+
+    if args.trochoid == Trochoid.HYPOTROCHOID:
+        def dx_t(time_step):
+            t = time_t(time_step)
+            return (-(A - B) * math.sin(t) - C * ((A - B) / B) * math.sin((A - B) * t / B)) * dt
+
+        def dy_t(time_step):
+            t = time_t(time_step)
+            return ((A - B) * math.cos(t) - C * ((A - B) / B) * math.cos((A - B) * t / B)) * dt
+    elif args.trochoid == Trochoid.EPITROCHOID:
+        def dx_t(time_step):
+            t = time_t(time_step)
+            return (-(A + B) * math.sin(t) + C * ((A + B) / B) * math.sin((A + B) * t / B)) * dt
+
+        def dy_t(time_step):
+            t = time_t(time_step)
+            return ((A + B) * math.cos(t) - C * ((A + B) / B) * math.cos((A + B) * t / B)) * dt
+    else:
+        raise ValueError("Unhandled trochoid type: " + args.trochoid)
+
+    reg_dx_t, reg_dy_t = regularization.regularize_derivatives(x_t, y_t, dx_t, dy_t, args)
+
+    def scale_dx_t(time_step):
+        return reg_dx_t(time_step) * args.x_scale
+
+    def scale_dy_t(time_step):
+        return reg_dy_t(time_step) * args.y_scale
+
+    return scale_dx_t, scale_dy_t
+
 def rebalance_time(time_t, x_t, y_t, num_time_steps):
     lengths = [((x_t(i) - x_t(i+1)) ** 2 +
                 (y_t(i) - y_t(i+1)) ** 2) ** 0.5
@@ -356,56 +410,77 @@ def describe_curve(args):
     else:
         raise ValueError("Unhandled trochoid type: " + args.trochoid)
 
-def generate_hypotrochoid(args):
+def hypotrochoid_centerline(args):
     describe_curve(args)
     x_t, y_t = build_f_t(args)
+    x_t = profiler.counted('x_t', x_t)
+    y_t = profiler.counted('y_t', y_t)
 
     num_time_steps = args.num_time_steps
     time_t = build_time_t(args)
     if args.rebalance_time:
-        time_t, x_t, y_t = rebalance_time(time_t, x_t, y_t, num_time_steps)
-
-    slope_angle_t = slope_function.slope_function(x_t=x_t,
-                                                  y_t=y_t,
-                                                  time_t=time_t,
-                                                  slope_angle=args.slope_angle,
-                                                  num_time_steps=num_time_steps,
-                                                  overlap_args=args,
-                                                  kink_args=None)
-
-    r_t = marble_path.numerical_rotation_function(x_t, y_t)
+        # the rebalanced functions have no closed form derivative
+        with profiler.stage("rebalance_time"):
+            time_t, x_t, y_t = rebalance_time(time_t, x_t, y_t, num_time_steps)
+        dx_t, dy_t = None, None
+    else:
+        dx_t, dy_t = build_df_t(args)
+
+    path_samples = marble_path.PathSamples(x_t, y_t, num_time_steps, args.arclength_substeps,
+                                           dx_t=dx_t, dy_t=dy_t)
+    with profiler.stage("slope_function"):
+        slope_angle_t = slope_function.slope_function(x_t=x_t,
+                                                      y_t=y_t,
+                                                      time_t=time_t,
+                                                      slope_angle=args.slope_angle,
+                                                      num_time_steps=num_time_steps,
+                                                      overlap_args=args,
+                                                      kink_args=None,
+                                                      arclength_substeps=args.arclength_substeps,
+                                                      path_samples=path_samples)
+
+    if dx_t is not None:
+        r_t = marble_path.derivative_rotation_function(dx_t, dy_t)
+    else:
+        r_t = marble_path.numerical_rotation_function(x_t, y_t)
+    r_t = profiler.counted('r_t', r_t)
     #for i in range(num_time_steps+1):
     #    print('i, x, y, r: %d %.4f %.4f %.4f' % (i, x_t(i), y_t(i), r_t(i)))
 
     if args.zero_circle:
-        updated_functions = combine_functions.add_both_zero_circles(args=args,
-                                                                    num_time_steps=num_time_steps,
-                                                                    x_t=x_t,
-                                                                    y_t=y_t,
-                                                                    slope_angle_t=slope_angle_t,
-                                                                    r_t=r_t)
+        with profiler.stage("add_both_zero_circles"):
+            updated_functions = combine_functions.add_both_zero_circles(args=args,
+                                                                        num_time_steps=num_time_steps,
+                                                                        x_t=x_t,
+                                                                        y_t=y_t,
+                                                                        slope_angle_t=slope_angle_t,
+                                                                        r_t=r_t)
         num_time_steps, x_t, y_t, slope_angle_t, r_t = updated_functions
 
-    z_t = marble_path.arclength_height_function(x_t, y_t, num_time_steps,
-                                                slope_angle_t=slope_angle_t)
+    with profiler.stage("arclength_height_function"):
+        z_t = marble_path.arclength_height_function(x_t, y_t, num_time_steps,
+                                                    slope_angle_t=slope_angle_t,
+                                                    arclength_substeps=args.arclength_substeps,
+                                                    path_samples=path_samples)
+    z_t = profiler.counted('z_t', z_t)
 
-    build_shape.print_stats(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t, num_time_steps=num_time_steps)
+    with profiler.stage("print_stats"):
+        build_shape.print_stats(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t, num_time_steps=num_time_steps)
 
     print("Z goes from %.4f to %.4f" % (z_t(0), z_t(num_time_steps)))
-    
-    # can calculate dx & dy like this
-    # but when adding regularization, that becomes hideous
-    #t = time_t(time_step)
-    #dx = -(A - B) * math.sin(t) - C * ((A - B) / B) * math.sin((A - B) * t / B)
-    #dx = dx * args.x_scale
-    #dy =  (A - B) * math.cos(t) - C * ((A - B) / B) * math.cos((A - B) * t / B)
-    #dy = dy * args.y_scale
 
-    for triangle in marble_path.generate_path(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
-                                              tube_args=args,
-                                              num_time_steps=num_time_steps,
-                                              slope_angle_t=slope_angle_t):
-        yield triangle
+    centerline = marble_path.Centerline(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
+                                        num_time_steps=num_time_steps,
+                                        time_t=None,
+                                        slope_angle_t=slope_angle_t)
+    if args.adaptive_tolerance > 0:
+        with profiler.stage("adaptive_centerline"):
+            centerline = marble_path.adaptive_centerline(centerline, args.tube_radius, args.slope_angle,
+                                                         args.adaptive_tolerance)
+    return centerline
+
+def generate_hypotrochoid(args):
+    return marble_path.sweep_centerline(hypotrochoid_centerline(args), args)
 
 
 def tune_closest_approach(args):
@@ -439,6 +514,8 @@ def parse_args(sys_args=None):
     slope_function.add_overlap_args(parser)
     combine_functions.add_zero_circle_args(parser)
     regularization.add_regularization_args(parser)
+    marble_path.add_adaptive_args(parser)
+    build_shape.add_variant_args(parser)
 
     parser.add_argument('--hypoA', default=9, type=int,
                         help='value A in the hypo formula')
@@ -495,7 +572,7 @@ def main(sys_args=None):
     args = parse_args(sys_args)
     marble_path.print_args(args)    
 
-    marble_path.write_stl(generate_hypotrochoid(args), args.output_name)
+    return build_shape.write_variants(sys.modules[__name__], args, lambda: hypotrochoid_centerline(args))
 
 if __name__ == '__main__':
     main()
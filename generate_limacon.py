@@ -1,6 +1,8 @@
 import argparse
 import math
+import sys
 import marble_path
+import mesh_cache
 
 """
 Produces the bottom part of a limacon curve, specifically, the loop.
@@ -83,7 +85,23 @@ def generate_limacon(args):
     def scaled_y_t(time_step):
         return (y_t(time_step) - min_y) * y_scale
 
-    z_t = marble_path.arclength_height_function(scaled_x_t, scaled_y_t, args.time_steps, args.slope_angle)
+    def scaled_dx_t(time_step):
+        theta = theta_t(time_step)
+        r = args.constant_factor - args.cosine_factor * math.cos(theta)
+        dr = args.cosine_factor * math.sin(theta)
+        return (-math.sin(theta) * r + math.cos(theta) * dr) * x_scale * time_step_width
+
+    def scaled_dy_t(time_step):
+        theta = theta_t(time_step)
+        r = args.constant_factor - args.cosine_factor * math.cos(theta)
+        dr = args.cosine_factor * math.sin(theta)
+        return (math.cos(theta) * r + math.sin(theta) * dr) * y_scale * time_step_width
+
+    path_samples = marble_path.PathSamples(scaled_x_t, scaled_y_t, args.time_steps, args.arclength_substeps,
+                                           dx_t=scaled_dx_t, dy_t=scaled_dy_t)
+    z_t = marble_path.arclength_height_function(scaled_x_t, scaled_y_t, args.time_steps, args.slope_angle,
+                                                arclength_substeps=args.arclength_substeps,
+                                                path_samples=path_samples)
 
     def r_t(time_step):
         theta = theta_t(time_step)
@@ -92,10 +110,9 @@ def generate_limacon(args):
     print("Center of tube at time step 0: ", scaled_x_t(0), scaled_y_t(0))
     print("Angle of tube: ", r_t(0))
 
-    for triangle in marble_path.generate_path(x_t=scaled_x_t, y_t=scaled_y_t, z_t=z_t, r_t=r_t,
-                                              tube_args=args,
-                                              num_time_steps=args.time_steps):
-        yield triangle    
+    return marble_path.generate_path(x_t=scaled_x_t, y_t=scaled_y_t, z_t=z_t, r_t=r_t,
+                                     tube_args=args,
+                                     num_time_steps=args.time_steps)
 
 
 def balance_domain(constant_factor, cosine_factor):
@@ -188,7 +205,7 @@ def main(sys_args=None):
     args = parse_args(sys_args)
     marble_path.print_args(args)
 
-    marble_path.write_stl(generate_limacon(args), args.output_name)
+    return mesh_cache.write_output(sys.modules[__name__], args, lambda: generate_limacon(args))
             
 if __name__ == '__main__':
     main()
@@ -166,6 +166,35 @@ def build_base_y_t(args):
 
     return y_t
 
+def build_base_dx_t(args):
+    a = (args.lissA / args.lissC) * 2 * math.pi
+    def dx_t(t):
+        return a * math.cos(a * t + args.lissB * math.pi)
+
+    return dx_t
+
+def build_base_dy_t(args):
+    two_pi = 2 * math.pi
+    n = args.lissN * two_pi
+    if args.lissajous is Lissajous.BASIC:
+        def dy_t(t):
+            return two_pi * math.cos(two_pi * t)
+    elif args.lissajous is Lissajous.SUM_HARMONICS:
+        def dy_t(t):
+            return 0.5 * (two_pi * math.cos(two_pi * t) + n * math.cos(n * t + args.lissD * math.pi))
+    elif args.lissajous is Lissajous.PRODUCT_HARMONICS:
+        def dy_t(t):
+            return (two_pi * math.cos(two_pi * t) * math.sin(n * t + args.lissD * math.pi) +
+                    math.sin(two_pi * t) * n * math.cos(n * t + args.lissD * math.pi))
+    elif args.lissajous is Lissajous.COMPOUND_HARMONICS:
+        def dy_t(t):
+            inner = args.lissN * math.pi * math.sin(two_pi * t) + args.lissD * math.pi
+            return math.cos(inner) * args.lissN * math.pi * two_pi * math.cos(two_pi * t)
+    else:
+        raise ValueError("Unknown lissajous type %s" % args.lissajous.name)
+
+    return dy_t
+
 def build_time_t(args):
     return extend_function.build_time_t(args.start_t, args.end_t, args.num_time_steps, args)
 
@@ -194,6 +223,38 @@ def build_x_y_t(args):
     
     return scale_x_t, scale_y_t
     
+def build_dx_dy_t(args):
+    """
+    Derivatives of the functions from build_x_y_t with respect to the time step
+    """
+    time_t = build_time_t(args)
+    base_x_t = build_base_x_t(args)
+    base_y_t = build_base_y_t(args)
+    x_t = extend_function.extend_f_t(time_t, base_x_t,
+                                     args.start_t, args.end_t,
+                                     extension_args=args)
+    y_t = extend_function.extend_f_t(time_t, base_y_t,
+                                     args.start_t, args.end_t,
+                                     extension_args=args)
+    dx_t = extend_function.extend_df_t(time_t, base_x_t, build_base_dx_t(args),
+                                       args.start_t, args.end_t,
+                                       extension_args=args)
+    dy_t = extend_function.extend_df_t(time_t, base_y_t, build_base_dy_t(args),
+                                       args.start_t, args.end_t,
+                                       extension_args=args)
+
+    reg_dx_t, reg_dy_t = regularization.regularize_derivatives(x_t, y_t, dx_t, dy_t, args)
+
+    x_scale = args.x_scale
+    def scale_dx_t(t):
+        return reg_dx_t(t) * x_scale
+
+    y_scale = args.y_scale
+    def scale_dy_t(t):
+        return reg_dy_t(t) * y_scale
+
+    return scale_dx_t, scale_dy_t
+
 def describe_curve(args):
     if args.lissajous is Lissajous.BASIC:
         print("Building basic lissajous curve")
@@ -228,6 +289,8 @@ def parse_args(sys_args=None):
     combine_functions.add_kink_circle_args(parser)
     extend_function.add_extend_args(parser)
     regularization.add_regularization_args(parser)
+    marble_path.add_adaptive_args(parser)
+    build_shape.add_variant_args(parser)
 
     parser.add_argument('--lissA', default=5, type=int,
                         help='value A in the lissajous formula')
@@ -271,7 +334,7 @@ def parse_args(sys_args=None):
 
 def main(sys_args=None):
     module = sys.modules[__name__]
-    build_shape.main(module, sys_args)
+    return build_shape.main(module, sys_args)
 
 if __name__ == '__main__':
     main()
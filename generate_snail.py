@@ -111,6 +111,8 @@ def parse_args(sys_args=None):
     marble_path.add_tube_arguments(parser, default_slope_angle=2.5, default_output_name='snail.stl')
     combine_functions.add_post_args(parser)
     slope_function.add_overlap_args(parser)
+    marble_path.add_adaptive_args(parser)
+    build_shape.add_variant_args(parser)
 
     parser.add_argument('--num_time_steps', default=360, type=int,
                         help='Number of time steps in the whole ramp')
@@ -125,7 +127,7 @@ def parse_args(sys_args=None):
 
 def main(sys_args=None):
     module = sys.modules[__name__]
-    build_shape.main(module, sys_args)
+    return build_shape.main(module, sys_args)
 
 if __name__ == '__main__':
     main()
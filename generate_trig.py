@@ -1,8 +1,10 @@
 import argparse
 import math
+import sys
 
 import combine_functions
 import marble_path
+import mesh_cache
 import slope_function
 
 """
@@ -53,6 +55,27 @@ Issue with this formulation: the pleasing sharpness of the corners is a lot less
 
 """
 
+def build_dx_dy_t(args, time_t):
+    """
+    Derivatives of x_t and y_t with respect to the time step.
+
+    sin^(k-1) t divides by zero where sin t is 0 when k < 1, so in
+    that case there are no derivatives.
+    """
+    if args.power < 1:
+        return None
+
+    dt = time_t(1) - time_t(0)
+    def dx_t(time_step):
+        t = time_t(time_step)
+        return args.scale * (1 + args.power * math.sin(t) ** (args.power - 1) * math.cos(t)) * dt
+
+    def dy_t(time_step):
+        t = time_t(time_step)
+        return args.scale * args.y_coeff * math.cos(t) * dt
+
+    return dx_t, dy_t
+
 def generate_trig(args):
     max_t = args.end_t
     min_t = args.start_t
@@ -68,7 +91,13 @@ def generate_trig(args):
         t = time_t(time_step)
         return args.scale * args.y_coeff * math.sin(t)
 
-    r_t = marble_path.numerical_rotation_function(x_t, y_t)
+    derivatives = build_dx_dy_t(args, time_t)
+    if derivatives is not None:
+        dx_t, dy_t = derivatives
+        r_t = marble_path.derivative_rotation_function(dx_t, dy_t)
+    else:
+        dx_t, dy_t = None, None
+        r_t = marble_path.numerical_rotation_function(x_t, y_t)
 
     if args.kink_replace_circle:
         x_t, y_t, r_t = combine_functions.replace_kinks_with_circles(args=args,
@@ -78,28 +107,35 @@ def generate_trig(args):
                                                                      r_t=r_t,
                                                                      kink_args=args,
                                                                      num_time_steps=args.num_time_steps)
+        # the circles replace part of the curve, so the derivatives no longer apply
+        dx_t, dy_t = None, None
 
+    path_samples = marble_path.PathSamples(x_t, y_t, args.num_time_steps, args.arclength_substeps,
+                                           dx_t=dx_t, dy_t=dy_t)
     slope_angle_t = slope_function.slope_function(x_t=x_t,
                                                   y_t=y_t,
                                                   time_t=time_t,
                                                   slope_angle=args.slope_angle,
                                                   num_time_steps=args.num_time_steps,
                                                   overlap_args=None,
-                                                  kink_args=args)
+                                                  kink_args=args,
+                                                  arclength_substeps=args.arclength_substeps,
+                                                  path_samples=path_samples)
         
     z_t = marble_path.arclength_height_function(x_t, y_t, args.num_time_steps,
-                                                slope_angle_t=slope_angle_t)
+                                                slope_angle_t=slope_angle_t,
+                                                arclength_substeps=args.arclength_substeps,
+                                                path_samples=path_samples)
 
     print("Start x, y, z: %.4f %.4f %.4f" % (x_t(0), y_t(0), z_t(0)))
     print("End x, y, z:   %.4f %.4f %.4f" % (x_t(args.num_time_steps), y_t(args.num_time_steps), z_t(args.num_time_steps)))
     
     
-    for triangle in marble_path.generate_path(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
-                                              tube_args=args,
-                                              num_time_steps=args.num_time_steps,
-                                              time_t=time_t,
-                                              slope_angle_t=slope_angle_t):
-        yield triangle    
+    return marble_path.generate_path(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
+                                     tube_args=args,
+                                     num_time_steps=args.num_time_steps,
+                                     time_t=time_t,
+                                     slope_angle_t=slope_angle_t)
     
 
 def parse_args(sys_args=None):
@@ -147,7 +183,7 @@ def main(sys_args=None):
     args = parse_args(sys_args)
     marble_path.print_args(args)
 
-    marble_path.write_stl(generate_trig(args), args.output_name)
+    return mesh_cache.write_output(sys.modules[__name__], args, lambda: generate_trig(args))
             
 if __name__ == '__main__':
     main()
@@ -37,6 +37,8 @@ def parse_args(sys_args=None):
     marble_path.add_tube_arguments(parser,
                                    default_slope_angle=2.9,
                                    default_output_name='tube.stl')
+    marble_path.add_adaptive_args(parser)
+    build_shape.add_variant_args(parser)
     
     parser.add_argument('--length', default=50, type=float,
                         help='Length of the tube')
@@ -50,7 +52,7 @@ def parse_args(sys_args=None):
 
 def main(sys_args=None):
     module = sys.modules[__name__]
-    build_shape.main(module, sys_args)
+    return build_shape.main(module, sys_args)
 
 if __name__ == '__main__':
     main()
@@ -112,6 +112,8 @@ def parse_args(sys_args=None):
     parser = argparse.ArgumentParser(description='Arguments for a two post loop')
 
     marble_path.add_tube_arguments(parser, default_slope_angle=7, default_output_name='loops.stl')
+    marble_path.add_adaptive_args(parser)
+    build_shape.add_variant_args(parser)
 
     parser.add_argument('--num_time_steps', default=280, type=int,
                         help='Number of time steps in the whole ramp')
@@ -145,7 +147,7 @@ def parse_args(sys_args=None):
 
 def main(sys_args=None):
     module = sys.modules[__name__]
-    build_shape.main(module, sys_args)
+    return build_shape.main(module, sys_args)
 
 if __name__ == '__main__':
     main()
@@ -1,7 +1,9 @@
 import argparse
 import math
+import sys
 import build_shape
 import marble_path
+import profiler
 
 """
 The defaults for this script produce the middle portion of a zigzag.
@@ -24,7 +26,7 @@ python generate_zigzag.py
 python generate_zigzag.py --output_name zigzig.hole.stl --tube_method ellipse --tube_end_angle 360 --wall_thickness 11.5 --tube_radius 11.13
 """
 
-def generate_zigzag(args):
+def zigzag_centerline(args):
     num_time_steps = args.subdivisions_per_zigzag * args.num_zigzags
     y_delta = args.zigzag_length / args.subdivisions_per_zigzag * 2
 
@@ -39,7 +41,8 @@ def generate_zigzag(args):
             return args.zigzag_length - (time_step - args.subdivisions_per_zigzag / 2) * y_delta
         
     # overkill - we could easily calculate it ourselves
-    z_t = marble_path.arclength_height_function(x_t, y_t, num_time_steps, args.slope_angle)
+    z_t = marble_path.arclength_height_function(x_t, y_t, num_time_steps, args.slope_angle,
+                                                arclength_substeps=args.arclength_substeps)
 
     def r_t(time_step):
         # west to east is represented by -90, since south to north is 0
@@ -49,15 +52,25 @@ def generate_zigzag(args):
     tangent = math.atan(args.zigzag_length / (args.zigzag_width / 2))
     print("Rotation of the zigzag: %.4f / %.4f degrees" % (tangent, tangent * 180 / math.pi))
 
-    for triangle in marble_path.generate_path(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
-                                              tube_args=args,
-                                              num_time_steps=num_time_steps):
-        yield triangle    
+    centerline = marble_path.Centerline(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
+                                        num_time_steps=num_time_steps,
+                                        time_t=None,
+                                        slope_angle_t=None)
+    if args.adaptive_tolerance > 0:
+        with profiler.stage("adaptive_centerline"):
+            centerline = marble_path.adaptive_centerline(centerline, args.tube_radius, args.slope_angle,
+                                                         args.adaptive_tolerance)
+    return centerline
+
+def generate_zigzag(args):
+    return marble_path.sweep_centerline(zigzag_centerline(args), args)
     
 def parse_args(sys_args=None):
     parser = argparse.ArgumentParser(description='Arguments for an stl zigzag.')
 
     marble_path.add_tube_arguments(parser, default_slope_angle=5.0, default_output_name='zigzag.stl')
+    marble_path.add_adaptive_args(parser)
+    build_shape.add_variant_args(parser)
 
     parser.add_argument('--zigzag_length', default=-5, type=float,
                         help='How far a zigzag goes in the y direction.  Negative means go down first')
@@ -85,7 +98,7 @@ def main(sys_args=None):
     args = parse_args(sys_args)
     marble_path.print_args(args)
 
-    marble_path.write_stl(generate_zigzag(args), args.output_name)
+    return build_shape.write_variants(sys.modules[__name__], args, lambda: zigzag_centerline(args))
             
 if __name__ == '__main__':
     main()
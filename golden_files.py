@@ -0,0 +1,134 @@
+"""
+Checks the generators against the gold files in test_files.
+
+Each gold file has a sha256 digest in test_files/digests.json.  The
+configurations are spread across a pool of processes.  Each worker
+builds its model, hashes the output as it reads it back, and compares
+the hash with the stored digest.  Only a mismatch reads the gold file,
+to show a diff of where the output went wrong.
+
+With an epsilon, a mismatch is compared geometrically by
+mesh_compare, so that an output which only differs by rounding still
+passes.
+
+regenerate_test_files.py updates the digests along with the gold files.
+"""
+
+import concurrent.futures
+import contextlib
+import difflib
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import os
+import tempfile
+
+import mesh_compare
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+DIGEST_FILE = os.path.join(TEST_DIR, "test_files", "digests.json")
+
+# how much of a file to hash at once
+HASH_CHUNK_SIZE = 1024 * 1024
+# how many lines of the diff to show for a mismatch
+MAX_DIFF_LINES = 40
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as fin:
+        while True:
+            chunk = fin.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_digests():
+    if not os.path.exists(DIGEST_FILE):
+        return {}
+    with open(DIGEST_FILE) as fin:
+        return json.load(fin)
+
+def update_digests(gold_files):
+    """
+    Recalculates the digests of these gold files and saves them with the others
+    """
+    digests = load_digests()
+    for gold_file in gold_files:
+        digests[gold_file] = file_digest(os.path.join(TEST_DIR, gold_file))
+    with open(DIGEST_FILE, "w") as fout:
+        json.dump(digests, fout, indent=2, sort_keys=True)
+        fout.write("\n")
+
+def diff_files(gold_file, filename):
+    """
+    The first MAX_DIFF_LINES lines of a unified diff between the gold file and the output
+    """
+    with open(gold_file, errors="replace") as fin:
+        expected = fin.readlines()
+    with open(filename, errors="replace") as fin:
+        result = fin.readlines()
+    diff = difflib.unified_diff(expected, result, fromfile=gold_file, tofile="output", n=1)
+    return "".join(itertools.islice(diff, MAX_DIFF_LINES))
+
+def check_generation(name, model_name, args, gold_file, digest, epsilon=None):
+    """
+    Builds one gold configuration and compares it with the digest of its gold file.
+
+    If epsilon is set, an output which does not match the digest is
+    compared with the gold file by mesh_compare instead, and passes if
+    every vertex is within epsilon.  The output can then be binary or
+    another format.
+
+    Returns None if it matches, otherwise a description of the mismatch
+    """
+    module = importlib.import_module(model_name)
+    handle, filename = tempfile.mkstemp(suffix=".stl")
+    os.close(handle)
+    output = filename
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            output = module.main(sys_args=['--output_name', filename, '--no_cache'] + args) or filename
+        if digest is not None and file_digest(output) == digest:
+            return None
+        gold_path = os.path.join(TEST_DIR, gold_file)
+        if epsilon is not None:
+            try:
+                difference = mesh_compare.compare_files(gold_path, output, epsilon)
+            except ValueError as e:
+                return "%s does not match %s: %s" % (name, gold_file, e)
+            if difference.num_over_epsilon == 0:
+                return None
+            return "%s does not match %s: %s" % (name, gold_file, mesh_compare.describe_difference(difference))
+        if digest is None:
+            error = "%s has no digest in %s" % (gold_file, DIGEST_FILE)
+        else:
+            error = "%s does not match the digest of %s" % (name, gold_file)
+        if file_digest(gold_path) != digest:
+            error = error + ".  The digest of %s is out of date" % gold_file
+        return error + "\n" + diff_files(gold_path, output)
+    finally:
+        for leftover in set([filename, output]):
+            if os.path.exists(leftover):
+                os.unlink(leftover)
+
+def run_generations(tests, extra_args=(), jobs=None, epsilon=None):
+    """
+    Checks each of the tests, which are test_generations.TGen, across
+    jobs processes.  Returns a list of (name, error) in the same order,
+    where error is None for a match.
+
+    epsilon is passed to check_generation
+    """
+    digests = load_digests()
+    jobs = jobs or os.cpu_count()
+    work = [(test.name, test.model.__name__, list(test.args) + list(extra_args),
+             test.gold_file, digests.get(test.gold_file), epsilon)
+            for test in tests]
+    if jobs <= 1:
+        return [(item[0], check_generation(*item)) for item in work]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(check_generation, *item) for item in work]
+        return [(item[0], future.result()) for item, future in zip(work, futures)]
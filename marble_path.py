@@ -1,8 +1,19 @@
+import array
+import bisect
+import concurrent.futures
+import functools
 import math
+import os
+import shutil
+import tempfile
 
+from collections import namedtuple
 from enum import Enum
 
+import numpy as np
+
 import marble_util
+import profiler
 
 class Tube(Enum):
     ELLIPSE = 1
@@ -11,6 +22,157 @@ class Tube(Enum):
     DEEP_OVAL = 4
     TRIANGLE_TOP = 5
     
+class MeshEngine(Enum):
+    # one python call chain per vertex
+    SCALAR = 1
+    # the whole time_step x tube_subdivision x inside grid as numpy arrays
+    NUMPY = 2
+
+class StlFormat(Enum):
+    ASCII = 1
+    BINARY = 2
+
+class OutputFormat(Enum):
+    # triangles with the vertices repeated in each facet
+    STL = 1
+    # indexed vertices and faces
+    OBJ = 2
+    PLY = 3
+
+# one facet in an ascii stl file.  facet normal of 0 0 0 is often
+# used as a convention - processing program can figure it out
+ASCII_STL_FACET = ("facet normal 0 0 0\n"
+                   " outer loop\n" +
+                   "  vertex %.4f %.4f %.4f\n" * 3 +
+                   " endloop\n"
+                   "endfacet\n")
+ASCII_STL_CHUNK_SIZE = 10000
+
+# how many distinct tube cross sections to remember
+TUBE_PROFILE_CACHE_SIZE = 4096
+
+# how many straight segments to use per time step when integrating arclength
+ARCLENGTH_SUBSTEPS = 1000
+# how many points per time step to use when integrating arclength from derivatives
+ARCLENGTH_GAUSS_NODES = 8
+# relative disagreement at which a time step is measured with straight segments instead
+ARCLENGTH_GAUSS_TOLERANCE = 1e-9
+
+# layout of one vertex and one triangle in a binary ply file
+PLY_VERTEX = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4')])
+PLY_FACE = np.dtype([('count', 'u1'), ('vertex_indices', '<i4', (3,))])
+
+# layout of one facet in a binary stl file: the normal, three
+# vertices, and an attribute byte count which is always 0
+BINARY_STL_FACET = np.dtype([('normal', '<f4', (3,)),
+                             ('vertices', '<f4', (3, 3)),
+                             ('attribute', '<u2')])
+
+
+class Mesh:
+    """
+    A triangle mesh stored as arrays.
+
+    vertices is an (N, 3) float64 array of x, y, z
+    faces is an (M, 3) int32 array of indices into vertices, clockwise
+    """
+    def __init__(self, vertices, faces):
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        self.faces = np.asarray(faces, dtype=np.int32).reshape(-1, 3)
+
+    @staticmethod
+    def from_triangles(triangles):
+        """
+        Build a Mesh from an iterable of triangles, each of which is three (x, y, z) vertices.
+        The vertices are not shared between triangles.
+        """
+        vertices = np.array([vertex for triangle in triangles for vertex in triangle], dtype=np.float64).reshape(-1, 3)
+        faces = np.arange(len(vertices), dtype=np.int32).reshape(-1, 3)
+        return Mesh(vertices, faces)
+
+    def __len__(self):
+        return len(self.faces)
+
+    def triangles(self):
+        """
+        Returns an (M, 3, 3) array of the three vertices of each triangle
+        """
+        return self.vertices[self.faces]
+
+    def __iter__(self):
+        """
+        Yields each triangle as a tuple of three (x, y, z) tuples
+        """
+        for triangle in self.triangles().tolist():
+            yield tuple(tuple(vertex) for vertex in triangle)
+
+
+class MeshStream:
+    """
+    A Mesh which is built one band of time steps at a time.
+
+    bands is a function which returns an iterator over the bands, each
+    a Mesh and the position ids of its vertices, as returned by
+    compose_band.  The bands are built as they are needed, and each one
+    can be dropped once it has been written, so only one band of
+    vertices is in memory at a time.  The rings where the bands meet
+    are repeated in both bands, and the ids say which vertices are the same.
+    """
+    def __init__(self, bands):
+        self.bands = bands
+
+    def __len__(self):
+        return sum(len(mesh) for mesh, _ in self.bands())
+
+    def to_mesh(self):
+        """
+        Collect all of the bands into one Mesh
+        """
+        return stitch_bands(list(self.bands()))
+
+def mesh_bands(mesh):
+    """
+    Returns an iterator over the Mesh of each band of a MeshStream, or
+    over just the Mesh itself for an ordinary Mesh
+    """
+    if isinstance(mesh, MeshStream):
+        return (band for band, _ in mesh.bands())
+    return iter([mesh])
+
+def indexed_bands(mesh):
+    """
+    For writing shared vertices a band at a time.  Yields, for each
+    band, the vertices which have not been seen in an earlier band and
+    the faces as indices into all of the vertices so far.
+
+    The ring where two bands meet is only yielded once, and the
+    vertices are numbered in the order they first appear, the same as
+    stitch_bands, so the vertices come out as they would for to_mesh
+    """
+    if not isinstance(mesh, MeshStream):
+        yield mesh.vertices, mesh.faces
+        return
+
+    num_vertices = 0
+    previous_ids = np.zeros(0, dtype=np.int64)
+    previous_index = np.zeros(0, dtype=np.int64)
+    for band, vertex_ids in mesh.bands():
+        ids, first_index, inverse = np.unique(vertex_ids, return_index=True, return_inverse=True)
+        # only the previous band can share a ring with this one
+        position = np.minimum(np.searchsorted(previous_ids, ids), max(len(previous_ids) - 1, 0))
+        if len(previous_ids) > 0:
+            seen = previous_ids[position] == ids
+        else:
+            seen = np.zeros(len(ids), dtype=bool)
+        index = np.empty(len(ids), dtype=np.int64)
+        index[seen] = previous_index[position[seen]]
+        new = np.flatnonzero(~seen)
+        new = new[np.argsort(first_index[new])]
+        index[new] = num_vertices + np.arange(len(new))
+        yield band.vertices[first_index[new]], index[inverse.ravel()][band.faces]
+        num_vertices = num_vertices + len(new)
+        previous_ids, previous_index = ids, index
+
 
 def generate_quad(a, b, c, d):
     """
@@ -36,40 +198,140 @@ def generate_cube(size):
         for triangle in generate_quad(*side):
             yield triangle
 
-def calculate_arclengths(x_t, y_t, num_time_steps):
+def calculate_arclengths(x_t, y_t, num_time_steps, substeps=ARCLENGTH_SUBSTEPS,
+                         dx_t=None, dy_t=None):
     """
     Numerically calculate the arclength at each time step from 0..num_time_steps
     Returns a list of length num_time_steps+1
+
+    Each time step is split into substeps straight segments.  The
+    sample times are built as one array, x_t and y_t are called once
+    per sample, and the segment lengths are summed with np.cumsum,
+    which adds them in the same order as a running total would.
+
+    If the derivatives dx_t and dy_t are known, the speed is integrated
+    directly instead, which needs far fewer evaluations.
     """
-    arclength = 0.0
-    x2 = x_t(0)
-    y2 = y_t(0)
-    arclengths = [0.0]
-    for i in range(0, num_time_steps):
-        for j in range(1000):
-            t1 = i + j / 1000
-            t2 = i + (j + 1) / 1000
-        
-            x1 = x2
-            x2 = x_t(t2)
-        
-            y1 = y2
-            y2 = y_t(t2)
+    if dx_t is not None and dy_t is not None:
+        return integrate_arclengths(x_t, y_t, dx_t, dy_t, num_time_steps, substeps)
+
+    steps = np.arange(num_time_steps, dtype=np.float64).reshape(-1, 1)
+    fractions = np.arange(1, substeps + 1, dtype=np.float64) / substeps
+    times = (steps + fractions).ravel().tolist()
+
+    xs = np.array(marble_util.evaluate_times(x_t, [0] + times), dtype=np.float64)
+    ys = np.array(marble_util.evaluate_times(y_t, [0] + times), dtype=np.float64)
+    dx = np.diff(xs)
+    dy = np.diff(ys)
+    segments = np.sqrt(dx * dx + dy * dy)
+    arclengths = np.cumsum(segments)[substeps-1::substeps]
+    return [0.0] + arclengths.tolist()
+
+def chord_lengths(x_t, y_t, start, end, substeps):
+    """
+    The length of the path from start to end, summing substeps straight segments
+    """
+    times = np.linspace(start, end, substeps + 1).tolist()
+    xs = np.array(marble_util.evaluate_times(x_t, times), dtype=np.float64)
+    ys = np.array(marble_util.evaluate_times(y_t, times), dtype=np.float64)
+    return float(np.sum(np.hypot(np.diff(xs), np.diff(ys))))
+
+def integrate_arclengths(x_t, y_t, dx_t, dy_t, num_time_steps, substeps=ARCLENGTH_SUBSTEPS):
+    """
+    Integrate the speed (dx_t, dy_t) over each time step with
+    Gauss-Legendre quadrature.  Returns a list of length num_time_steps+1
+
+    Each step is integrated both whole and as two halves.  The
+    quadrature is only accurate where the speed is smooth, so a step
+    where the two disagree, such as one where the path goes through a
+    kink in a regularization factor, is measured with substeps
+    straight segments instead.
+    """
+    nodes, weights = np.polynomial.legendre.leggauss(ARCLENGTH_GAUSS_NODES)
+    # nodes for the whole step, then for the first and second halves
+    offsets = np.concatenate([(nodes + 1) / 2, (nodes + 1) / 4, (nodes + 3) / 4])
+    steps = np.arange(num_time_steps, dtype=np.float64).reshape(-1, 1)
+    times = (steps + offsets).ravel().tolist()
+    dxs = np.array([dx_t(t) for t in times], dtype=np.float64)
+    dys = np.array([dy_t(t) for t in times], dtype=np.float64)
+    speeds = np.hypot(dxs, dys).reshape(num_time_steps, 3, ARCLENGTH_GAUSS_NODES)
+
+    whole = speeds[:, 0, :] @ weights / 2
+    halves = (speeds[:, 1, :] + speeds[:, 2, :]) @ weights / 4
+    lengths = halves
+    for step in np.nonzero(np.abs(whole - halves) > ARCLENGTH_GAUSS_TOLERANCE * np.maximum(halves, 1.0))[0].tolist():
+        lengths[step] = chord_lengths(x_t, y_t, step, step + 1, substeps)
+    return [0.0] + np.cumsum(lengths).tolist()
+
+class PathSamples:
+    """
+    The sampled values of one path, shared between the stages which build it.
+
+    The arclengths are integrated the first time they are needed.
+    slope_function fills in times, time_grid and slopes, and
+    arclength_height_function fills in zs.
+
+    dx_t and dy_t are the derivatives of the path with respect to the
+    time step, if known.  They are used to integrate the arclengths.
+
+    A stage which changes the path, such as add_both_zero_circles,
+    produces new x_t and y_t, so the stages after it need a new
+    PathSamples.  Use get_path_samples to check.
+    """
+    def __init__(self, x_t, y_t, num_time_steps, arclength_substeps=ARCLENGTH_SUBSTEPS,
+                 dx_t=None, dy_t=None):
+        self.x_t = x_t
+        self.y_t = y_t
+        self.dx_t = dx_t
+        self.dy_t = dy_t
+        self.num_time_steps = num_time_steps
+        self.arclength_substeps = arclength_substeps
+        self._arclengths = None
+        self.times = None
+        self.time_grid = None
+        self.slopes = None
+        self.zs = None
+
+    def describes(self, x_t, y_t, num_time_steps, arclength_substeps):
+        """
+        True if these samples were taken from exactly this path
+        """
+        return (self.x_t is x_t and self.y_t is y_t and
+                self.num_time_steps == num_time_steps and
+                self.arclength_substeps == arclength_substeps)
+
+    @property
+    def arclengths(self):
+        if self._arclengths is None:
+            with profiler.stage("calculate_arclengths"):
+                self._arclengths = calculate_arclengths(self.x_t, self.y_t, self.num_time_steps,
+                                                        self.arclength_substeps,
+                                                        self.dx_t, self.dy_t)
+        return self._arclengths
+
+def get_path_samples(path_samples, x_t, y_t, num_time_steps, arclength_substeps=ARCLENGTH_SUBSTEPS):
+    """
+    Returns path_samples if it describes this path, otherwise new samples for the path
+    """
+    if path_samples is not None and path_samples.describes(x_t, y_t, num_time_steps, arclength_substeps):
+        return path_samples
+    return PathSamples(x_t, y_t, num_time_steps, arclength_substeps)
 
-            arclength = arclength + ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
-        arclengths.append(arclength)
-    return arclengths
-        
 def arclength_height_function(x_t, y_t, num_time_steps,
                               slope_angle=None,
-                              slope_angle_t=None):
+                              slope_angle_t=None,
+                              arclength_substeps=ARCLENGTH_SUBSTEPS,
+                              path_samples=None):
     """
     Comes up with a function z(t) which works on the domain [0, num_time_steps]
 
     Does this by numerically integrating the arclength of x(t), y(t)
     then caching the arclength traveled for the various time steps
+
+    If path_samples already has the arclengths for this path, they are reused
     """
-    arclengths = calculate_arclengths(x_t, y_t, num_time_steps)
+    path_samples = get_path_samples(path_samples, x_t, y_t, num_time_steps, arclength_substeps)
+    arclengths = path_samples.arclengths
     if slope_angle is not None:
         angle = slope_angle / 180 * math.pi
     zs = [0.0]
@@ -79,6 +341,7 @@ def arclength_height_function(x_t, y_t, num_time_steps,
         delta_arc = arc1 - arc2   # flipping the negative: positive angle means down
         delta_z = math.tan(angle) * delta_arc
         zs.append(delta_z + zs[-1])
+    path_samples.zs = zs
 
     def z_t(time_step):
         if time_step < 0 or time_step > num_time_steps:
@@ -91,6 +354,26 @@ def arclength_height_function(x_t, y_t, num_time_steps,
     
     return z_t
 
+def derivative_rotation(dx, dy, time_step):
+    """
+    The rotation of the tube in degrees, given the derivative of the path at time_step
+    """
+    if dx == 0 and dy == 0:
+        raise ValueError("derivative has a discontinuity at %f" % time_step)
+
+    rotation = math.asin(dx / (dx ** 2 + dy ** 2) ** 0.5)
+    if dx >= 0 and dy > 0:
+        # this gives us a negative rotation, meaning to the right
+        rotation = -rotation
+    elif dx >= 0 and dy < 0:
+        rotation = rotation + math.pi
+    elif dx < 0 and dy > 0:
+        rotation = -rotation
+    else: # dx < 0 and dy < 0
+        rotation = rotation + math.pi
+
+    return rotation * 180 / math.pi
+
 def numerical_rotation_function(x_t, y_t, epsilon=0.001):
     """
     Returns a function r(t) which calculates the rotation of a tube based on its x, y functions.
@@ -104,21 +387,15 @@ def numerical_rotation_function(x_t, y_t, epsilon=0.001):
         y1 = y_t(time_step - epsilon)
         dy = (y2 - y1) / (epsilon * 2)
 
-        if dx == 0 and dy == 0:
-            raise ValueError("derivative has a discontinuity at %f" % time_step)
-        
-        rotation = math.asin(dx / (dx ** 2 + dy ** 2) ** 0.5)
-        if dx >= 0 and dy > 0:
-            # this gives us a negative rotation, meaning to the right
-            rotation = -rotation
-        elif dx >= 0 and dy < 0:
-            rotation = rotation + math.pi
-        elif dx < 0 and dy > 0:
-            rotation = -rotation
-        else: # dx < 0 and dy < 0
-            rotation = rotation + math.pi
-
-        return rotation * 180 / math.pi
+        return derivative_rotation(dx, dy, time_step)
+    return r_t
+
+def derivative_rotation_function(dx_t, dy_t):
+    """
+    Returns a function r(t) which calculates the rotation of a tube from the derivatives of its x, y functions.
+    """
+    def r_t(time_step):
+        return derivative_rotation(dx_t(time_step), dy_t(time_step), time_step)
     return r_t
 
 
@@ -157,6 +434,19 @@ def oval_tube_coordinates(tube_method, tube_radius, wall_height, wall_thickness,
     rotation means how much to rotate the tube.
     tube_method is passed in because this can work for both OVAL and DEEP_OVAL
     """
+    x_disp, vert_disp = oval_tube_profile(tube_method, tube_radius, wall_height, wall_thickness,
+                                          tube_start_angle, tube_end_angle,
+                                          num_tube_subdivisions, tube_subdivision, inside)
+    y_disp, z_disp = slope_tube(vert_disp, slope_angle)
+    return rotate_tube(x_disp, y_disp, z_disp, rotation)
+
+def oval_tube_profile(tube_method, tube_radius, wall_height, wall_thickness,
+                      tube_start_angle, tube_end_angle,
+                      num_tube_subdivisions, tube_subdivision, inside):
+    """
+    The x and vertical displacement of one point of an oval tube,
+    before it is sloped or rotated.  See oval_tube_coordinates
+    """
     if inside:
         tube_radius = tube_radius - wall_thickness
 
@@ -189,8 +479,7 @@ def oval_tube_coordinates(tube_method, tube_radius, wall_height, wall_thickness,
         sin = math.sin(tube_angle) if tube_method is Tube.OVAL else deep_trig(math.sin(tube_angle))
         x_disp = tube_radius * cos
         vert_disp = tube_radius * sin
-        y_disp, z_disp = slope_tube(vert_disp, slope_angle)
-        return rotate_tube(x_disp, y_disp, z_disp, rotation)
+        return (x_disp, vert_disp)
     else:
         tube_arclength = tube_arclength - end_overhang_arclength
         tube_position = tube_position / (1.0 - end_overhang_ratio)
@@ -204,8 +493,7 @@ def oval_tube_coordinates(tube_method, tube_radius, wall_height, wall_thickness,
         sin = math.sin(tube_angle) if tube_method is Tube.OVAL else deep_trig(math.sin(tube_angle))
         x_disp = tube_radius * cos
         vert_disp = tube_radius * sin
-        y_disp, z_disp = slope_tube(vert_disp, slope_angle)
-        return rotate_tube(x_disp, y_disp, z_disp, rotation)
+        return (x_disp, vert_disp)
     else:
         tube_position = (tube_position - start_overhang_arclength / tube_arclength) / (1.0 - start_overhang_ratio)
         tube_arclength = tube_arclength - start_overhang_arclength
@@ -228,8 +516,7 @@ def oval_tube_coordinates(tube_method, tube_radius, wall_height, wall_thickness,
         x_disp = tube_radius * cos
         vert_disp = -tube_radius * sin - wall_height
 
-    y_disp, z_disp = slope_tube(vert_disp, slope_angle)
-    return rotate_tube(x_disp, y_disp, z_disp, rotation)
+    return (x_disp, vert_disp)
 
 def triangle_tube_coordinates(tube_radius, wall_thickness, roof_angle,
                               num_tube_subdivisions, tube_subdivision,
@@ -239,6 +526,17 @@ def triangle_tube_coordinates(tube_radius, wall_thickness, roof_angle,
 
     roof_angle: 0 for an actual circle, 90 would be completely open
     """
+    x_disp, vert_disp = triangle_tube_profile(tube_radius, wall_thickness, roof_angle,
+                                              num_tube_subdivisions, tube_subdivision, inside)
+    y_disp, z_disp = slope_tube(vert_disp, slope_angle)
+    return rotate_tube(x_disp, y_disp, z_disp, rotation)
+
+def triangle_tube_profile(tube_radius, wall_thickness, roof_angle,
+                          num_tube_subdivisions, tube_subdivision, inside):
+    """
+    The x and vertical displacement of one point of a triangle topped
+    tube, before it is sloped or rotated.  See triangle_tube_coordinates
+    """
     if roof_angle >= 90:
         raise ValueError("Cannot project a roof based on an angle more than 90 - the roof will never meet")
     roof_angle = roof_angle * math.pi / 180
@@ -265,9 +563,7 @@ def triangle_tube_coordinates(tube_radius, wall_thickness, roof_angle,
         
     x_disp = tube_radius * x_disp
     vert_disp = tube_radius * vert_disp
-    
-    y_disp, z_disp = slope_tube(vert_disp, slope_angle)
-    return rotate_tube(x_disp, y_disp, z_disp, rotation)
+    return (x_disp, vert_disp)
     
 def ellipse_tube_coordinates(tube_method, tube_radius, tube_eccentricity, wall_thickness,
                              tube_start_angle, tube_end_angle,
@@ -282,6 +578,19 @@ def ellipse_tube_coordinates(tube_method, tube_radius, tube_eccentricity, wall_t
       For a zigzag, you will not want to rotate at all.
       For an arbitrary curve, you probably want to be normal to the current direction.
     """
+    x_disp, vert_disp = ellipse_tube_profile(tube_method, tube_radius, tube_eccentricity, wall_thickness,
+                                             tube_start_angle, tube_end_angle,
+                                             num_tube_subdivisions, tube_subdivision, inside)
+    y_disp, z_disp = slope_tube(vert_disp, slope_angle)
+    return rotate_tube(x_disp, y_disp, z_disp, rotation)
+
+def ellipse_tube_profile(tube_method, tube_radius, tube_eccentricity, wall_thickness,
+                         tube_start_angle, tube_end_angle,
+                         num_tube_subdivisions, tube_subdivision, inside):
+    """
+    The x and vertical displacement of one point of an ellipse tube,
+    before it is sloped or rotated.  See ellipse_tube_coordinates
+    """
     # TODO: maybe vary num_tube_subdivisions if the angle is changing?
     tube_angle = tube_start_angle + (tube_end_angle - tube_start_angle) / num_tube_subdivisions * tube_subdivision
     if tube_angle > tube_end_angle:
@@ -292,8 +601,8 @@ def ellipse_tube_coordinates(tube_method, tube_radius, tube_eccentricity, wall_t
     # we will figure out x, y, z as if we had not rotated around the
     # axis at all.  then we will rotate the resulting vector
 
-    # TODO: cache the eccentricity computations or otherwise make them
-    # more efficient?
+    # compose_triangles caches whole profiles with tube_profile, so
+    # this is only calculated once per distinct cross section
     ellipse_A = 1.0 / (1 - tube_eccentricity ** 2) ** 0.5
     ellipse_r = ellipse_A / (ellipse_A ** 2 * math.cos(tube_angle) ** 2 + math.sin(tube_angle) ** 2) ** 0.5
 
@@ -309,27 +618,247 @@ def ellipse_tube_coordinates(tube_method, tube_radius, tube_eccentricity, wall_t
 
     x_disp = tube_radius * cos * ellipse_r
     vert_disp = -tube_radius * sin * ellipse_r
+    return (x_disp, vert_disp)
 
-    y_disp, z_disp = slope_tube(vert_disp, slope_angle)
-    return rotate_tube(x_disp, y_disp, z_disp, rotation)
+@functools.lru_cache(maxsize=TUBE_PROFILE_CACHE_SIZE)
+def tube_profile(tube_method, tube_radius, tube_eccentricity, wall_height, wall_thickness,
+                 roof_angle, tube_start_angle, tube_end_angle, num_tube_subdivisions, inside):
+    """
+    Returns the (x_disp, vert_disp) of every point 0..num_tube_subdivisions
+    of one cross section of the tube, before it is sloped or rotated.
+
+    Cached, so each distinct cross section is only calculated once.
+    Arguments which do not apply to tube_method should be passed as
+    None so that they do not split the cache.
+    """
+    subdivisions = range(num_tube_subdivisions + 1)
+    if tube_method is Tube.ELLIPSE or tube_method is Tube.DEEP_ELLIPSE:
+        return tuple(ellipse_tube_profile(tube_method, tube_radius, tube_eccentricity, wall_thickness,
+                                          tube_start_angle, tube_end_angle,
+                                          num_tube_subdivisions, tube_subdivision, inside)
+                     for tube_subdivision in subdivisions)
+    elif tube_method is Tube.OVAL or tube_method is Tube.DEEP_OVAL:
+        return tuple(oval_tube_profile(tube_method, tube_radius, wall_height, wall_thickness,
+                                       tube_start_angle, tube_end_angle,
+                                       num_tube_subdivisions, tube_subdivision, inside)
+                     for tube_subdivision in subdivisions)
+    elif tube_method is Tube.TRIANGLE_TOP:
+        return tuple(triangle_tube_profile(tube_radius, wall_thickness, roof_angle,
+                                           num_tube_subdivisions, tube_subdivision, inside)
+                     for tube_subdivision in subdivisions)
+    else:
+        raise ValueError("Tube method {} not handled".format(tube_method))
+
+
+def grid_math(function, values):
+    """
+    Applies a scalar math function to an array, once per distinct value.
+
+    np.cos and friends can differ from math.cos in the last bit, which
+    is enough to turn a 0.0000 into a -0.0000 in the stl.  The grids
+    only have a few distinct angles (one per tube subdivision or time
+    step), so this keeps the results identical to the scalar path.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    unique, inverse = np.unique(values, return_inverse=True)
+    results = np.array([function(value) for value in unique.tolist()], dtype=np.float64)
+    return results[inverse].reshape(values.shape)
+
+def grid_sqrt(values):
+    return grid_math(lambda x: x ** 0.5, values)
+
+def grid_cos(values):
+    return grid_math(math.cos, values)
+
+def grid_sin(values):
+    return grid_math(math.sin, values)
+
+def deep_trig_grid(base):
+    """
+    Vectorized deep_trig
+    """
+    p_base = grid_sqrt(np.abs(base))
+    p_base = np.where(base < 0.0, -p_base, p_base)
+    return (p_base + base) / 2
+
+def oval_tube_grid(tube_method, tube_radius, wall_height, wall_thickness,
+                   tube_start_angle, tube_end_angle,
+                   num_tube_subdivisions, inside):
+    """
+    Vectorized version of oval_tube_coordinates.
+
+    tube_start_angle and tube_end_angle are columns, one row per time step.
+    Returns x_disp, vert_disp for every (time_step, tube_subdivision)
+    before the slope and rotation are applied.
+    """
+    if inside:
+        tube_radius = tube_radius - wall_thickness
+
+    if np.any(tube_start_angle > 0):
+        raise ValueError("Currently tube_start_angle > 0 is not handled for oval")
+    tube_start_angle = np.where(tube_start_angle < -180, -180, tube_start_angle)
+    tube_end_angle = np.where(tube_end_angle > 360, 360, tube_end_angle)
+    if np.any(tube_end_angle < 180):
+        raise ValueError("Currently tube_end_angle < 180 is not handled for oval")
+    if np.any(tube_end_angle - tube_start_angle > 360):
+        raise ValueError("Currently wrapping around tube_start_angle and tube_end_angle not handled")
+
+    trig = (lambda x: x) if tube_method is Tube.OVAL else deep_trig_grid
+
+    tube_arclength = 2 * wall_height + (tube_end_angle - tube_start_angle) * math.pi / 180 * tube_radius
+    tube_position = np.arange(num_tube_subdivisions + 1) / num_tube_subdivisions
+
+    bottom_arclength = 2 * wall_height + math.pi * tube_radius
+    start_overhang_arclength = -tube_start_angle * math.pi / 180 * tube_radius
+    end_overhang_arclength = tube_arclength - bottom_arclength - start_overhang_arclength
 
+    # each of the branches in oval_tube_coordinates is computed for
+    # every vertex, then the right one is picked.  the unused
+    # branches may divide by zero, which is harmless
+    with np.errstate(divide='ignore', invalid='ignore'):
+        end_overhang_ratio = end_overhang_arclength / tube_arclength
+        end_overhang = tube_position > (bottom_arclength + start_overhang_arclength) / tube_arclength
+        end_position = (tube_position - (bottom_arclength + start_overhang_arclength) / tube_arclength) / end_overhang_ratio
+        end_angle = math.pi - (tube_end_angle - 180) * end_position * math.pi / 180
 
-def coordinates(x_t, y_t, z_t, r_t,
-                tube_function, tube_subdivision, inside,
-                time_step):
+        tube_arclength = tube_arclength - end_overhang_arclength
+        tube_position = tube_position / (1.0 - end_overhang_ratio)
+        start_overhang_ratio = start_overhang_arclength / tube_arclength
+
+        start_overhang = tube_position < start_overhang_arclength / tube_arclength
+        start_position = 1.0 - tube_position / start_overhang_ratio
+        start_angle = -tube_start_angle * start_position * math.pi / 180
+
+        tube_position = (tube_position - start_overhang_arclength / tube_arclength) / (1.0 - start_overhang_ratio)
+        tube_arclength = tube_arclength - start_overhang_arclength
+
+        first_wall = tube_position < wall_height / tube_arclength
+        second_wall = tube_position > (tube_arclength - wall_height) / tube_arclength
+        bottom_position = tube_position - wall_height / tube_arclength
+        bottom_position = np.where(wall_height * 2 / tube_arclength < 1.0,
+                                   bottom_position / (1.0 - wall_height * 2 / tube_arclength),
+                                   bottom_position)
+        bottom_angle = math.pi * bottom_position
+
+    overhang = end_overhang | start_overhang
+    overhang_angle = np.where(end_overhang, end_angle, start_angle)
+    overhang_x = tube_radius * trig(grid_cos(overhang_angle))
+    overhang_vert = tube_radius * trig(grid_sin(overhang_angle))
+
+    bottom_x = tube_radius * trig(grid_cos(bottom_angle))
+    bottom_vert = -tube_radius * trig(grid_sin(bottom_angle)) - wall_height
+
+    x_disp = np.select([overhang, first_wall, second_wall],
+                       [overhang_x, tube_radius, -tube_radius],
+                       bottom_x)
+    vert_disp = np.select([overhang, first_wall, second_wall],
+                          [overhang_vert, -wall_height * tube_position, -wall_height * (1 - tube_position)],
+                          bottom_vert)
+    return x_disp, vert_disp
+
+def triangle_tube_grid(tube_radius, wall_thickness, roof_angle,
+                       num_tube_subdivisions, inside):
+    """
+    Vectorized version of triangle_tube_coordinates.
+
+    The shape does not change over time, so this returns a single
+    row of x_disp, vert_disp for each tube_subdivision.
     """
-    Given the functions describing x, y, z, and r, along with a
+    if roof_angle >= 90:
+        raise ValueError("Cannot project a roof based on an angle more than 90 - the roof will never meet")
+    roof_angle = roof_angle * math.pi / 180
+
+    tube_angle = 2 * math.pi / num_tube_subdivisions * np.arange(num_tube_subdivisions + 1)
+
+    if inside:
+        tube_radius = tube_radius - wall_thickness
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        start_position = tube_angle / roof_angle
+        end_position = (2 * math.pi - tube_angle) / roof_angle
+    start_roof = tube_angle < roof_angle
+    end_roof = tube_angle > 2 * math.pi - roof_angle
+    position = np.where(start_roof, start_position, end_position)
+    roof_vert = math.cos(roof_angle) * position + 1.0 / math.cos(roof_angle) * (1.0 - position)
+
+    x_disp = np.select([start_roof, end_roof],
+                       [math.sin(roof_angle) * position, -math.sin(roof_angle) * position],
+                       grid_sin(tube_angle))
+    vert_disp = np.select([start_roof, end_roof],
+                          [roof_vert, roof_vert],
+                          grid_cos(tube_angle))
+
+    return tube_radius * x_disp, tube_radius * vert_disp
+
+def ellipse_tube_grid(tube_method, tube_radius, tube_eccentricity, wall_thickness,
+                      tube_start_angle, tube_end_angle,
+                      num_tube_subdivisions, inside):
+    """
+    Vectorized version of ellipse_tube_coordinates.
+
+    tube_start_angle and tube_end_angle are columns, one row per time step.
+    Returns x_disp, vert_disp for every (time_step, tube_subdivision)
+    before the slope and rotation are applied.
+    """
+    tube_subdivision = np.arange(num_tube_subdivisions + 1)
+    tube_angle = tube_start_angle + (tube_end_angle - tube_start_angle) / num_tube_subdivisions * tube_subdivision
+    tube_angle = np.where(tube_angle > tube_end_angle, tube_end_angle, tube_angle)
+
+    tube_angle = tube_angle / 180 * math.pi
+
+    ellipse_A = 1.0 / (1 - tube_eccentricity ** 2) ** 0.5
+    ellipse_r = ellipse_A / grid_sqrt(ellipse_A ** 2 * grid_cos(tube_angle) ** 2 + grid_sin(tube_angle) ** 2)
+
+    if inside:
+        wall_thickness = wall_thickness / ellipse_r
+        tube_radius = tube_radius - wall_thickness
+
+    cos = grid_cos(tube_angle) if tube_method is Tube.ELLIPSE else deep_trig_grid(grid_cos(tube_angle))
+    sin = grid_sin(tube_angle) if tube_method is Tube.ELLIPSE else deep_trig_grid(grid_sin(tube_angle))
+
+    x_disp = tube_radius * cos * ellipse_r
+    vert_disp = -tube_radius * sin * ellipse_r
+    return x_disp, vert_disp
+
+
+# everything about the path at one time step which the tube needs
+Frame = namedtuple('Frame', ['x', 'y', 'z', 'rotation', 'slope_angle',
+                             'tube_start_angle', 'tube_end_angle'])
+
+def frame_function(x_t, y_t, z_t, r_t, slope_angle_t, tube_start_t, tube_end_t):
+    """
+    Returns a function time_step -> Frame.
+
+    Each time step is evaluated once and remembered, since every
+    vertex of the ring at that time step needs the same values
+    """
+    frames = {}
+    def frame_t(time_step):
+        frame = frames.get(time_step)
+        if frame is None:
+            profiler.count('frame_t')
+            frame = Frame(x=x_t(time_step),
+                          y=y_t(time_step),
+                          z=z_t(time_step),
+                          rotation=r_t(time_step),
+                          slope_angle=slope_angle_t(time_step),
+                          tube_start_angle=tube_start_t(time_step),
+                          tube_end_angle=tube_end_t(time_step))
+            frames[time_step] = frame
+        return frame
+    return frame_t
+
+def coordinates(frame, tube_function, tube_subdivision, inside):
+    """
+    Given the Frame of the path at a time step, along with a
     function describing how to build the tube, calculate the current
     location offset by the tube location
     """
-    location = (x_t(time_step),
-                y_t(time_step),
-                z_t(time_step))
+    location = (frame.x, frame.y, frame.z)
 
     tube_offset = tube_function(tube_subdivision=tube_subdivision,
                                 inside=inside,
-                                rotation=r_t(time_step),
-                                time_step=time_step)
+                                frame=frame)
 
     #print("%.4f %d    %.4f %.4f %.4f   %.4f %.4f %.4f" %
     #      (time_step, tube_subdivision, location[0], location[1], location[2],
@@ -342,7 +871,7 @@ def coordinates(x_t, y_t, z_t, r_t,
     return location
 
 
-def build_tube_angle_t(tube_angles, time_t):
+def build_tube_angle_t(tube_angles, time_t, resolution=0.0, num_time_steps=None):
     """Build a function from time to tube angle
 
     Expects time to either be a single number, or a sequence of tuples: (time, angle)
@@ -350,38 +879,68 @@ def build_tube_angle_t(tube_angles, time_t):
     Given a sequence of tuples, times before the start will get
     angle0, times after the end will get angleN, and times between two
     times will be interpolated between the two using a tanh for smoothness
+
+    If resolution is positive, interpolated angles are rounded to a
+    multiple of resolution, so that the tube profiles can be reused
+
+    If num_time_steps is given, the result is a TubeAngleSchedule
+    with the angle at each time step already calculated
     """
+    if num_time_steps is not None:
+        return TubeAngleSchedule(build_tube_angle_t(tube_angles, time_t, resolution), num_time_steps)
+
+    if resolution > 0 and not isinstance(tube_angles, (float, int)):
+        tube_t = build_tube_angle_t(tube_angles, time_t)
+        return lambda time_step: round(tube_t(time_step) / resolution) * resolution
+
     if isinstance(tube_angles, (float, int)):
         tube_t = lambda t: tube_angles
     else:
+        interval_times = [interval[0] for interval in tube_angles]
         def tube_t(time_step):
             t = time_t(time_step)
-            if t < tube_angles[0][0]:
+            if t < interval_times[0]:
                 # before the first interval: return that angle
                 return tube_angles[0][1]
-            if t > tube_angles[-1][0]:
+            if t > interval_times[-1]:
                 # after the last interval: return that angle
                 return tube_angles[-1][1]
-            for i in tube_angles:
+            i = bisect.bisect_left(interval_times, t)
+            interval = tube_angles[i]
+            if t == interval[0]:
                 # exactly on a interval boundary: return that angle
-                if t == i[0]:
-                    return i[1]
-            # at this point, we are between two intervals.  figure out which one
-            for i, interval in enumerate(tube_angles):
-                if t < interval[0]:
-                    break
+                return interval[1]
+            # at this point, we are between two intervals
             prev = tube_angles[i - 1]
             ratio = (t - prev[0]) / (interval[0] - prev[0])
             # use math.tanh so that we have a smooth transition rather than a corner
             return prev[1] + (math.tanh((ratio * 8) - 4) + 1.0) / 2.0 * (interval[1] - prev[1])
     return tube_t
 
+class TubeAngleSchedule:
+    """
+    A tube angle function with its value at each time step
+    0..num_time_steps calculated once.  Fractional time steps are
+    interpolated from the tube angles as usual.
+    """
+    def __init__(self, tube_t, num_time_steps):
+        self.tube_t = tube_t
+        self.angles = [tube_t(time_step) for time_step in range(num_time_steps + 1)]
+
+    def __call__(self, time_step):
+        if isinstance(time_step, int) and 0 <= time_step < len(self.angles):
+            return self.angles[time_step]
+        return self.tube_t(time_step)
+
 def compose_triangles(x_t, y_t, z_t, r_t,
                       tube_args, num_time_steps,
                       time_t=None,
                       slope_angle_t=None):
     """
-    Returns a list of vertices and triangles connecting those vertices.
+    Returns a Mesh of the vertices and the triangles connecting those vertices.
+
+    If tube_args.stream_band_size is set, returns a MeshStream
+    instead, which builds the Mesh that many time steps at a time
 
     tube_args should be args including the tube arguments from below
 
@@ -404,106 +963,284 @@ def compose_triangles(x_t, y_t, z_t, r_t,
     if time_t is None:
         time_t = lambda t: t
 
-    tube_start_t = build_tube_angle_t(tube_args.tube_start_angle, time_t)
-    tube_end_t = build_tube_angle_t(tube_args.tube_end_angle, time_t)
+    tube_angle_resolution = getattr(tube_args, 'tube_angle_resolution', 0.0)
+    tube_start_t = build_tube_angle_t(tube_args.tube_start_angle, time_t, tube_angle_resolution, num_time_steps)
+    tube_end_t = build_tube_angle_t(tube_args.tube_end_angle, time_t, tube_angle_resolution, num_time_steps)
+    frame_t = frame_function(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
+                             slope_angle_t=slope_angle_t,
+                             tube_start_t=tube_start_t,
+                             tube_end_t=tube_end_t)
 
     #for i in range(0, num_time_steps+1):
     #    print("  %d %.4f %.4f" % (i, tube_start_t(i), tube_end_t(i)))
 
+    if tube_args.tube_method is Tube.ELLIPSE or tube_args.tube_method is Tube.DEEP_ELLIPSE:
+        num_tube_subdivisions = max(math.ceil((tube_end_angle - tube_start_angle) * tube_args.tube_sides / 360)
+                                    for tube_start_angle, tube_end_angle in zip(tube_start_t.angles, tube_end_t.angles))
+        num_tube_subdivisions = min(num_tube_subdivisions, tube_args.tube_sides)
+        print("Num tube: {}".format(num_tube_subdivisions))
+    else:
+        num_tube_subdivisions = tube_args.tube_sides
+
+    stream_band_size = getattr(tube_args, 'stream_band_size', 0)
+    if stream_band_size > 0:
+        def stream_bands():
+            for first_time_step in range(0, num_time_steps, stream_band_size):
+                last_time_step = min(first_time_step + stream_band_size, num_time_steps)
+                # a new frame_t for each band, so that the frames of
+                # the previous bands are not kept
+                band_frame_t = frame_function(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
+                                              slope_angle_t=slope_angle_t,
+                                              tube_start_t=tube_start_t,
+                                              tube_end_t=tube_end_t)
+                yield compose_band(frame_t=band_frame_t,
+                                   tube_args=tube_args,
+                                   num_time_steps=num_time_steps,
+                                   num_tube_subdivisions=num_tube_subdivisions,
+                                   has_inner_wall=has_inner_wall,
+                                   wall_thickness=wall_thickness,
+                                   first_time_step=first_time_step,
+                                   last_time_step=last_time_step)
+        return MeshStream(stream_bands)
+
+    jobs = getattr(tube_args, 'jobs', 1)
+    if jobs > 1 and num_time_steps > 1:
+        return compose_bands(frame_t=frame_t,
+                             tube_args=tube_args,
+                             num_time_steps=num_time_steps,
+                             num_tube_subdivisions=num_tube_subdivisions,
+                             has_inner_wall=has_inner_wall,
+                             wall_thickness=wall_thickness,
+                             jobs=jobs)
+
+    mesh, _ = compose_band(frame_t=frame_t,
+                           tube_args=tube_args,
+                           num_time_steps=num_time_steps,
+                           num_tube_subdivisions=num_tube_subdivisions,
+                           has_inner_wall=has_inner_wall,
+                           wall_thickness=wall_thickness,
+                           first_time_step=0,
+                           last_time_step=num_time_steps)
+    return mesh
+
+def compose_band(frame_t, tube_args, num_time_steps, num_tube_subdivisions,
+                 has_inner_wall, wall_thickness, first_time_step, last_time_step):
+    """
+    Mesh the tube from first_time_step to last_time_step with the
+    engine chosen by tube_args.mesh_engine.  The caps are only added
+    at time steps 0 and num_time_steps.
+
+    Returns the Mesh and, for each of its vertices, the id of its
+    position, (inside * (num_time_steps + 1) + time_step) * (num_tube_subdivisions + 1) + tube_subdivision
+    """
+    if getattr(tube_args, 'mesh_engine', MeshEngine.SCALAR) is MeshEngine.NUMPY:
+        compose = compose_grid_triangles
+    else:
+        compose = compose_scalar_triangles
+    return compose(frame_t=frame_t,
+                   tube_args=tube_args,
+                   num_time_steps=num_time_steps,
+                   num_tube_subdivisions=num_tube_subdivisions,
+                   has_inner_wall=has_inner_wall,
+                   wall_thickness=wall_thickness,
+                   first_time_step=first_time_step,
+                   last_time_step=last_time_step)
+
+def compose_band_job(frames, tube_args, num_time_steps, num_tube_subdivisions,
+                     has_inner_wall, wall_thickness, first_time_step, last_time_step,
+                     profile=False):
+    """
+    compose_band in a worker process.  The path functions can't be
+    sent to another process, so frames is the list of Frames from
+    first_time_step to last_time_step instead.
+
+    Returns the Mesh, the vertex ids, and the profiler counts of the
+    band if profile is set, otherwise None
+    """
+    with profiler.worker_counts(profile) as counts:
+        mesh, vertex_ids = compose_band(frame_t=lambda time_step: frames[time_step - first_time_step],
+                                        tube_args=tube_args,
+                                        num_time_steps=num_time_steps,
+                                        num_tube_subdivisions=num_tube_subdivisions,
+                                        has_inner_wall=has_inner_wall,
+                                        wall_thickness=wall_thickness,
+                                        first_time_step=first_time_step,
+                                        last_time_step=last_time_step)
+    return mesh, vertex_ids, counts
+
+def compose_bands(frame_t, tube_args, num_time_steps, num_tube_subdivisions,
+                  has_inner_wall, wall_thickness, jobs):
+    """
+    Same result as compose_band over the whole path, but the time
+    steps are split into bands which are meshed in jobs processes.
+
+    Neighboring bands share the ring of vertices where they meet.
+    The bands are stitched back together by vertex position, and the
+    vertices are numbered in the order the serial mesh would use, so
+    the triangles come out the same.
+    """
+    edges = sorted(set(round(num_time_steps * band / jobs) for band in range(jobs + 1)))
+    frames = [frame_t(time_step) for time_step in range(num_time_steps + 1)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(compose_band_job,
+                                   frames=frames[first_time_step:last_time_step + 1],
+                                   tube_args=tube_args,
+                                   num_time_steps=num_time_steps,
+                                   num_tube_subdivisions=num_tube_subdivisions,
+                                   has_inner_wall=has_inner_wall,
+                                   wall_thickness=wall_thickness,
+                                   first_time_step=first_time_step,
+                                   last_time_step=last_time_step,
+                                   profile=profiler.is_profiling())
+                   for first_time_step, last_time_step in zip(edges[:-1], edges[1:])]
+        bands = []
+        for future in futures:
+            mesh, vertex_ids, counts = future.result()
+            profiler.add_counts(counts)
+            bands.append((mesh, vertex_ids))
+    return stitch_bands(bands)
+
+def stitch_bands(bands):
+    """
+    Join a list of (Mesh, vertex ids) from compose_band into one Mesh.
+    A vertex which appears in more than one band is kept once, and the
+    vertices are numbered in the order they first appear
+    """
+    vertex_ids = np.concatenate([ids for _, ids in bands])
+    _, first_index, inverse = np.unique(vertex_ids, return_index=True, return_inverse=True)
+    order = np.argsort(first_index)
+    new_index = np.empty(len(order), dtype=np.int64)
+    new_index[order] = np.arange(len(order))
+    new_index = new_index[inverse.ravel()]
+
+    vertices = np.concatenate([mesh.vertices for mesh, _ in bands])
+    vertex_offsets = np.cumsum([0] + [len(mesh.vertices) for mesh, _ in bands])
+    faces = np.concatenate([new_index[mesh.faces + vertex_offset]
+                            for (mesh, _), vertex_offset in zip(bands, vertex_offsets)])
+    return Mesh(vertices[first_index[order]], faces)
+
+def compose_scalar_triangles(frame_t, tube_args, num_time_steps, num_tube_subdivisions,
+                             has_inner_wall, wall_thickness, first_time_step, last_time_step):
+    """
+    Build the mesh from first_time_step to last_time_step one vertex at a time.
+
+    Returns the Mesh and the position id of each vertex, as described in compose_band
+    """
     if tube_args.tube_method is Tube.TRIANGLE_TOP:
         full_tube_t = lambda x, y: True
     else:
         def full_tube_t(first_step, second_step):
-            if tube_end_t(first_step) < tube_start_t(first_step) + 360:
-                return False
-            if tube_end_t(second_step) < tube_start_t(second_step) + 360:
-                return False
+            for frame in (frame_t(first_step), frame_t(second_step)):
+                if frame.tube_end_angle < frame.tube_start_angle + 360:
+                    return False
             return True
         
     if tube_args.tube_method is Tube.ELLIPSE or tube_args.tube_method is Tube.DEEP_ELLIPSE:
-        num_tube_subdivisions = max(math.ceil((tube_end_t(t) - tube_start_t(t)) * tube_args.tube_sides / 360)
-                                    for t in range(num_time_steps+1))
-        num_tube_subdivisions = min(num_tube_subdivisions, tube_args.tube_sides)
-        print("Num tube: {}".format(num_tube_subdivisions))
-        def tube_function(tube_subdivision, inside, rotation, time_step):
+        def profile_t(frame, inside):
             """
-            Using the parameters given to the helix, create a function which
-            returns the x, y, z offset from the tube coordinates.
-            This will be an ellipsoid shell
+            Using the parameters given to the helix, the cross section
+            of the tube.  This will be an ellipsoid shell
             """
-            return ellipse_tube_coordinates(tube_method=tube_args.tube_method,
-                                            tube_radius=tube_args.tube_radius,
-                                            tube_eccentricity=tube_args.tube_eccentricity,
-                                            wall_thickness=wall_thickness,
-                                            tube_start_angle=tube_start_t(time_step),
-                                            tube_end_angle=tube_end_t(time_step),
-                                            num_tube_subdivisions=num_tube_subdivisions,
-                                            tube_subdivision=tube_subdivision,
-                                            slope_angle=slope_angle_t(time_step),
-                                            inside=inside,
-                                            rotation=rotation)
+            return tube_profile(tube_method=tube_args.tube_method,
+                                tube_radius=tube_args.tube_radius,
+                                tube_eccentricity=tube_args.tube_eccentricity,
+                                wall_height=None,
+                                wall_thickness=wall_thickness,
+                                roof_angle=None,
+                                tube_start_angle=frame.tube_start_angle,
+                                tube_end_angle=frame.tube_end_angle,
+                                num_tube_subdivisions=num_tube_subdivisions,
+                                inside=inside)
     elif tube_args.tube_method is Tube.OVAL or tube_args.tube_method is Tube.DEEP_OVAL:
-        num_tube_subdivisions = tube_args.tube_sides
-        def tube_function(tube_subdivision, inside, rotation, time_step):
+        def profile_t(frame, inside):
             """
             Create an oval instead.
             """
-            return oval_tube_coordinates(tube_method=tube_args.tube_method,
-                                         tube_radius=tube_args.tube_radius,
-                                         wall_height=tube_args.tube_wall_height,
-                                         wall_thickness=wall_thickness,
-                                         tube_start_angle=tube_start_t(time_step),
-                                         tube_end_angle=tube_end_t(time_step),
-                                         num_tube_subdivisions=tube_args.tube_sides,
-                                         tube_subdivision=tube_subdivision,
-                                         slope_angle=slope_angle_t(time_step),
-                                         inside=inside,
-                                         rotation=rotation)
+            return tube_profile(tube_method=tube_args.tube_method,
+                                tube_radius=tube_args.tube_radius,
+                                tube_eccentricity=None,
+                                wall_height=tube_args.tube_wall_height,
+                                wall_thickness=wall_thickness,
+                                roof_angle=None,
+                                tube_start_angle=frame.tube_start_angle,
+                                tube_end_angle=frame.tube_end_angle,
+                                num_tube_subdivisions=num_tube_subdivisions,
+                                inside=inside)
     elif tube_args.tube_method is Tube.TRIANGLE_TOP:
-        num_tube_subdivisions = tube_args.tube_sides
-        def tube_function(tube_subdivision, inside, rotation, time_step):
+        def profile_t(frame, inside):
             """
-            Create an oval instead.
+            Create a circle with a triangle roof instead.
             """
-            return triangle_tube_coordinates(tube_radius=tube_args.tube_radius,
-                                             wall_thickness=wall_thickness,
-                                             roof_angle=tube_args.tube_roof_angle,
-                                             num_tube_subdivisions=tube_args.tube_sides,
-                                             tube_subdivision=tube_subdivision,
-                                             slope_angle=slope_angle_t(time_step),
-                                             inside=inside,
-                                             rotation=rotation)
+            return tube_profile(tube_method=tube_args.tube_method,
+                                tube_radius=tube_args.tube_radius,
+                                tube_eccentricity=None,
+                                wall_height=None,
+                                wall_thickness=wall_thickness,
+                                roof_angle=tube_args.tube_roof_angle,
+                                tube_start_angle=None,
+                                tube_end_angle=None,
+                                num_tube_subdivisions=num_tube_subdivisions,
+                                inside=inside)
+
+    sweeps = {}
+    def sweep_t(frame):
+        """
+        The sin and cos of the slope and rotation at this frame,
+        so that they are calculated once per ring instead of once per vertex
+        """
+        if frame not in sweeps:
+            sweeps[frame] = (math.sin(frame.slope_angle / 180 * math.pi),
+                             math.cos(frame.slope_angle / 180 * math.pi),
+                             math.sin(frame.rotation / 180 * math.pi),
+                             math.cos(frame.rotation / 180 * math.pi))
+        return sweeps[frame]
+
+    def tube_function(tube_subdivision, inside, frame):
+        """
+        Returns the x, y, z offset of the tube from the path at this frame
+        """
+        x_disp, vert_disp = profile_t(frame, inside)[tube_subdivision]
+        sin_slope, cos_slope, sin_rotation, cos_rotation = sweep_t(frame)
+        # same arithmetic as slope_tube and rotate_tube
+        y_disp = vert_disp * sin_slope
+        z_disp = vert_disp * cos_slope
+        return (x_disp * cos_rotation - y_disp * sin_rotation,
+                x_disp * sin_rotation + y_disp * cos_rotation,
+                z_disp)
+
+    tube_function = profiler.counted('tube_function', tube_function)
 
     # not thread safe, although that isn't a limitation
-    vertex_list = []
+    # the coordinates go straight into a flat buffer of doubles
+    # rather than a list of tuples, which can be handed to the Mesh
+    # without copying
+    vertex_list = array.array('d')
     position_to_vertex_index = {}
+    vertex_ids = array.array('q')
     def call_coordinates(tube_subdivision, time_step, inside):
         position = (tube_subdivision, time_step, inside)
         if position in position_to_vertex_index:
             index = position_to_vertex_index[position]
             return index
         else:
-            xyz = coordinates(x_t=x_t,
-                              y_t=y_t,
-                              z_t=z_t,
-                              r_t=r_t,
+            xyz = coordinates(frame=frame_t(time_step),
                               tube_function=tube_function,
                               tube_subdivision=tube_subdivision,
-                              inside=inside,
-                              time_step=time_step)
-            index = len(vertex_list)
+                              inside=inside)
+            index = len(position_to_vertex_index)
             position_to_vertex_index[position] = index
-            vertex_list.append(xyz)
+            vertex_list.extend(xyz)
+            vertex_ids.append((int(inside) * (num_time_steps + 1) + time_step) * (num_tube_subdivisions + 1) + tube_subdivision)
             return index
 
-    triangle_list = []
+    triangle_list = array.array('i')
     def add_quad(bottom, right, top, left):
         # note that the names are meant to be evocative, not necessarily
         # exactly where the triangle is
-        triangle_list.append((bottom, right, left))
-        triangle_list.append((left, right, top))
+        triangle_list.extend((bottom, right, left))
+        triangle_list.extend((left, right, top))
     
-    for time_step in range(num_time_steps):
+    for time_step in range(first_time_step, last_time_step):
         for tube_subdivision in range(num_tube_subdivisions):
             #print("Iterating over tube {} helix {}".format(tube_subdivision, time_step))
             # outside wall
@@ -542,23 +1279,264 @@ def compose_triangles(x_t, y_t, z_t, r_t,
                          call_coordinates(tube_subdivision+1, time_step+1, False),
                          call_coordinates(tube_subdivision+1, time_step+1, True))
 
-    return vertex_list, triangle_list
-                
+    mesh = Mesh(np.frombuffer(vertex_list, dtype=np.float64),
+                np.frombuffer(triangle_list, dtype=np.intc))
+    return mesh, np.frombuffer(vertex_ids, dtype=np.int64)
+
+def sweep_matrices(frames):
+    """
+    frames is an array of Frames, one per time step
+
+    Returns the (time_step, 1, 2) tilt which turns a profile's
+    vert_disp into (y_disp, z_disp), and the (time_step, 2, 2)
+    matrices which turn (x_disp, y_disp) to the heading of the path.
+
+    The tilt and heading are kept as separate steps, in the same
+    order as slope_tube and rotate_tube, so the results match the
+    scalar engine to the bit.
+    """
+    slope = frames[:, Frame._fields.index('slope_angle')] / 180 * math.pi
+    rotation = frames[:, Frame._fields.index('rotation')] / 180 * math.pi
+    tilt = np.stack([grid_sin(slope), grid_cos(slope)], axis=-1)[:, None, :]
+
+    sin_rotation = grid_sin(rotation)
+    cos_rotation = grid_cos(rotation)
+    heading = np.stack([np.stack([cos_rotation, -sin_rotation], axis=-1),
+                        np.stack([sin_rotation, cos_rotation], axis=-1)], axis=-2)
+    return tilt, heading
+
+def compose_grid_triangles(frame_t,
+                           tube_args, num_time_steps, num_tube_subdivisions,
+                           has_inner_wall, wall_thickness, first_time_step, last_time_step):
+    """
+    Same result as compose_scalar_triangles, but calculated with numpy.
+
+    The Frame is taken once per time step.  The tube
+    offsets for the entire grid of (inside, time_step,
+    tube_subdivision) are then calculated as arrays.  Triangles are
+    produced in the same order as compose_scalar_triangles.
+    """
+    frames = np.array([frame_t(t) for t in range(first_time_step, last_time_step + 1)], dtype=np.float64)
+    # columns, so that they broadcast against the tube subdivisions
+    x, y, z, rotation, slope_angle, tube_start_angle, tube_end_angle = frames.T[:, :, None]
+
+    tilt, heading = sweep_matrices(frames)
+
+    grid = []
+    for inside in (False, True):
+        if tube_args.tube_method is Tube.ELLIPSE or tube_args.tube_method is Tube.DEEP_ELLIPSE:
+            x_disp, vert_disp = ellipse_tube_grid(tube_method=tube_args.tube_method,
+                                                  tube_radius=tube_args.tube_radius,
+                                                  tube_eccentricity=tube_args.tube_eccentricity,
+                                                  wall_thickness=wall_thickness,
+                                                  tube_start_angle=tube_start_angle,
+                                                  tube_end_angle=tube_end_angle,
+                                                  num_tube_subdivisions=num_tube_subdivisions,
+                                                  inside=inside)
+        elif tube_args.tube_method is Tube.OVAL or tube_args.tube_method is Tube.DEEP_OVAL:
+            x_disp, vert_disp = oval_tube_grid(tube_method=tube_args.tube_method,
+                                               tube_radius=tube_args.tube_radius,
+                                               wall_height=tube_args.tube_wall_height,
+                                               wall_thickness=wall_thickness,
+                                               tube_start_angle=tube_start_angle,
+                                               tube_end_angle=tube_end_angle,
+                                               num_tube_subdivisions=num_tube_subdivisions,
+                                               inside=inside)
+        elif tube_args.tube_method is Tube.TRIANGLE_TOP:
+            x_disp, vert_disp = triangle_tube_grid(tube_radius=tube_args.tube_radius,
+                                                   wall_thickness=wall_thickness,
+                                                   roof_angle=tube_args.tube_roof_angle,
+                                                   num_tube_subdivisions=num_tube_subdivisions,
+                                                   inside=inside)
+        else:
+            raise ValueError("Tube method {} not handled".format(tube_args.tube_method))
+
+        # the triangle profile is the same for every time step
+        x_disp, vert_disp = np.broadcast_arrays(x_disp, vert_disp, x)[:2]
+        y_disp, z_disp = np.moveaxis(vert_disp[:, :, None] * tilt, -1, 0)
+        # heading @ (x_disp, y_disp) for every vertex of every ring,
+        # written out as a sum of the matrix columns.  np.einsum and
+        # np.matmul start their sums from +0.0, which loses the sign
+        # of -0.0 and changes the printed stl
+        r_x_disp, r_y_disp = np.moveaxis(heading[:, None, :, 0] * x_disp[:, :, None] +
+                                         heading[:, None, :, 1] * y_disp[:, :, None], -1, 0)
+        grid.append(np.stack([x + r_x_disp, y + r_y_disp, z + z_disp], axis=-1))
+    # shape is (inside, time_step, tube_subdivision, xyz)
+    grid = np.stack(grid)
+
+    band_time_steps = last_time_step - first_time_step
+    index = np.arange(grid.shape[0] * grid.shape[1] * grid.shape[2]).reshape(grid.shape[:3])
+    def corner(tube_offset, time_offset, inside):
+        return index[int(inside),
+                     time_offset:band_time_steps + time_offset,
+                     tube_offset:num_tube_subdivisions + tube_offset]
+
+    # the quads from compose_triangles, each as (bottom, right, top, left)
+    quads = [(corner(0, 0, False), corner(1, 0, False), corner(1, 1, False), corner(0, 1, False)),
+             (corner(0, 0, True), corner(0, 1, True), corner(1, 1, True), corner(1, 0, True)),
+             (corner(0, 0, False), corner(0, 1, False), corner(0, 1, True), corner(0, 0, True)),
+             (corner(1, 0, True), corner(1, 1, True), corner(1, 1, False), corner(1, 0, False)),
+             (corner(0, 0, False), corner(0, 0, True), corner(1, 0, True), corner(1, 0, False)),
+             (corner(0, 1, True), corner(0, 1, False), corner(1, 1, False), corner(1, 1, True))]
+    # shape is (time_step, tube_subdivision, quad, triangle, vertex)
+    faces = np.stack([np.stack([np.stack([bottom, right, left], axis=-1),
+                                np.stack([left, right, top], axis=-1)], axis=-2)
+                      for bottom, right, top, left in quads], axis=2)
+
+    if tube_args.tube_method is Tube.TRIANGLE_TOP:
+        full_tube = np.ones(band_time_steps, dtype=bool)
+    else:
+        full_step = (tube_end_angle >= tube_start_angle + 360)[:, 0]
+        full_tube = full_step[:-1] & full_step[1:]
+    tube_subdivision = np.arange(num_tube_subdivisions)
+    time_step = np.arange(first_time_step, last_time_step)[:, None]
+    used = np.zeros((band_time_steps, num_tube_subdivisions, len(quads)), dtype=bool)
+    used[:, :, 0] = True
+    used[:, :, 1] = has_inner_wall
+    used[:, :, 2] = (tube_subdivision == 0) & ~full_tube[:, None]
+    used[:, :, 3] = (tube_subdivision == num_tube_subdivisions - 1) & ~full_tube[:, None]
+    used[:, :, 4] = time_step == 0
+    used[:, :, 5] = time_step == num_time_steps - 1
+
+    faces = faces[used].reshape(-1, 3)
+    vertices = grid.reshape(-1, 3)
+
+    # drop the grid points no triangle uses, such as the inside of a
+    # full tube with no inner wall away from its ends
+    used_vertices = np.zeros(len(vertices), dtype=bool)
+    used_vertices[faces] = True
+    new_index = np.cumsum(used_vertices) - 1
+    # the grid is (inside, time_step, tube_subdivision), offset to this band
+    inside, band_time_step, tube_subdivision = np.unravel_index(np.flatnonzero(used_vertices), grid.shape[:3])
+    vertex_ids = (inside * (num_time_steps + 1) + first_time_step + band_time_step) * (num_tube_subdivisions + 1) + tube_subdivision
+    return Mesh(vertices[used_vertices], new_index[faces]), vertex_ids
+
 def generate_path(x_t, y_t, z_t, r_t,
                   tube_args, num_time_steps,
                   time_t=None,
                   slope_angle_t=None):
     """
-    Generates triangles one at a time for the path defined by x_t, y_t, z_t, and r_t
+    Returns a Mesh of the tube along the path defined by x_t, y_t, z_t, and r_t,
+    or a MeshStream if tube_args.stream_band_size is set
+    """
+    return compose_triangles(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
+                             tube_args=tube_args,
+                             num_time_steps=num_time_steps,
+                             time_t=time_t,
+                             slope_angle_t=slope_angle_t)
+
+# everything generate_path needs other than the tube arguments.
+# several tubes can be swept along the same Centerline
+Centerline = namedtuple('Centerline', ['x_t', 'y_t', 'z_t', 'r_t', 'num_time_steps',
+                                       'time_t', 'slope_angle_t'])
+
+def sweep_centerline(centerline, tube_args):
+    """
+    Returns the Mesh (or MeshStream) of a tube built with tube_args along the centerline
+    """
+    return generate_path(x_t=centerline.x_t, y_t=centerline.y_t, z_t=centerline.z_t, r_t=centerline.r_t,
+                         tube_args=tube_args,
+                         num_time_steps=centerline.num_time_steps,
+                         time_t=centerline.time_t,
+                         slope_angle_t=centerline.slope_angle_t)
+
+def chord_errors(points, first, last):
+    """
+    points is an array (time_step, track, xyz).  Returns, for each
+    time step strictly between first and last, the largest distance
+    from one of its points to the chord of the same track from first to last
+    """
+    start = points[first]
+    chord = points[last] - start
+    offsets = points[first+1:last] - start
+    length_squared = np.sum(chord * chord, axis=-1)
+    fraction = np.sum(offsets * chord, axis=-1) / np.where(length_squared > 0, length_squared, 1.0)
+    fraction = np.clip(fraction, 0.0, 1.0)
+    distance = offsets - fraction[..., None] * chord
+    return np.max(np.sqrt(np.sum(distance * distance, axis=-1)), axis=-1)
+
+def adaptive_time_steps(points, tolerance):
+    """
+    Greedily chooses which of the time steps to keep so that, for each
+    track of points, the ones dropped are within tolerance of the
+    chord between the kept time steps around them.
+
+    Returns the kept time steps, which always include the first and last
+    """
+    last_time_step = len(points) - 1
+    kept = [0]
+    first = 0
+    while first < last_time_step:
+        last = first + 1
+        while last < last_time_step and np.max(chord_errors(points, first, last + 1)) <= tolerance:
+            last = last + 1
+        kept.append(last)
+        first = last
+    return kept
+
+def adaptive_centerline(centerline, tube_radius, slope_angle, tolerance):
     """
-    vertex_list, triangle_list = compose_triangles(x_t=x_t, y_t=y_t, z_t=z_t, r_t=r_t,
-                                                   tube_args=tube_args,
-                                                   num_time_steps=num_time_steps,
-                                                   time_t=time_t,
-                                                   slope_angle_t=slope_angle_t)
-                
-    for left, right, top in triangle_list:
-        yield (vertex_list[left], vertex_list[right], vertex_list[top])
+    Returns a Centerline which only has rings where the tube turns.
+
+    The center of the path and the four points of a ring of radius
+    tube_radius to the sides, above and below it, are tracked at each
+    time step.  The heading from r_t turns the side points and the
+    slope tilts the upper and lower points, so a ring is kept wherever
+    dropping it would move the wall of the tube more than tolerance.
+
+    The new time steps are remapped piecewise linearly onto the kept
+    time steps of the original centerline, the same way
+    generate_hypotrochoid.rebalance_time remaps its ticks
+    """
+    num_time_steps = centerline.num_time_steps
+    time_steps = range(num_time_steps + 1)
+    center = np.array([(centerline.x_t(t), centerline.y_t(t), centerline.z_t(t)) for t in time_steps], dtype=np.float64)
+    rotation = np.array([centerline.r_t(t) for t in time_steps], dtype=np.float64) / 180 * math.pi
+    if centerline.slope_angle_t is None:
+        slope = np.full(num_time_steps + 1, slope_angle / 180 * math.pi)
+    else:
+        slope = np.array([centerline.slope_angle_t(t) for t in time_steps], dtype=np.float64) / 180 * math.pi
+
+    # same directions as the x_disp and vert_disp of the tube, after slope_tube and rotate_tube
+    side = np.stack([np.cos(rotation), np.sin(rotation), np.zeros_like(rotation)], axis=-1)
+    up = np.stack([-np.sin(slope) * np.sin(rotation), np.sin(slope) * np.cos(rotation), np.cos(slope)], axis=-1)
+    points = np.stack([center,
+                       center + side * tube_radius, center - side * tube_radius,
+                       center + up * tube_radius, center - up * tube_radius], axis=1)
+
+    tick_mapping = adaptive_time_steps(points, tolerance)
+    new_time_steps = len(tick_mapping) - 1
+    print("Adaptive time steps: %d of %d" % (new_time_steps, num_time_steps))
+
+    def remap_tick(t):
+        if t <= 0:
+            return tick_mapping[1] * t
+        if t >= new_time_steps:
+            return tick_mapping[new_time_steps] + (tick_mapping[new_time_steps] - tick_mapping[new_time_steps - 1]) * (t - new_time_steps)
+        segment = math.floor(t)
+        remainder = t - segment
+        if remainder == 0:
+            return tick_mapping[segment]
+        return tick_mapping[segment] + (tick_mapping[segment + 1] - tick_mapping[segment]) * remainder
+
+    def remapped(f_t):
+        if f_t is None:
+            return None
+        return lambda t: f_t(remap_tick(t))
+
+    # without a time_t, the tube angles are in time steps of the original centerline
+    time_t = remapped(centerline.time_t) if centerline.time_t is not None else remap_tick
+    return Centerline(x_t=remapped(centerline.x_t),
+                      y_t=remapped(centerline.y_t),
+                      z_t=remapped(centerline.z_t),
+                      r_t=remapped(centerline.r_t),
+                      num_time_steps=new_time_steps,
+                      time_t=time_t,
+                      slope_angle_t=remapped(centerline.slope_angle_t))
+
+def add_adaptive_args(parser):
+    parser.add_argument('--adaptive_tolerance', default=0.0, type=float,
+                        help='If set, drop the rings of the tube which are not needed to keep its walls within this many mm of the full num_time_steps.  Straight sections get few rings and tight turns keep all of them.  0 keeps every time step')
 
 def parse_eccentricity(e):
     """
@@ -583,6 +1561,8 @@ def add_tube_arguments(parser,
                         help='angle to the start of the ramp.  0 represents the part furthest from the axis, 180 represents closest to the axis, -90 represents the top of the ramp, 90 represents the bottom.  0..180 represents the bottom of a ramp with no cover.  -90..90 will look like a loop-d-loop')
     parser.add_argument('--tube_end_angle', default=180, type=lambda arg: marble_util.parse_float_or_tuple_tuple(arg, '--tube_end_angle'),
                         help='angle to the end of the ramp.  same values as tube_start_angle')
+    parser.add_argument('--tube_angle_resolution', default=0.0, type=float,
+                        help='If set, round tube_start_angle and tube_end_angle to a multiple of this when they change along the tube.  Fewer distinct angles means fewer tube shapes to calculate.  0 means no rounding')
     parser.add_argument('--tube_sides', default=64, type=int,
                         help='how many sides a complete tube would have.  tube_start_angle and tube_end_angle are discretized to these subdivisions')
     parser.add_argument('--tube_eccentricity', default=0.0, type=parse_eccentricity,
@@ -600,23 +1580,155 @@ def add_tube_arguments(parser,
     parser.add_argument('--slope_angle', default=default_slope_angle, type=float,
                         help='Angle to tilt the curve')
 
+    parser.add_argument('--arclength_substeps', default=ARCLENGTH_SUBSTEPS, type=int,
+                        help='How many segments per time step to use when calculating the arclength of the curve')
+
+    parser.add_argument('--mesh_engine', default=MeshEngine.SCALAR, type=lambda x: MeshEngine[x.upper()],
+                        help='How to calculate the vertices of the tube.  SCALAR calculates one vertex at a time.  NUMPY calculates the whole tube at once as arrays, which is much faster for large models.  The results are the same.')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='Number of processes to build the tube with.  The time steps are split into this many bands, which are stitched back together into the same model')
+    parser.add_argument('--stream_band_size', default=0, type=int,
+                        help='If positive, build and write the tube this many time steps at a time, so that only one band of the model is in memory.  Useful for very high resolution models.  Overrides --jobs')
+
     parser.add_argument('--output_name', default=default_output_name,
                         help='Where to put the stl')
+    parser.add_argument('--stl_format', default=StlFormat.ASCII, type=lambda x: StlFormat[x.upper()],
+                        help='Format of the stl file.  Options are {}.  BINARY is much smaller and faster to write'.format([i.name for i in StlFormat]))
+    parser.add_argument('--output_format', default=OutputFormat.STL, type=lambda x: OutputFormat[x.upper()],
+                        help='Format of the output file.  Options are {}.  OBJ and PLY store each vertex once, so they are much smaller than stl.  An output_name ending in .stl gets the matching extension'.format([i.name for i in OutputFormat]))
+    parser.add_argument('--no_cache', default=False, action='store_true',
+                        help="Always build the model, and don't save it in the model cache")
+    parser.add_argument('--cache_dir', default=os.path.join(os.path.expanduser('~'), '.cache', 'marble_path'),
+                        help='Where to keep previously built models.  A model built again with the same arguments and code is copied from here')
+    parser.add_argument('--cache_size', default=1024, type=float,
+                        help='Size in MB at which the least recently used models are deleted from the cache')
+    parser.add_argument('--profile', default=False, action='store_true',
+                        help='Record the time and peak memory of each stage and how often the path functions are called.  Written to a .profile.json next to the model.  Tracking the memory slows down the run')
+
+def write_binary_stl(mesh, filename):
+    """
+    Writes the mesh as a binary stl: an 80 byte header, the number of
+    facets, then 50 bytes per facet
 
-def write_stl(triangles, filename):
+    mesh can be a MeshStream, in which case each band is written as it
+    is built and the number of facets is filled in at the end
     """
-    Given a list of triangles, writes each facet to the given filename
+    num_facets = 0
+    with open(filename, "wb") as fout:
+        fout.write(b"\0" * 80)
+        fout.write(np.array([0], dtype='<u4').tobytes())
+        for band in mesh_bands(mesh):
+            facets = np.zeros(len(band), dtype=BINARY_STL_FACET)
+            # the normal is left as 0 0 0, same as the ascii files
+            facets['vertices'] = band.triangles()
+            facets.tofile(fout)
+            num_facets = num_facets + len(facets)
+        fout.seek(80)
+        fout.write(np.array([num_facets], dtype='<u4').tobytes())
+
+def write_ascii_stl(mesh, filename, chunk_size=ASCII_STL_CHUNK_SIZE):
+    """
+    Writes the mesh as an ascii stl, chunk_size facets at a time
+
+    Each chunk is formatted with one % operation on a repeated facet
+    template and written as a single string.  A MeshStream is
+    written one band at a time.
+
+    Coordinates are always written with exactly 4 decimal places, so
+    1 is written as 1.0000.  Trailing zeros are not trimmed, which
+    keeps the output identical to the files in test_files.
     """
     with open(filename, "w") as fout:
-        for triangle in triangles:
-            # facet normal of 0 0 0 is often used as a convention - processing program can figure it out
-            fout.write("facet normal 0 0 0\n")
-            fout.write(" outer loop\n")
-            for vertex in triangle:
-                vertex = tuple(["%.4f".rstrip("0").rstrip(".") % v for v in vertex])
-                fout.write("  vertex %s %s %s\n" % vertex)
-            fout.write(" endloop\n")
-            fout.write("endfacet\n")
+        for band in mesh_bands(mesh):
+            triangles = band.triangles().reshape(-1, 9)
+            for start in range(0, len(triangles), chunk_size):
+                chunk = triangles[start:start+chunk_size]
+                template = ASCII_STL_FACET * len(chunk)
+                fout.write(template % tuple(chunk.ravel().tolist()))
+
+def write_stl(triangles, filename, stl_format=StlFormat.ASCII):
+    """
+    Given a Mesh, a MeshStream or a list of triangles, writes each facet to the given filename
+    """
+    if not isinstance(triangles, (Mesh, MeshStream)):
+        triangles = Mesh.from_triangles(triangles)
+    if stl_format is StlFormat.BINARY:
+        write_binary_stl(triangles, filename)
+    else:
+        write_ascii_stl(triangles, filename)
+
+def write_obj(mesh, filename):
+    """
+    Writes the mesh as a Wavefront obj: the shared vertices, then the
+    faces as 1-based indices into the vertices.  A MeshStream is
+    written one band at a time, each band's new vertices followed by its faces
+    """
+    with open(filename, "w") as fout:
+        for vertices, faces in indexed_bands(mesh):
+            fout.write(("v %.4f %.4f %.4f\n" * len(vertices)) % tuple(vertices.ravel().tolist()))
+            fout.write(("f %d %d %d\n" * len(faces)) % tuple((faces + 1).ravel().tolist()))
+
+def write_ply(mesh, filename):
+    """
+    Writes the mesh as a binary little endian ply with the shared
+    vertices as float32 x, y, z and each face as a list of 3 vertex indices
+
+    The header needs the number of vertices and faces, so a MeshStream
+    is spooled to temporary files one band at a time and then copied in
+    """
+    with tempfile.TemporaryFile() as vertex_file, tempfile.TemporaryFile() as face_file:
+        num_vertices = 0
+        num_faces = 0
+        for band_vertices, band_faces in indexed_bands(mesh):
+            vertices = np.zeros(len(band_vertices), dtype=PLY_VERTEX)
+            vertices['x'], vertices['y'], vertices['z'] = band_vertices.T
+            faces = np.zeros(len(band_faces), dtype=PLY_FACE)
+            faces['count'] = 3
+            faces['vertex_indices'] = band_faces
+            vertex_file.write(vertices.tobytes())
+            face_file.write(faces.tobytes())
+            num_vertices = num_vertices + len(vertices)
+            num_faces = num_faces + len(faces)
+
+        header = ("ply\n"
+                  "format binary_little_endian 1.0\n"
+                  "element vertex %d\n"
+                  "property float x\n"
+                  "property float y\n"
+                  "property float z\n"
+                  "element face %d\n"
+                  "property list uchar int vertex_indices\n"
+                  "end_header\n") % (num_vertices, num_faces)
+        with open(filename, "wb") as fout:
+            fout.write(header.encode("ascii"))
+            for spool in (vertex_file, face_file):
+                spool.seek(0)
+                shutil.copyfileobj(spool, fout)
+
+def output_filename(output_name, output_format):
+    """
+    The default output names all end in .stl.  For the other formats,
+    swap that for the right extension
+    """
+    base, extension = os.path.splitext(output_name)
+    if output_format is not OutputFormat.STL and extension.lower() == '.stl':
+        return base + '.' + output_format.name.lower()
+    return output_name
+
+def write_output(mesh, args):
+    """
+    Writes the mesh to args.output_name in args.output_format.
+    stls are written in args.stl_format
+    """
+    output_format = getattr(args, 'output_format', OutputFormat.STL)
+    filename = output_filename(args.output_name, output_format)
+    if output_format is OutputFormat.OBJ:
+        write_obj(mesh, filename)
+    elif output_format is OutputFormat.PLY:
+        write_ply(mesh, filename)
+    else:
+        write_stl(mesh, filename, getattr(args, 'stl_format', StlFormat.ASCII))
+    return filename
 
 
 def print_args(args):
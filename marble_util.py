@@ -1,4 +1,5 @@
 import ast
+import bisect
 
 def parse_tuple_tuple(arg, name):
     overlap_tuple = ast.literal_eval(arg)
@@ -29,16 +30,89 @@ def parse_float_or_tuple_tuple(arg, name):
 def get_time_step(times, t):
     """
     Given a list mapping time step to actual t, return the time step closest to the desired t
+
+    times is assumed to be increasing.  Returns the last time step
+    whose t is <= the desired t, clamped to the ends of the list.
     """
-    # TODO: implement binary search?
+    if isinstance(times, TimeGrid):
+        return times.time_step(t)
     if times[0] > t:
         return 0
-    if times[-1] < t:
-        return len(times) - 1
-    for i in range(len(times)):
-        if times[i] <= t and times[i+1] > t:
-            return i
-    raise AssertionError("Oops")
+    return min(bisect.bisect_right(times, t) - 1, len(times) - 1)
+
+class TimeGrid:
+    """
+    Maps between time steps, the actual t at each time step, and
+    optionally the arclength at each time step.
+
+    Built once per path so that repeated lookups are a bisection
+    rather than a scan of the whole path.  times and arclengths must
+    both be increasing.
+    """
+    def __init__(self, times, arclengths=None):
+        self.times = list(times)
+        self.arclengths = None if arclengths is None else list(arclengths)
+        if self.arclengths is not None and len(self.arclengths) != len(self.times):
+            raise ValueError("Got %d arclengths for %d times" % (len(self.arclengths), len(self.times)))
+
+    @staticmethod
+    def from_time_t(time_t, num_time_steps, arclengths=None):
+        return TimeGrid([time_t(t) for t in range(num_time_steps+1)], arclengths)
+
+    def __len__(self):
+        return len(self.times)
+
+    def t(self, time_step):
+        """
+        The actual t at the given integer time step
+        """
+        return self.times[time_step]
+
+    def time_step(self, t):
+        """
+        The last time step at or before t, clamped to 0..len-1
+        """
+        return get_time_step(self.times, t)
+
+    def fractional_time_step(self, t):
+        """
+        The time step for t, linearly interpolated between the two nearest time steps
+        """
+        return interpolate_index(self.times, t)
+
+    def arclength_time_step(self, arclength):
+        """
+        The last time step at or before the given arclength, clamped to 0..len-1
+        """
+        return get_time_step(self.arclengths, arclength)
+
+    def fractional_arclength_time_step(self, arclength):
+        """
+        The time step for the given arclength, linearly interpolated
+        """
+        return interpolate_index(self.arclengths, arclength)
+
+def evaluate_times(f_t, times):
+    """
+    Returns [f_t(t) for t in times]
+
+    If f_t has an evaluate method, such as a
+    combine_functions.PiecewiseFunction, all of the times are handed
+    to it at once
+    """
+    if getattr(f_t, 'evaluate', None) is not None:
+        return f_t.evaluate(times)
+    return [f_t(t) for t in times]
+
+def interpolate_index(values, value):
+    """
+    Given an increasing list of values, returns the fractional index
+    where value would be, clamped to 0..len-1
+    """
+    index = get_time_step(values, value)
+    if index >= len(values) - 1 or values[index] >= value:
+        return float(index)
+    return index + (value - values[index]) / (values[index+1] - values[index])
 
 def simplify_float_to_string(value, decimals=8):
     template = "%." + str(decimals) + "f"
@@ -0,0 +1,154 @@
+"""
+An on-disk cache of generated models.
+
+A model is cached under a hash of the generator module, its arguments
+as printed by print_args, and the source of the geometry modules and
+the generator.  A second run of the same recipe copies the cached file to
+output_name instead of building the model again.
+
+The least recently used files are deleted once the cache is larger
+than --cache_size.  --no_cache skips the cache entirely.  The
+arguments are added by marble_path.add_tube_arguments.
+"""
+
+import functools
+import hashlib
+import importlib
+import os
+import shutil
+import types
+
+import marble_path
+import profiler
+
+# arguments which change how a model is built or where it goes, but
+# not the contents of the file
+IGNORED_ARGS = frozenset(['output_name', 'variants', 'no_cache', 'cache_dir', 'cache_size', 'profile'])
+
+# arguments which give exactly the same stl, but can number or order
+# the shared vertices of an obj or ply differently
+STL_IGNORED_ARGS = frozenset(['jobs', 'stream_band_size', 'mesh_engine'])
+
+# the modules which build the geometry of every model.  The source of
+# these and of the generator module makes up the source version
+GEOMETRY_MODULES = ('marble_path', 'build_shape', 'slope_function', 'combine_functions',
+                    'regularization', 'extend_function', 'marble_util')
+
+@functools.lru_cache(maxsize=None)
+def source_version(module_name):
+    """
+    A hash of the geometry modules, the generator module_name, and any
+    other generator it builds on, such as generate_tube for the basic
+    ramp.  Any change to the geometry code makes a new set of keys,
+    but the scripts which only run the generators do not
+    """
+    module = importlib.import_module(module_name)
+    generators = set([module_name])
+    generators.update(value.__name__ for value in vars(module).values()
+                      if isinstance(value, types.ModuleType) and value.__name__.startswith('generate_'))
+    digest = hashlib.sha256()
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in GEOMETRY_MODULES + tuple(sorted(generators)):
+        digest.update(name.encode("utf-8"))
+        with open(os.path.join(source_dir, name + ".py"), "rb") as fin:
+            digest.update(fin.read())
+    return digest.hexdigest()
+
+def normalize_args(args):
+    """
+    The arguments which affect the model file, one 'name: value' per
+    line, in the same format as print_args
+    """
+    ignored_args = IGNORED_ARGS
+    if getattr(args, 'output_format', marble_path.OutputFormat.STL) is marble_path.OutputFormat.STL:
+        ignored_args = ignored_args | STL_IGNORED_ARGS
+    args = vars(args)
+    return "\n".join('%s: %s' % (k, args[k]) for k in sorted(args.keys()) if k not in ignored_args)
+
+def cache_key(module_name, args):
+    digest = hashlib.sha256()
+    digest.update(module_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_args(args).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(source_version(module_name).encode("utf-8"))
+    return digest.hexdigest()
+
+def evict(cache_dir, cache_size):
+    """
+    Delete the least recently used files until the cache is at most cache_size bytes.
+
+    Other processes can be writing or evicting in the same cache_dir,
+    so their .partial files are left alone, and a file which is
+    already gone is skipped
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".partial"):
+            continue
+        try:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            continue
+    entries.sort()
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total_size <= cache_size:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total_size = total_size - size
+
+def write_output(module, args, generate):
+    """
+    Writes the model from generate() to args.output_name, the same as
+    marble_path.write_output, unless the same model is in the cache.
+
+    module is the generator module and generate is a function
+    returning the Mesh.  Returns the name of the file written
+    """
+    output_format = getattr(args, 'output_format', marble_path.OutputFormat.STL)
+    filename = marble_path.output_filename(args.output_name, output_format)
+    with profiler.profiling(args, filename):
+        if getattr(args, 'no_cache', True):
+            return generate_and_write(args, generate)
+
+        module_name = os.path.splitext(os.path.basename(module.__file__))[0]
+        key = cache_key(module_name, args)
+        cache_file = os.path.join(args.cache_dir, key + os.path.splitext(filename)[1])
+
+        if os.path.exists(cache_file):
+            try:
+                with profiler.stage("cache_hit"):
+                    shutil.copyfile(cache_file, filename)
+            except FileNotFoundError:
+                # another process evicted it after the check, so build it again
+                pass
+            else:
+                print("Using cached model %s" % cache_file)
+                # mark it as recently used
+                try:
+                    os.utime(cache_file)
+                except FileNotFoundError:
+                    pass
+                return filename
+
+        filename = generate_and_write(args, generate)
+        os.makedirs(args.cache_dir, exist_ok=True)
+        # copy under a temporary name first, so that another process
+        # never sees a partial file
+        partial_file = cache_file + ".%d.partial" % os.getpid()
+        shutil.copyfile(filename, partial_file)
+        os.replace(partial_file, cache_file)
+        evict(args.cache_dir, args.cache_size * 1024 * 1024)
+        return filename
+
+def generate_and_write(args, generate):
+    with profiler.stage("generate"):
+        mesh = generate()
+    with profiler.stage("write_output"):
+        return marble_path.write_output(mesh, args)
@@ -0,0 +1,119 @@
+"""
+Compares two meshes vertex for vertex within a tolerance, instead of
+byte for byte.
+
+The gold files are ascii stls with 4 decimal places, so any change to
+the order of the arithmetic can flip the last digit of a coordinate
+without changing the shape.  This reads both files into arrays of
+triangles, ascii or binary stl, obj, or ply, and checks that every
+vertex is within epsilon of the same vertex in the other file.
+
+python mesh_compare.py test_files/basic_ramp.stl ramp.stl --epsilon 1e-4
+"""
+
+import argparse
+import os
+import re
+import sys
+
+from collections import namedtuple
+
+import numpy as np
+
+import marble_path
+
+# the largest difference between two meshes with the same number of
+# triangles.  facet and vertex say where it is, and num_over_epsilon
+# is how many vertices are further apart than epsilon
+MeshDifference = namedtuple('MeshDifference', ['max_deviation', 'facet', 'vertex', 'expected', 'result',
+                                               'num_over_epsilon', 'epsilon'])
+
+def read_triangles(filename):
+    """
+    Returns an (N, 3, 3) array of the triangles in an stl, obj, or ply file
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".obj":
+        with open(filename) as fin:
+            lines = [line.split() for line in fin]
+        vertices = np.array([line[1:4] for line in lines if line and line[0] == 'v'], dtype=np.float64)
+        faces = np.array([line[1:4] for line in lines if line and line[0] == 'f'], dtype=np.int64).reshape(-1, 3) - 1
+        return vertices[faces]
+
+    with open(filename, "rb") as fin:
+        data = fin.read()
+    if extension == ".ply":
+        header, body = data.split(b"end_header\n", 1)
+        num_vertices = int(re.search(rb"element vertex (\d+)", header).group(1))
+        vertices = np.frombuffer(body, dtype=marble_path.PLY_VERTEX, count=num_vertices)
+        vertices = np.stack([vertices['x'], vertices['y'], vertices['z']], axis=-1).astype(np.float64)
+        faces = np.frombuffer(body, dtype=marble_path.PLY_FACE, offset=num_vertices * marble_path.PLY_VERTEX.itemsize)
+        return vertices[faces['vertex_indices']]
+
+    if len(data) >= 84:
+        num_facets = int.from_bytes(data[80:84], "little")
+        if len(data) == 84 + 50 * num_facets:
+            facets = np.frombuffer(data, dtype=marble_path.BINARY_STL_FACET, offset=84)
+            return facets['vertices'].astype(np.float64)
+    vertices = [line.split()[1:] for line in data.decode("ascii").split("\n")
+                if line.lstrip().startswith("vertex")]
+    return np.array(vertices, dtype=np.float64).reshape(-1, 3, 3)
+
+def compare_triangles(expected, result, epsilon):
+    """
+    Compares two (N, 3, 3) arrays of triangles.
+
+    Returns a MeshDifference, or raises ValueError if they do not have
+    the same number of triangles
+    """
+    if expected.shape != result.shape:
+        raise ValueError("Expected %d triangles, got %d" % (len(expected), len(result)))
+    if len(expected) == 0:
+        return MeshDifference(0.0, None, None, None, None, 0, epsilon)
+    deviations = np.linalg.norm(result - expected, axis=-1)
+    facet, vertex = np.unravel_index(np.argmax(deviations), deviations.shape)
+    return MeshDifference(max_deviation=float(deviations[facet, vertex]),
+                          facet=int(facet),
+                          vertex=int(vertex),
+                          expected=tuple(expected[facet, vertex]),
+                          result=tuple(result[facet, vertex]),
+                          num_over_epsilon=int(np.count_nonzero(deviations > epsilon)),
+                          epsilon=epsilon)
+
+def compare_files(expected_file, result_file, epsilon):
+    return compare_triangles(read_triangles(expected_file), read_triangles(result_file), epsilon)
+
+def describe_difference(difference):
+    if difference.facet is None:
+        return "No triangles to compare"
+    description = ("Max deviation %.3g at facet %d vertex %d: expected (%.6f, %.6f, %.6f), got (%.6f, %.6f, %.6f)" %
+                   ((difference.max_deviation, difference.facet, difference.vertex) +
+                    difference.expected + difference.result))
+    if difference.num_over_epsilon:
+        description = description + ".  %d vertices are further apart than %g" % (difference.num_over_epsilon, difference.epsilon)
+    return description
+
+def parse_args(sys_args=None):
+    parser = argparse.ArgumentParser(description='Compare two meshes within a tolerance.')
+    parser.add_argument('expected', help='The mesh to compare against')
+    parser.add_argument('result', help='The mesh to check')
+    parser.add_argument('--epsilon', default=1e-4, type=float,
+                        help='How far apart, in mm, the same vertex can be in the two meshes')
+    return parser.parse_args(args=sys_args)
+
+def main(sys_args=None):
+    """
+    Returns True if every vertex is within epsilon
+    """
+    args = parse_args(sys_args)
+    try:
+        difference = compare_files(args.expected, args.result, args.epsilon)
+    except ValueError as e:
+        print(e)
+        return False
+    print(describe_difference(difference))
+    return difference.num_over_epsilon == 0
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
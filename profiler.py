@@ -0,0 +1,178 @@
+"""
+Wall time, peak memory and function call counts for one run, enabled
+with --profile.
+
+The stages are nested, so the report shows, for example, how much of
+generate is the centerline and how much of the centerline is
+slope_function.  Peak memory comes from tracemalloc, which slows down
+the run while profiling.  The report is written as json next to the
+model, such as ramp.profile.json for ramp.stl.
+
+When a MeshStream is written, the tube is meshed while it is written,
+so that time shows up in write_output instead of generate_path.
+With --jobs, each worker counts its own band with worker_counts and
+the counts are added back into the run with add_counts.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import time
+import tracemalloc
+
+MB = 1024 * 1024
+
+# the Profile of the current run, or None if not profiling
+_profile = None
+
+class Profile:
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.stages = []
+        # the open stages, each [stage dict, peak memory so far]
+        self.stack = []
+        self.counts = collections.Counter()
+        self.peak_memory = 0
+
+    def update_peak(self, peak):
+        self.peak_memory = max(self.peak_memory, peak)
+        if self.stack:
+            self.stack[-1][1] = max(self.stack[-1][1], peak)
+
+    def report(self):
+        self.update_peak(tracemalloc.get_traced_memory()[1])
+        return {
+            "seconds": time.perf_counter() - self.start_time,
+            "peak_memory_mb": self.peak_memory / MB,
+            "stages": self.stages,
+            "counts": dict(sorted(self.counts.items())),
+        }
+
+class CountedFunction:
+    """
+    Counts the calls to f_t.  If f_t has an evaluate method, so does
+    this, so marble_util.evaluate_times still hands over all the times at once
+    """
+    def __init__(self, name, f_t, counts):
+        self.name = name
+        self.f_t = f_t
+        self.counts = counts
+        if getattr(f_t, 'evaluate', None) is not None:
+            self.evaluate = self._evaluate
+
+    def __call__(self, *args, **kwargs):
+        self.counts[self.name] += 1
+        return self.f_t(*args, **kwargs)
+
+    def _evaluate(self, times):
+        self.counts[self.name] += len(times)
+        return self.f_t.evaluate(times)
+
+def counted(name, f_t):
+    """
+    Returns f_t wrapped so that its calls are counted under name,
+    or f_t itself if not profiling
+    """
+    if _profile is None:
+        return f_t
+    return CountedFunction(name, f_t, _profile.counts)
+
+def count(name, num=1):
+    if _profile is not None:
+        _profile.counts[name] += num
+
+def is_profiling():
+    return _profile is not None
+
+def add_counts(counts):
+    """
+    Adds counts from another process, such as worker_counts, to this run
+    """
+    if _profile is not None and counts:
+        _profile.counts.update(counts)
+
+@contextlib.contextmanager
+def worker_counts(enabled):
+    """
+    In a worker process, counts the calls in the with block so that
+    they can be sent back with its result.  Yields the Counter, or
+    None if not enabled
+    """
+    global _profile
+    if not enabled:
+        yield None
+        return
+
+    previous = _profile
+    _profile = Profile()
+    try:
+        yield _profile.counts
+    finally:
+        _profile = previous
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Records the time and peak memory of everything in the with block
+    """
+    profile = _profile
+    if profile is None:
+        yield
+        return
+
+    current, peak = tracemalloc.get_traced_memory()
+    profile.update_peak(peak)
+    tracemalloc.reset_peak()
+    path = "/".join([entry["stage"] for entry, _ in profile.stack[-1:]] + [name])
+    entry = {"stage": path}
+    # added now so that the stages are in the order they started
+    profile.stages.append(entry)
+    profile.stack.append([entry, current])
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry["seconds"] = time.perf_counter() - start_time
+        _, peak = profile.stack.pop()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        entry["peak_memory_mb"] = peak / MB
+        profile.update_peak(peak)
+
+def report_filename(filename):
+    return os.path.splitext(filename)[0] + ".profile.json"
+
+def print_report(report):
+    print("Profile: %.4fs, peak memory %.2f MB" % (report["seconds"], report["peak_memory_mb"]))
+    for entry in report["stages"]:
+        print("  %-60s %10.4fs %10.2f MB" % (entry["stage"], entry["seconds"], entry["peak_memory_mb"]))
+    for name, num in report["counts"].items():
+        print("  %-20s %d calls" % (name, num))
+
+@contextlib.contextmanager
+def profiling(args, filename):
+    """
+    Profiles the with block if args.profile is set, then writes the
+    report for the model in filename.
+
+    If a run is already being profiled, such as the variants in
+    build_shape.write_variants, the block is part of that run instead
+    """
+    global _profile
+    if not getattr(args, 'profile', False) or _profile is not None:
+        yield
+        return
+
+    tracemalloc.start()
+    _profile = Profile()
+    try:
+        yield
+    finally:
+        report = _profile.report()
+        _profile = None
+        tracemalloc.stop()
+        report["output"] = filename
+        with open(report_filename(filename), "w") as fout:
+            json.dump(report, fout, indent=2)
+        print_report(report)
+        print("Profile written to %s" % report_filename(filename))
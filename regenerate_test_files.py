@@ -2,6 +2,7 @@ import contextlib
 import io
 import sys
 
+import golden_files
 from test_generations import TESTS
 
 def rebuild(filename):
@@ -22,6 +23,7 @@ def main():
             args = ['--output_name', test.gold_file] + test.args
             with contextlib.redirect_stdout(io.StringIO()) as stdout:
                 test.model.main(args)
+    golden_files.update_digests(sorted(set(test.gold_file for test in TESTS)))
 
 if __name__ == '__main__':
     main()
@@ -56,6 +56,14 @@ def radial_reg_factor(regularization, regularization_radius):
         return reg
     return factor
 
+def radial_reg_factor_derivative(regularization, regularization_radius):
+    def factor_derivative(length):
+        if length < regularization_radius:
+            return 0.0
+        denominator = regularization * (length - regularization_radius) + 1
+        return -regularization / (denominator * denominator)
+    return factor_derivative
+
 def capped_linear_factor(reg_args):
     cap = reg_args.regularization_linear_cap
     cap_begin = cap * math.sqrt(2)
@@ -70,6 +78,21 @@ def capped_linear_factor(reg_args):
             return math.sqrt(cap * cap - remainder * remainder) / length
     return factor
 
+def capped_linear_factor_derivative(reg_args):
+    cap = reg_args.regularization_linear_cap
+    cap_begin = cap * math.sqrt(2)
+    linear_end = cap_begin / 2
+    def factor_derivative(length):
+        if length >= cap_begin:
+            return -cap / (length * length)
+        elif length <= linear_end:
+            return 0.0
+        else:
+            remainder = cap_begin - length
+            root = math.sqrt(cap * cap - remainder * remainder)
+            return remainder / root / length - root / (length * length)
+    return factor_derivative
+
 def hyperbolic_function_string(reg_args):
     x_trans = reg_args.regularization_x_trans
     y_trans = reg_args.regularization_y_trans
@@ -113,6 +136,21 @@ def hyperbolic_factor(reg_args):
 
     return factor
 
+def hyperbolic_factor_derivative(reg_args):
+    x_trans = reg_args.regularization_x_trans
+    y_trans = reg_args.regularization_y_trans
+    slope = reg_args.regularization_slope
+    inv_slope_sq = 1 / (slope * slope)
+
+    def factor_derivative(length):
+        x = length - x_trans
+        root = math.sqrt(inv_slope_sq + 0.25 * x * x)
+        y = slope * (0.5 * x + root) + y_trans
+        dy = slope * (0.5 + 0.25 * x / root)
+        return dy / length - y / (length * length)
+
+    return factor_derivative
+
 def logistic_function_string(reg_args):
     x_trans = reg_args.regularization_x_trans
     y_trans = reg_args.regularization_y_trans
@@ -164,6 +202,21 @@ def logistic_factor(reg_args):
 
     return factor
 
+def logistic_factor_derivative(reg_args):
+    x_trans = reg_args.regularization_x_trans
+    y_trans = reg_args.regularization_y_trans
+    x_scale = reg_args.regularization_x_scale
+    y_scale = reg_args.regularization_y_scale
+
+    def factor_derivative(length):
+        x = x_scale * length - x_trans
+        sigmoid = 1 / (1 + math.exp(-x))
+        y = y_scale * sigmoid + y_trans
+        dy = y_scale * sigmoid * (1 - sigmoid) * x_scale
+        return dy / length - y / (length * length)
+
+    return factor_derivative
+
 def regularized_function(f1_t, f2_t, factor):
     def reg_f_t(time_step):
         x = f1_t(time_step)
@@ -172,6 +225,22 @@ def regularized_function(f1_t, f2_t, factor):
         return x * factor(length)
     return reg_f_t
 
+def regularized_derivative(f1_t, f2_t, df1_t, df2_t, factor, factor_derivative):
+    """
+    The derivative of regularized_function(f1_t, f2_t, factor)
+    """
+    def reg_df_t(time_step):
+        x = f1_t(time_step)
+        y = f2_t(time_step)
+        dx = df1_t(time_step)
+        dy = df2_t(time_step)
+        length = math.sqrt(x * x + y * y)
+        if length == 0:
+            return dx * factor(length)
+        dlength = (x * dx + y * dy) / length
+        return dx * factor(length) + x * factor_derivative(length) * dlength
+    return reg_df_t
+
 def describe_regularization(reg_args):
     if reg_args.regularization_method is Regularization.INVERSE_QUADRATIC:
         print("Inverse quadratic regularization")
@@ -212,3 +281,40 @@ def regularize(x_t, y_t, reg_args):
         raise ValueError("Regularization method {} not implemented".reg_args.regularization_method)
 
     return reg_x_t, reg_y_t
+
+def regularize_derivatives(x_t, y_t, dx_t, dy_t, reg_args):
+    """
+    Returns the derivatives of the two functions produced by regularize(x_t, y_t, reg_args)
+    """
+    if reg_args.regularization_method is Regularization.INVERSE_QUADRATIC:
+        regularization_radius = reg_args.regularization_radius
+        regularization = reg_args.regularization
+        reg_dx_t = regularized_derivative(x_t, y_t, dx_t, dy_t,
+                                          radial_reg_factor(regularization, regularization_radius),
+                                          radial_reg_factor_derivative(regularization, regularization_radius))
+        regularization = reg_args.regularization + reg_args.y_regularization
+        reg_dy_t = regularized_derivative(y_t, x_t, dy_t, dx_t,
+                                          radial_reg_factor(regularization, regularization_radius),
+                                          radial_reg_factor_derivative(regularization, regularization_radius))
+    elif reg_args.regularization_method is Regularization.CAPPED_LINEAR:
+        factor = capped_linear_factor(reg_args)
+        factor_derivative = capped_linear_factor_derivative(reg_args)
+        reg_dx_t = regularized_derivative(x_t, y_t, dx_t, dy_t, factor, factor_derivative)
+        reg_dy_t = regularized_derivative(y_t, x_t, dy_t, dx_t, factor, factor_derivative)
+    elif reg_args.regularization_method is Regularization.HYPERBOLIC:
+        factor = hyperbolic_factor(reg_args)
+        factor_derivative = hyperbolic_factor_derivative(reg_args)
+        reg_dx_t = regularized_derivative(x_t, y_t, dx_t, dy_t, factor, factor_derivative)
+        reg_dy_t = regularized_derivative(y_t, x_t, dy_t, dx_t, factor, factor_derivative)
+    elif reg_args.regularization_method is Regularization.LOGISTIC:
+        factor = logistic_factor(reg_args)
+        factor_derivative = logistic_factor_derivative(reg_args)
+        reg_dx_t = regularized_derivative(x_t, y_t, dx_t, dy_t, factor, factor_derivative)
+        reg_dy_t = regularized_derivative(y_t, x_t, dy_t, dx_t, factor, factor_derivative)
+    elif reg_args.regularization_method is None:
+        reg_dx_t = dx_t
+        reg_dy_t = dy_t
+    else:
+        raise ValueError("Regularization method {} not implemented".format(reg_args.regularization_method))
+
+    return reg_dx_t, reg_dy_t
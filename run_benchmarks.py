@@ -0,0 +1,224 @@
+"""
+Runs every generator at production resolution and compares the
+results with saved baselines.
+
+The scenarios in benchmarks/scenarios.json are the recipes from the
+docstrings of the generators, at their default number of time steps
+and tube sides.  Each one is run in a new process, so that its peak
+RSS is its own and nothing is shared between runs, with --no_cache so
+that the model is actually built.  The wall time of main() is
+measured inside that process, so interpreter startup and imports are
+not counted.
+
+For each scenario this records the wall time, the number of triangles,
+triangles per second and peak RSS.  With --repeat, the fastest run is
+kept.  A scenario regresses if its time or peak RSS is more than
+--threshold above the baseline, in which case this exits with 1.
+Times within --min_seconds of the baseline are never a regression.
+
+python run_benchmarks.py
+python run_benchmarks.py --only hypo --repeat 3
+python run_benchmarks.py --update_baselines
+
+The baselines depend on the machine, so update them on the machine
+which will be checking them.
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import run_recipes
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+# the metrics which regress when they go up
+CHECKED_METRICS = ("seconds", "peak_rss_mb")
+
+def load_scenarios(filename):
+    with open(filename) as fin:
+        scenarios = json.load(fin)
+    if isinstance(scenarios, dict):
+        scenarios = scenarios["scenarios"]
+    for index, scenario in enumerate(scenarios):
+        for field in ("name", "generator"):
+            if field not in scenario:
+                raise ValueError("Scenario %d is missing %s" % (index, field))
+    return scenarios
+
+def count_triangles(filename):
+    """
+    The number of triangles in an ascii or binary stl, obj, or ply
+    """
+    with open(filename, "rb") as fin:
+        data = fin.read()
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".ply":
+        return int(re.search(rb"element face (\d+)", data).group(1))
+    if extension == ".obj":
+        return sum(1 for line in data.splitlines() if line.startswith(b"f "))
+    if len(data) >= 84:
+        num_facets = int.from_bytes(data[80:84], "little")
+        if len(data) == 84 + 50 * num_facets:
+            return num_facets
+    return data.count(b"facet normal")
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on linux and bytes on mac
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak_rss / 1024 / 1024
+    return peak_rss / 1024
+
+def measure(scenario, output_dir):
+    """
+    Runs the scenario in this process.  Returns the time, size and peak RSS of the run
+    """
+    module = importlib.import_module(scenario["generator"])
+    output = os.path.join(output_dir, scenario["name"] + ".stl")
+    args = run_recipes.recipe_args(scenario) + ['--output_name', output, '--no_cache']
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        filename = module.main(sys_args=args)
+        seconds = time.perf_counter() - start_time
+    triangles = count_triangles(filename)
+    os.unlink(filename)
+    return {
+        "seconds": seconds,
+        "triangles": triangles,
+        "triangles_per_second": triangles / seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_scenario(scenario, output_dir, repeat):
+    """
+    Runs the scenario repeat times, each in its own process, and keeps the fastest run
+    """
+    runs = []
+    for _ in range(repeat):
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--measure', json.dumps(scenario), '--output_dir', output_dir]
+        process = subprocess.run(command, capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+        if process.returncode != 0:
+            raise RuntimeError("Scenario %s failed:\n%s" % (scenario["name"], process.stderr))
+        runs.append(json.loads(process.stdout.strip().split("\n")[-1]))
+    return min(runs, key=lambda run: run["seconds"])
+
+def compare(results, baselines, threshold, min_seconds=0.0):
+    """
+    Returns a list of the regressions: each metric in CHECKED_METRICS
+    which is more than threshold above its baseline.
+
+    Scenarios which take a fraction of a second are noisy, so a time
+    only regresses if it is also at least min_seconds slower
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        for metric in CHECKED_METRICS:
+            if metric == "seconds" and result[metric] - baseline[metric] < min_seconds:
+                continue
+            if result[metric] > baseline[metric] * (1 + threshold):
+                regressions.append("%s: %s went from %.4f to %.4f" % (name, metric, baseline[metric], result[metric]))
+    return regressions
+
+def machine():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def print_result(name, result, baseline):
+    line = "%-28s %9.3fs %10d tris %12.0f tris/s %8.1f MB" % (name, result["seconds"], result["triangles"],
+                                                              result["triangles_per_second"], result["peak_rss_mb"])
+    if baseline is not None:
+        line = line + "   (baseline %.3fs, %.1f MB)" % (baseline["seconds"], baseline["peak_rss_mb"])
+        if baseline["triangles"] != result["triangles"]:
+            line = line + "  triangles changed from %d" % baseline["triangles"]
+    print(line)
+
+def parse_args(sys_args=None):
+    parser = argparse.ArgumentParser(description='Benchmark the generators against saved baselines.')
+    parser.add_argument('--scenarios', default=os.path.join(BENCHMARK_DIR, "scenarios.json"),
+                        help='json file with a list of {name, generator, args}')
+    parser.add_argument('--baselines', default=os.path.join(BENCHMARK_DIR, "baselines.json"),
+                        help='json file with the results to compare against')
+    parser.add_argument('--only', default=None, nargs='+',
+                        help='Only run the scenarios whose names contain one of these')
+    parser.add_argument('--repeat', default=1, type=int,
+                        help='Run each scenario this many times and keep the fastest')
+    parser.add_argument('--threshold', default=0.25, type=float,
+                        help='Fail if the time or peak RSS of a scenario is more than this fraction above its baseline')
+    parser.add_argument('--min_seconds', default=0.1, type=float,
+                        help='Ignore a slower time if it is less than this many seconds slower than the baseline')
+    parser.add_argument('--update_baselines', default=False, action='store_true',
+                        help='Save these results as the baselines instead of comparing with them')
+    parser.add_argument('--results', default=None,
+                        help='Also write the results to this json file')
+    # used by run_scenario to run one scenario in a new process
+    parser.add_argument('--measure', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--output_dir', default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(args=sys_args)
+
+def main(sys_args=None):
+    """
+    Returns the results and the list of regressions
+    """
+    args = parse_args(sys_args)
+    if args.measure is not None:
+        print(json.dumps(measure(json.loads(args.measure), args.output_dir)))
+        return None, []
+
+    scenarios = load_scenarios(args.scenarios)
+    if args.only:
+        scenarios = [scenario for scenario in scenarios
+                     if any(only in scenario["name"] for only in args.only)]
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as fin:
+            baselines = json.load(fin)["scenarios"]
+    else:
+        baselines = {}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for scenario in scenarios:
+            results[scenario["name"]] = run_scenario(scenario, output_dir, args.repeat)
+            print_result(scenario["name"], results[scenario["name"]], baselines.get(scenario["name"]))
+
+    if args.results:
+        with open(args.results, "w") as fout:
+            json.dump({"machine": machine(), "scenarios": results}, fout, indent=2)
+
+    if args.update_baselines:
+        # keep the baselines of any scenarios which were not run
+        baselines.update(results)
+        with open(args.baselines, "w") as fout:
+            json.dump({"machine": machine(), "scenarios": baselines}, fout, indent=2, sort_keys=True)
+        print("Baselines written to %s" % args.baselines)
+        return results, []
+
+    regressions = compare(results, baselines, args.threshold, args.min_seconds)
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+    print("%d scenarios, %d regressions" % (len(results), len(regressions)))
+    return results, regressions
+
+if __name__ == '__main__':
+    results, regressions = main()
+    if regressions:
+        sys.exit(1)
@@ -0,0 +1,170 @@
+"""
+Runs a batch of generator invocations, such as all of the pieces of
+one marble run, in a pool of processes.
+
+The recipe file is json, or toml if its name ends in .toml.  It has a
+list of recipes, each of which names a generator module, the
+arguments to give it, and where to write the model:
+
+{"recipes": [
+  {"generator": "generate_hypotrochoid",
+   "args": "--hypoA 9 --hypoB 3 --hypoC 6 --start_t 1.0472 --scale 10 --tube_end_angle 240 --slope_angle 12 --regularization 0.07",
+   "output": "flower_ramp.stl"},
+  {"generator": "generate_hypotrochoid",
+   "args": ["--hypoA", "9", "--hypoB", "3", "--hypoC", "6", "--start_t", "1.0472", "--scale", "10",
+            "--tube_end_angle", "360", "--slope_angle", "12", "--regularization", "0.07"],
+   "output": "flower_tunnels.stl"}
+]}
+
+args can be a single string or a list of strings.  Each run's
+output, including the stats the generators print, is captured and
+saved in a json manifest along with the time it took and any error.
+
+python run_recipes.py recipes/hypotrochoid_three_leaf.json --jobs 4
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import importlib
+import io
+import json
+import os
+import shlex
+import sys
+import time
+import tomllib
+import traceback
+
+def available_generators():
+    """
+    The generate_* modules in this directory
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return sorted(os.path.splitext(os.path.basename(filename))[0]
+                  for filename in glob.glob(os.path.join(directory, "generate_*.py")))
+
+def load_recipes(filename):
+    """
+    Returns the list of recipes in a json or toml file.  The file can
+    either be a list of recipes or have the list under "recipes"
+    """
+    if filename.endswith(".toml"):
+        with open(filename, "rb") as fin:
+            recipes = tomllib.load(fin)
+    else:
+        with open(filename) as fin:
+            recipes = json.load(fin)
+    if isinstance(recipes, dict):
+        recipes = recipes["recipes"]
+    for index, recipe in enumerate(recipes):
+        for field in ("generator", "output"):
+            if field not in recipe:
+                raise ValueError("Recipe %d is missing %s" % (index, field))
+    return recipes
+
+def recipe_args(recipe):
+    args = recipe.get("args", [])
+    if isinstance(args, str):
+        args = shlex.split(args)
+    return [str(arg) for arg in args]
+
+def import_generators(generators):
+    """
+    Run once in each worker, so the generators are only imported once per process
+    """
+    for generator in generators:
+        importlib.import_module(generator)
+
+def run_recipe(index, recipe, output_dir):
+    """
+    Runs one recipe, capturing everything it prints.
+
+    Returns a dict describing the run for the manifest
+    """
+    args = recipe_args(recipe)
+    output = os.path.join(output_dir, recipe["output"])
+    result = {
+        "index": index,
+        "generator": recipe["generator"],
+        "args": args,
+        "output": output,
+    }
+    stdout = io.StringIO()
+    start_time = time.perf_counter()
+    try:
+        if recipe["generator"] not in available_generators():
+            raise ValueError("Unknown generator %s.  Options are %s" % (recipe["generator"], available_generators()))
+        module = importlib.import_module(recipe["generator"])
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stdout):
+            filename = module.main(sys_args=args + ['--output_name', output])
+        # a generator with an older main might not return the file it wrote
+        result["output"] = filename if filename is not None else output
+        result["status"] = "ok"
+        result["size"] = os.path.getsize(result["output"])
+    except (Exception, SystemExit):
+        # argparse errors are a SystemExit
+        result["status"] = "failed"
+        result["error"] = traceback.format_exc()
+    result["seconds"] = time.perf_counter() - start_time
+    result["stdout"] = stdout.getvalue()
+    return result
+
+def run_recipes(recipes, output_dir, jobs):
+    """
+    Runs all of the recipes in a pool of jobs processes.  Returns the results in recipe order
+    """
+    generators = sorted(set(recipe["generator"] for recipe in recipes) & set(available_generators()))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                initializer=import_generators,
+                                                initargs=(generators,)) as executor:
+        futures = [executor.submit(run_recipe, index, recipe, output_dir)
+                   for index, recipe in enumerate(recipes)]
+        results = []
+        for future in futures:
+            result = future.result()
+            print("%-4s %-24s %8.2fs  %s" % (result["status"], result["generator"], result["seconds"], result["output"]))
+            results.append(result)
+    return results
+
+def parse_args(sys_args=None):
+    parser = argparse.ArgumentParser(description='Run a batch of generators from a recipe file.')
+    parser.add_argument('recipe_file',
+                        help='json or toml file with a list of {generator, args, output}')
+    parser.add_argument('--jobs', default=os.cpu_count(), type=int,
+                        help='Number of recipes to run at once')
+    parser.add_argument('--output_dir', default='.',
+                        help='Directory for the outputs, unless they are absolute paths')
+    parser.add_argument('--manifest', default=None,
+                        help='Where to write the json summary of the runs.  Defaults to the recipe file with .manifest.json')
+    args = parser.parse_args(args=sys_args)
+    if args.manifest is None:
+        args.manifest = os.path.splitext(args.recipe_file)[0] + ".manifest.json"
+    return args
+
+def main(sys_args=None):
+    """
+    Returns the manifest, which is also written to args.manifest
+    """
+    args = parse_args(sys_args)
+    recipes = load_recipes(args.recipe_file)
+
+    start_time = time.perf_counter()
+    results = run_recipes(recipes, args.output_dir, args.jobs)
+    manifest = {
+        "recipe_file": args.recipe_file,
+        "jobs": args.jobs,
+        "seconds": time.perf_counter() - start_time,
+        "succeeded": sum(result["status"] == "ok" for result in results),
+        "failed": sum(result["status"] != "ok" for result in results),
+        "runs": results,
+    }
+    with open(args.manifest, "w") as fout:
+        json.dump(manifest, fout, indent=2)
+    print("%d succeeded, %d failed.  Manifest written to %s" % (manifest["succeeded"], manifest["failed"], args.manifest))
+    return manifest
+
+if __name__ == '__main__':
+    if main()["failed"]:
+        sys.exit(1)
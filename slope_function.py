@@ -1,6 +1,8 @@
 import ast
 import math
 
+import numpy as np
+
 import marble_path
 import marble_util
 
@@ -24,26 +26,138 @@ def get_drop(arclengths, min_angle, max_angle, start_time_step, end_time_step):
     #print("Total drop for angle", max_angle, "is", total_drop)
     return total_drop
 
+def drop_function(arclengths, min_angle, start_time_step, end_time_step):
+    """
+    Returns a function max_angle -> total drop for the span, equivalent to get_drop
+
+    The segments in the middle of the span all use max_angle, so their
+    length comes straight from the arclength prefix sums.  The ramps
+    at either end are evaluated as arrays, so each call is a couple
+    of numpy operations rather than a loop over the span.
+    """
+    delta_time_step = end_time_step - start_time_step
+    time_steps = np.arange(delta_time_step)
+    lengths = np.diff(np.asarray(arclengths[start_time_step:end_time_step+1], dtype=np.float64))
+
+    ramp_up = time_steps < delta_time_step * 0.2
+    ramp_down = time_steps > delta_time_step * 0.8
+    flat = ~(ramp_up | ramp_down)
+    # fraction of the way from min_angle to max_angle on each ramp segment
+    ramp = ramp_up | ramp_down
+    fraction = np.where(ramp_up, time_steps, delta_time_step - time_steps)[ramp] / (delta_time_step * 0.2)
+    ramp_lengths = lengths[ramp]
+    if flat.any():
+        # the flat segments are contiguous, so this is a single prefix sum difference
+        flat_steps = np.nonzero(flat)[0]
+        flat_length = (arclengths[start_time_step + flat_steps[-1] + 1] -
+                       arclengths[start_time_step + flat_steps[0]])
+    else:
+        flat_length = 0.0
+
+    def drop(max_angle):
+        slopes = min_angle + (max_angle - min_angle) * fraction
+        ramp_drop = np.dot(ramp_lengths, np.tan(slopes * math.pi / 180))
+        return float(flat_length * math.tan(max_angle * math.pi / 180) + ramp_drop)
+
+    return drop
+
+def find_root(f, a, b, xtol):
+    """
+    Brent's method: returns x in [a, b] with f(x) close to 0
+
+    f(a) and f(b) must have opposite signs
+    """
+    fa = f(a)
+    fb = f(b)
+    if fa == 0:
+        return a
+    if fb == 0:
+        return b
+    c, fc = a, fa
+    d = e = b - a
+    while True:
+        if (fb > 0) == (fc > 0):
+            c, fc = a, fa
+            d = e = b - a
+        if abs(fc) < abs(fb):
+            a, b, c = b, c, b
+            fa, fb, fc = fb, fc, fb
+        tol = 2 * 1e-16 * abs(b) + xtol / 2
+        m = (c - b) / 2
+        if abs(m) <= tol or fb == 0:
+            return b
+        if abs(e) >= tol and abs(fa) > abs(fb):
+            # interpolation: secant if only two points, otherwise inverse quadratic
+            s = fb / fa
+            if a == c:
+                p = 2 * m * s
+                q = 1 - s
+            else:
+                q = fa / fc
+                r = fb / fc
+                p = s * (2 * m * q * (q - r) - (b - a) * (r - 1))
+                q = (q - 1) * (r - 1) * (s - 1)
+            if p > 0:
+                q = -q
+            else:
+                p = -p
+            if 2 * p < min(3 * m * q - abs(tol * q), abs(e * q)):
+                e = d
+                d = p / q
+            else:
+                d = e = m
+        else:
+            d = e = m
+        a, fa = b, fb
+        if abs(d) > tol:
+            b = b + d
+        elif m > 0:
+            b = b + tol
+        else:
+            b = b - tol
+        fb = f(b)
+
 def get_drop_angle(arclengths, slope_angle, start_time_step, end_time_step, needed_dz):
     """
     Get the drop angle needed to gradually achieve the desired dz in the given time span
 
-    Works by using binary search between the base slope_angle and 45 degrees down
+    The angle is the result of a binary search between the base
+    slope_angle and 45 degrees down, stopping at a width of 0.01.
+
+    Rather than evaluating the drop at every step of the search, the
+    exact angle is found with Brent's method on drop_function.  The
+    binary search is then replayed against that root, which gives the
+    same steps as the search would, since the drop only increases with
+    the angle.  Any step too close to the root to be sure of is
+    checked with the original get_drop.
     """
-    total_drop = get_drop(arclengths, slope_angle, slope_angle, start_time_step, end_time_step)
-    if total_drop > needed_dz:
-        return
+    drop = drop_function(arclengths, slope_angle, start_time_step, end_time_step)
+
+    def compare_drop(angle):
+        """
+        The sign of the drop at this angle minus needed_dz
+        """
+        total_drop = drop(angle)
+        if abs(total_drop - needed_dz) <= 1e-9 * max(1.0, abs(needed_dz)):
+            total_drop = get_drop(arclengths, slope_angle, angle, start_time_step, end_time_step)
+        return (total_drop > needed_dz) - (total_drop < needed_dz)
 
-    total_drop = get_drop(arclengths, slope_angle, 45, start_time_step, end_time_step)
-    if total_drop < needed_dz:
+    if compare_drop(slope_angle) > 0:
+        return
+    if compare_drop(45) < 0:
         raise ValueError("Even an angle of 45 is not sufficient to achieve this drop")
 
+    root = find_root(lambda angle: drop(angle) - needed_dz, slope_angle, 45, 1e-10)
+
     min_angle = slope_angle
     max_angle = 45
     while max_angle - min_angle > 0.01:
         test_angle = (max_angle + min_angle) / 2
-        total_drop = get_drop(arclengths, slope_angle, test_angle, start_time_step, end_time_step)
-        if total_drop < needed_dz:
+        if abs(test_angle - root) > 1e-6:
+            below = test_angle < root
+        else:
+            below = compare_drop(test_angle) < 0
+        if below:
             min_angle = test_angle
         else:
             max_angle = test_angle
@@ -63,13 +177,15 @@ def update_slopes_weighted(slopes, start_time_step, end_time_step, slope_angle,
         else:
             slopes[time_step+start_time_step] = min(new_slope, slopes[time_step+start_time_step])
 
-def update_slopes_overlap(slopes, arclengths, times, slope_angle, start_t, end_t, needed_dz):
+def update_slopes_overlap(slopes, arclengths, time_grid, slope_angle, start_t, end_t, needed_dz):
     """
     Update a list of slopes, changing the slopes in a way such that
     between start_t and end_t, the path goes down by needed_dz
+
+    time_grid is a marble_util.TimeGrid (or a plain list of times)
     """
-    start_time_step = marble_util.get_time_step(times, start_t)
-    end_time_step = marble_util.get_time_step(times, end_t)
+    start_time_step = marble_util.get_time_step(time_grid, start_t)
+    end_time_step = marble_util.get_time_step(time_grid, end_t)
     if end_time_step < start_time_step:
         end_time_step, start_time_step = start_time_step, end_time_step
 
@@ -80,12 +196,12 @@ def update_slopes_overlap(slopes, arclengths, times, slope_angle, start_t, end_t
 
     update_slopes_weighted(slopes, start_time_step, end_time_step, slope_angle, best_angle, 0.2, True)
 
-def update_slopes_kink(slopes, times, slope_angle, kink_args, t):
+def update_slopes_kink(slopes, time_grid, slope_angle, kink_args, t):
     start_t = t - kink_args.kink_width
-    start_time_step = marble_util.get_time_step(times, start_t)
+    start_time_step = marble_util.get_time_step(time_grid, start_t)
 
     end_t = t + kink_args.kink_width
-    end_time_step = marble_util.get_time_step(times, end_t)
+    end_time_step = marble_util.get_time_step(time_grid, end_t)
 
     if end_time_step < start_time_step:
         end_time_step, start_time_step = start_time_step, end_time_step
@@ -94,22 +210,33 @@ def update_slopes_kink(slopes, times, slope_angle, kink_args, t):
         
     update_slopes_weighted(slopes, start_time_step, end_time_step, slope_angle, kink_args.kink_slope, kink_args.kink_sharpness, False)
 
-def slope_function(x_t, y_t, time_t, slope_angle, num_time_steps, overlap_args, kink_args):
-    arclengths = marble_path.calculate_arclengths(x_t, y_t, num_time_steps)
-    times = [time_t(t) for t in range(num_time_steps+1)]
+def slope_function(x_t, y_t, time_t, slope_angle, num_time_steps, overlap_args, kink_args,
+                   arclength_substeps=marble_path.ARCLENGTH_SUBSTEPS, path_samples=None):
+    """
+    Returns a function slope_angle_t(time_step) for the path
+
+    If path_samples describes this path, its arclengths are reused,
+    and the times and slopes are saved on it
+    """
+    path_samples = marble_path.get_path_samples(path_samples, x_t, y_t, num_time_steps, arclength_substeps)
+    arclengths = path_samples.arclengths
+    time_grid = marble_util.TimeGrid.from_time_t(time_t, num_time_steps, arclengths)
     slopes = [slope_angle for t in range(num_time_steps+1)]
     if kink_args and getattr(kink_args, 'kinks', None):
         for t in kink_args.kinks:
-            update_slopes_kink(slopes, times, slope_angle, kink_args, t)
+            update_slopes_kink(slopes, time_grid, slope_angle, kink_args, t)
     if overlap_args and getattr(overlap_args, 'overlaps', None):
         for start_t, end_t in overlap_args.overlaps:
             # for the basic 2 loop cycloid, want +/- .16675, 1.40405
-            update_slopes_overlap(slopes, arclengths, times, slope_angle,
+            update_slopes_overlap(slopes, arclengths, time_grid, slope_angle,
                                   start_t, end_t, overlap_args.overlap_separation)
 
     #for i, s in enumerate(slopes):
     #    print("%4d %.4f" % (i, s))
             
+    path_samples.time_grid = time_grid
+    path_samples.times = time_grid.times
+    path_samples.slopes = slopes
     slope_angle_t = lambda time_step_t: slopes[time_step_t]
     return slope_angle_t
 
@@ -0,0 +1,65 @@
+import math
+import unittest
+
+import combine_functions
+
+def nested_append(x1_t, x2_t, inflection_t):
+    """
+    The closure append_functions used to build for x_t
+    """
+    x_off = x1_t(inflection_t) - x2_t(0)
+    def x_t(t):
+        if t < inflection_t:
+            return x1_t(t)
+        else:
+            return x2_t(t - inflection_t) + x_off
+    return x_t
+
+def nested_splice(x1_t, x2_t, start_splice, end_splice):
+    x_s = nested_append(x1_t, x2_t, start_splice)
+    return nested_append(x_s, lambda t: x1_t(t + end_splice), end_splice)
+
+class TestCombineFunctions(unittest.TestCase):
+    def test_piecewise_matches_nested(self):
+        """
+        A deep composition gives exactly the same values as the nested closures
+        """
+        curve_t = lambda t: math.sin(t * 0.1) * 30.0 + t * 0.37
+        circle_t = lambda t: math.cos(t * 0.3) * 12.5
+        slope_t = lambda t: 5.0 + t * 0.01
+        r_t = lambda t: t * 3.0
+
+        expected = nested_splice(curve_t, circle_t, 20, 31)
+        expected = nested_append(circle_t, expected, 36)
+        expected = nested_append(expected, circle_t, 136)
+        translated = expected
+        expected = nested_append(lambda t: translated(t) + 0.1, circle_t, 150)
+
+        x_t, _, _, _ = combine_functions.splice_functions(curve_t, curve_t, slope_t, r_t,
+                                                          circle_t, circle_t, slope_t, r_t,
+                                                          20, 31)
+        x_t, _, _, _ = combine_functions.append_functions(circle_t, circle_t, slope_t, r_t,
+                                                          x_t, x_t, slope_t, r_t, 36)
+        x_t, _, _, _ = combine_functions.append_functions(x_t, x_t, slope_t, r_t,
+                                                          circle_t, circle_t, slope_t, r_t, 136)
+        x_t = combine_functions.translate_function(x_t, 0.1)
+        x_t, _, _, _ = combine_functions.append_functions(x_t, x_t, slope_t, r_t,
+                                                          circle_t, circle_t, slope_t, r_t, 150)
+
+        self.assertIsInstance(x_t, combine_functions.PiecewiseFunction)
+        times = [t / 4 for t in range(-8, 700)]
+        for t in times:
+            self.assertEqual(expected(t), x_t(t))
+        self.assertEqual([expected(t) for t in times], x_t.evaluate(times))
+        # evaluate does not need the times in order
+        self.assertEqual([expected(t) for t in reversed(times)], x_t.evaluate(times[::-1]))
+
+    def test_append_constant_slope(self):
+        x_t = lambda t: t
+        _, _, slope_t, _ = combine_functions.append_functions(x_t, x_t, 3.0, x_t,
+                                                              x_t, x_t, 5.0, x_t, 10)
+        self.assertEqual(3.0, slope_t(9.5))
+        self.assertEqual(5.0, slope_t(10))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,14 @@ import contextlib
 import filecmp
 import io
 import os
+import shutil
 import tempfile
 import unittest
 
 from collections import namedtuple
 
+import numpy as np
+
 import generate_basic_ramp
 import generate_clover
 import generate_cycloid
@@ -19,9 +22,16 @@ import generate_trig
 import generate_two_post_loop
 import generate_tube
 import generate_zigzag
+import golden_files
+import marble_path
 
 TGen = namedtuple('TGen', ['name', 'model', 'args', 'gold_file'])
 
+# set GOLDEN_EPSILON, for example GOLDEN_EPSILON=1e-4, to accept
+# outputs whose vertices are within that many mm of the gold files
+# instead of requiring them to match byte for byte
+GOLDEN_EPSILON = float(os.environ["GOLDEN_EPSILON"]) if os.environ.get("GOLDEN_EPSILON") else None
+
 TESTS = [TGen(name='Tube Basic',
               model=generate_tube,
               args=["--num_time_steps", "25",
@@ -717,14 +727,113 @@ class TestGeneration(unittest.TestCase):
     def tearDown(self):
         os.unlink(self.test_file.name)
 
+    def run_generations(self, extra_args, epsilon=GOLDEN_EPSILON):
+        for name, error in golden_files.run_generations(TESTS, extra_args, epsilon=epsilon):
+            with self.subTest(name=name):
+                self.assertIsNone(error, error)
+
     def test_generations(self):
+        self.run_generations([])
+
+    def test_generations_numpy_engine(self):
+        """
+        The numpy engine should produce exactly the same files as the scalar engine
+        """
+        self.run_generations(['--mesh_engine', 'numpy'])
+
+    def test_variants(self):
+        """
+        A variant swept along the same centerline matches the gold file from its own run
+        """
+        output_dir = tempfile.mkdtemp()
+        args = ['--hypoA', '9', '--hypoB', '3', '--hypoC', '6',
+                '--start_t', '1.0472', '--scale', '10',
+                '--tube_end_angle', '360', '--slope_angle', '12',
+                '--regularization', '0.07', '--tube_sides', '12', '--num_time_steps', '60',
+                '--output_name', os.path.join(output_dir, 'tunnel.stl'), '--no_cache',
+                '--variants', "{'holes.stl': '--tube_radius 10.5 --wall_thickness 11'}"]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                generate_hypotrochoid.main(sys_args=args)
+            # the centerline is only built once
+            self.assertEqual(1, stdout.getvalue().count("Z goes from"))
+            self.assertTrue(filecmp.cmp(os.path.join(output_dir, 'tunnel.stl'),
+                                        'test_files/hypo_three_leaf_flower_tunnel.stl'))
+            self.assertTrue(filecmp.cmp(os.path.join(output_dir, 'holes.stl'),
+                                        'test_files/hypo_three_leaf_flower_holes.stl'))
+        finally:
+            shutil.rmtree(output_dir)
+
+    def test_variants_centerline_args(self):
+        """
+        Variants can only change the tube, not the path it follows
+        """
+        for variants in ("{'a.stl': '--slope_angle 5'}", "{'a.stl': '--hypoA 5'}"):
+            with self.subTest(variants=variants):
+                with contextlib.redirect_stderr(io.StringIO()), contextlib.redirect_stdout(io.StringIO()):
+                    with self.assertRaises(SystemExit):
+                        generate_hypotrochoid.parse_args(['--variants', variants])
+
+    def test_digests(self):
+        """
+        The stored digests match the gold files
+        """
+        digests = golden_files.load_digests()
+        for gold_file in sorted(set(test.gold_file for test in TESTS)):
+            with self.subTest(gold_file=gold_file):
+                self.assertEqual(digests.get(gold_file), golden_files.file_digest(gold_file))
+
+    def test_generations_epsilon(self):
+        """
+        Binary stls and objs are within float32 precision and the 4 decimal places of the gold files
+        """
+        self.run_generations(['--stl_format', 'binary'], epsilon=1e-4)
+        self.run_generations(['--output_format', 'obj'], epsilon=1e-4)
+
+    def test_golden_mismatch(self):
+        """
+        A mismatch shows a diff against the gold file
+        """
+        test = TESTS[0]
+        digest = golden_files.load_digests()[TESTS[1].gold_file]
+        error = golden_files.check_generation(test.name, test.model.__name__, test.args, TESTS[1].gold_file, digest)
+        self.assertIn("does not match the digest of %s" % TESTS[1].gold_file, error)
+        self.assertNotIn("out of date", error)
+        self.assertIn("@@", error)
+        self.assertLessEqual(len(error.split("\n")), golden_files.MAX_DIFF_LINES + 2)
+
+    def test_binary_stl(self):
+        """
+        Binary stl files should have the same facets as the ascii gold files, up to float32 precision
+        """
         for test in TESTS:
             with self.subTest(name=test.name):
-                print("Running %s" % test.name)
                 with contextlib.redirect_stdout(io.StringIO()) as stdout:
-                    args = ['--output_name', self.test_file.name] + test.args
+                    args = ['--output_name', self.test_file.name, '--stl_format', 'binary', '--no_cache'] + test.args
                     test.model.main(sys_args=args)
-                self.assertTrue(filecmp.cmp(self.test_file.name, test.gold_file))
+                with open(test.gold_file) as fin:
+                    expected = [line.split()[1:] for line in fin if line.strip().startswith("vertex")]
+                expected = np.array(expected, dtype=np.float64).reshape(-1, 3, 3)
+
+                with open(self.test_file.name, "rb") as fin:
+                    fin.read(80)
+                    num_facets = np.frombuffer(fin.read(4), dtype='<u4')[0]
+                    facets = np.frombuffer(fin.read(), dtype=marble_path.BINARY_STL_FACET)
+                self.assertEqual(len(expected), num_facets)
+                self.assertEqual(len(expected), len(facets))
+                np.testing.assert_allclose(facets['vertices'], expected, atol=1e-4)
+
+    def test_trig_power_zero(self):
+        """
+        sin^0 t has no derivative formula at sin t = 0, so the rotation falls back to finite differences
+        """
+        args = generate_trig.parse_args(['--power', '0'])
+        time_t = lambda t: args.start_t + (args.end_t - args.start_t) * t / args.num_time_steps
+        self.assertIsNone(generate_trig.build_dx_dy_t(args, time_t))
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_trig.main(sys_args=['--output_name', self.test_file.name, '--no_cache',
+                                         '--power', '0', '--num_time_steps', '40'])
+        self.assertGreater(os.path.getsize(self.test_file.name), 0)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,301 @@
+import argparse
+import contextlib
+import io
+import math
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import marble_path
+
+class TestMarblePath(unittest.TestCase):
+    def setUp(self):
+        self.test_file = tempfile.NamedTemporaryFile(delete=False)
+        self.test_file.close()
+
+    def tearDown(self):
+        os.unlink(self.test_file.name)
+
+    def test_calculate_arclengths(self):
+        """
+        A quarter circle of radius 10 over 4 time steps, with a couple different numbers of substeps
+        """
+        x_t = lambda t: 10 * math.cos(t * math.pi / 8)
+        y_t = lambda t: 10 * math.sin(t * math.pi / 8)
+        for substeps in (100, 1000):
+            arclengths = marble_path.calculate_arclengths(x_t, y_t, 4, substeps)
+            self.assertEqual(5, len(arclengths))
+            self.assertEqual(0.0, arclengths[0])
+            for i in range(5):
+                self.assertAlmostEqual(i * 10 * math.pi / 8, arclengths[i], places=3)
+
+    def test_path_samples_reused(self):
+        """
+        The arclengths are only integrated once for the same path, and again for a different path
+        """
+        calls = [0]
+        def x_t(t):
+            calls[0] += 1
+            return t
+        y_t = lambda t: 0.0
+
+        path_samples = marble_path.PathSamples(x_t, y_t, 3, 10)
+        z_t = marble_path.arclength_height_function(x_t, y_t, 3, slope_angle=45, arclength_substeps=10,
+                                                    path_samples=path_samples)
+        self.assertEqual(31, calls[0])
+        self.assertAlmostEqual(-3.0, z_t(3))
+        marble_path.arclength_height_function(x_t, y_t, 3, slope_angle=45, arclength_substeps=10,
+                                              path_samples=path_samples)
+        self.assertEqual(31, calls[0])
+        self.assertEqual(4, len(path_samples.zs))
+
+        x2_t = lambda t: x_t(t)
+        marble_path.arclength_height_function(x2_t, y_t, 3, slope_angle=45, arclength_substeps=10,
+                                              path_samples=path_samples)
+        self.assertEqual(62, calls[0])
+
+    def test_tube_profile(self):
+        """
+        The cached profile should match the per-vertex tube functions
+        """
+        profile = marble_path.tube_profile(marble_path.Tube.ELLIPSE, 12.5, 0.5, None, 2.0,
+                                           None, -30, 200, 16, True)
+        self.assertEqual(17, len(profile))
+        for tube_subdivision, (x_disp, vert_disp) in enumerate(profile):
+            expected = marble_path.ellipse_tube_coordinates(marble_path.Tube.ELLIPSE, 12.5, 0.5, 2.0,
+                                                            -30, 200, 16, tube_subdivision,
+                                                            0.0, True, 0.0)
+            self.assertEqual((x_disp, 0.0, vert_disp), expected)
+
+        profile = marble_path.tube_profile(marble_path.Tube.OVAL, 12.5, None, 6.0, 2.0,
+                                           None, -30, 200, 16, False)
+        for tube_subdivision, (x_disp, vert_disp) in enumerate(profile):
+            expected = marble_path.oval_tube_coordinates(marble_path.Tube.OVAL, 12.5, 6.0, 2.0,
+                                                         -30, 200, 16, tube_subdivision,
+                                                         0.0, False, 0.0)
+            self.assertEqual((x_disp, 0.0, vert_disp), expected)
+
+    def test_tube_angle_resolution(self):
+        tube_angles = ((0.0, 180), (1.0, 240))
+        time_t = lambda t: t / 10
+        tube_t = marble_path.build_tube_angle_t(tube_angles, time_t)
+        rounded_t = marble_path.build_tube_angle_t(tube_angles, time_t, 5.0)
+        for time_step in range(11):
+            self.assertAlmostEqual(round(tube_t(time_step) / 5.0) * 5.0, rounded_t(time_step))
+        self.assertEqual(180, rounded_t(0))
+        self.assertEqual(240, rounded_t(10))
+        # a single angle is never rounded
+        self.assertEqual(182, marble_path.build_tube_angle_t(182, time_t, 5.0)(3))
+
+    def test_tube_angle_schedule(self):
+        tube_angles = ((4.1, 240), (4.9, 180), (6.0, 200))
+        time_t = lambda t: t / 10
+        tube_t = marble_path.build_tube_angle_t(tube_angles, time_t)
+        schedule = marble_path.build_tube_angle_t(tube_angles, time_t, num_time_steps=80)
+        self.assertEqual(81, len(schedule.angles))
+        for time_step in range(81):
+            self.assertEqual(tube_t(time_step), schedule(time_step))
+        self.assertEqual(240, schedule(0))
+        self.assertEqual(180, schedule(49))
+        self.assertEqual(200, schedule(80))
+        # halfway between two intervals, the tanh is exactly halfway
+        self.assertAlmostEqual(210, schedule(45))
+        # fractional time steps are still interpolated
+        self.assertEqual(tube_t(45.5), schedule(45.5))
+        self.assertTrue(180 < schedule(45.5) < 210)
+
+    def test_adaptive_time_steps(self):
+        # a straight line only needs its ends
+        line = np.array([[(t, 2 * t, 0.0)] for t in range(11)], dtype=np.float64)
+        self.assertEqual([0, 10], marble_path.adaptive_time_steps(line, 0.01))
+
+        # a quarter circle keeps more steps for a tighter tolerance,
+        # and every dropped step stays within tolerance of its chord
+        arc = np.array([[(10 * math.cos(t * math.pi / 80), 10 * math.sin(t * math.pi / 80), 0.0)] for t in range(41)])
+        coarse = marble_path.adaptive_time_steps(arc, 0.1)
+        fine = marble_path.adaptive_time_steps(arc, 0.01)
+        self.assertTrue(2 < len(coarse) < len(fine) < 41)
+        for kept in (coarse, fine):
+            self.assertEqual(0, kept[0])
+            self.assertEqual(40, kept[-1])
+        for first, last in zip(fine[:-1], fine[1:]):
+            if last > first + 1:
+                self.assertLessEqual(np.max(marble_path.chord_errors(arc, first, last)), 0.01)
+
+    def test_adaptive_centerline(self):
+        """
+        The straight part of a path loses its rings, the turn keeps them,
+        and the kept time steps land exactly on the original ones
+        """
+        def x_t(t):
+            return t if t <= 20 else 20 + 10 * math.sin((t - 20) * math.pi / 40)
+        def y_t(t):
+            return 0.0 if t <= 20 else 10 - 10 * math.cos((t - 20) * math.pi / 40)
+        z_t = lambda t: -t * 0.1
+        r_t = lambda t: 0.0 if t <= 20 else (t - 20) * 4.5
+        centerline = marble_path.Centerline(x_t, y_t, z_t, r_t, 40, None, None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            adaptive = marble_path.adaptive_centerline(centerline, 5.0, 3.0, 0.05)
+        self.assertTrue(2 < adaptive.num_time_steps < 21)
+        # the straight section is a single step
+        self.assertEqual(20, adaptive.time_t(1))
+        self.assertEqual(40, adaptive.time_t(adaptive.num_time_steps))
+        for t in range(adaptive.num_time_steps + 1):
+            original = adaptive.time_t(t)
+            self.assertEqual(int(original), original)
+            self.assertEqual(x_t(original), adaptive.x_t(t))
+            self.assertEqual(r_t(original), adaptive.r_t(t))
+        # fractional steps are interpolated between the kept ones
+        self.assertEqual(10, adaptive.time_t(0.5))
+        self.assertIsNone(adaptive.slope_angle_t)
+
+    def test_jobs(self):
+        """
+        Meshing the tube in bands gives the same mesh as meshing it all at once
+        """
+        parser = argparse.ArgumentParser()
+        marble_path.add_tube_arguments(parser, default_slope_angle=5.0, default_output_name='test.stl')
+        x_t = lambda t: 30 * math.cos(t * math.pi / 20)
+        y_t = lambda t: 30 * math.sin(t * math.pi / 20)
+        z_t = lambda t: -t * 0.5
+        r_t = lambda t: t * 9 + 90
+        for mesh_engine in ('scalar', 'numpy'):
+            args = parser.parse_args(['--mesh_engine', mesh_engine,
+                                      '--tube_method', 'ellipse',
+                                      '--tube_end_angle', '((5, 270), (10, 360))'])
+            with contextlib.redirect_stdout(io.StringIO()):
+                expected = marble_path.compose_triangles(x_t, y_t, z_t, r_t, args, 17)
+                args.jobs = 3
+                mesh = marble_path.compose_triangles(x_t, y_t, z_t, r_t, args, 17)
+            np.testing.assert_array_equal(expected.triangles(), mesh.triangles())
+            if mesh_engine == 'scalar':
+                np.testing.assert_array_equal(expected.vertices, mesh.vertices)
+                np.testing.assert_array_equal(expected.faces, mesh.faces)
+
+    def test_stream_band_size(self):
+        """
+        Streaming the tube a band at a time writes the same stl as building it all at once
+        """
+        parser = argparse.ArgumentParser()
+        marble_path.add_tube_arguments(parser, default_slope_angle=5.0, default_output_name='test.stl')
+        x_t = lambda t: 30 * math.cos(t * math.pi / 20)
+        y_t = lambda t: 30 * math.sin(t * math.pi / 20)
+        z_t = lambda t: -t * 0.5
+        r_t = lambda t: t * 9 + 90
+        args = parser.parse_args(['--tube_method', 'oval', '--tube_end_angle', '((5, 270), (10, 360))'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = marble_path.compose_triangles(x_t, y_t, z_t, r_t, args, 17)
+            args.stream_band_size = 5
+            stream = marble_path.compose_triangles(x_t, y_t, z_t, r_t, args, 17)
+        self.assertIsInstance(stream, marble_path.MeshStream)
+        self.assertEqual(4, len(list(stream.bands())))
+        self.assertEqual(len(expected), len(stream))
+        np.testing.assert_array_equal(expected.triangles(), stream.to_mesh().triangles())
+
+        for stl_format in marble_path.StlFormat:
+            marble_path.write_stl(expected, self.test_file.name, stl_format)
+            with open(self.test_file.name, "rb") as fin:
+                expected_stl = fin.read()
+            marble_path.write_stl(stream, self.test_file.name, stl_format)
+            with open(self.test_file.name, "rb") as fin:
+                self.assertEqual(expected_stl, fin.read())
+
+        # the ring where two bands meet is only written once, so the
+        # indexed formats have the same vertices as the unstreamed mesh
+        marble_path.write_ply(expected, self.test_file.name)
+        with open(self.test_file.name, "rb") as fin:
+            expected_ply = fin.read()
+        marble_path.write_ply(stream, self.test_file.name)
+        with open(self.test_file.name, "rb") as fin:
+            self.assertEqual(expected_ply, fin.read())
+        self.assertEqual(len(expected.vertices), len(stream.to_mesh().vertices))
+
+        # the obj has each band's faces right after its new vertices
+        marble_path.write_obj(stream, self.test_file.name)
+        with open(self.test_file.name) as fin:
+            lines = [line.split() for line in fin]
+        vertices = np.array([line[1:] for line in lines if line[0] == 'v'], dtype=np.float64)
+        faces = np.array([line[1:] for line in lines if line[0] == 'f'], dtype=np.int64) - 1
+        self.assertEqual(len(expected.vertices), len(vertices))
+        np.testing.assert_allclose(expected.triangles(), vertices[faces], atol=1e-4)
+
+        # the numpy engine does not share the vertices in the same
+        # order, but streaming it still writes each vertex once
+        args.mesh_engine = marble_path.MeshEngine.NUMPY
+        args.stream_band_size = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = marble_path.compose_triangles(x_t, y_t, z_t, r_t, args, 17)
+            args.stream_band_size = 5
+            stream = marble_path.compose_triangles(x_t, y_t, z_t, r_t, args, 17)
+        num_vertices = sum(len(vertices) for vertices, _ in marble_path.indexed_bands(stream))
+        self.assertEqual(len(expected.vertices), num_vertices)
+
+    def test_ascii_stl_chunks(self):
+        """
+        Writing in several chunks should give the same file as writing in one chunk
+        """
+        mesh = marble_path.Mesh.from_triangles(marble_path.generate_cube(10))
+        marble_path.write_ascii_stl(mesh, self.test_file.name)
+        with open(self.test_file.name) as fin:
+            expected = fin.read()
+        marble_path.write_ascii_stl(mesh, self.test_file.name, chunk_size=5)
+        with open(self.test_file.name) as fin:
+            self.assertEqual(expected, fin.read())
+
+    def test_ascii_stl_format(self):
+        """
+        Coordinates are written with all 4 decimal places, including trailing zeros
+        """
+        mesh = marble_path.Mesh.from_triangles([((0, 1, 2.5), (-1, 0.25, 3), (1.23456, 0, 0))])
+        marble_path.write_stl(mesh, self.test_file.name)
+        with open(self.test_file.name) as fin:
+            result = fin.read()
+        expected = ("facet normal 0 0 0\n"
+                    " outer loop\n"
+                    "  vertex 0.0000 1.0000 2.5000\n"
+                    "  vertex -1.0000 0.2500 3.0000\n"
+                    "  vertex 1.2346 0.0000 0.0000\n"
+                    " endloop\n"
+                    "endfacet\n")
+        self.assertEqual(expected, result)
+
+    def test_obj(self):
+        mesh = marble_path.Mesh([(0, 0, 0), (1, 0, 0), (0, 1.5, 0), (0, 0, 2)],
+                                [(0, 1, 2), (0, 3, 1)])
+        marble_path.write_obj(mesh, self.test_file.name)
+        with open(self.test_file.name) as fin:
+            result = fin.read()
+        expected = ("v 0.0000 0.0000 0.0000\n"
+                    "v 1.0000 0.0000 0.0000\n"
+                    "v 0.0000 1.5000 0.0000\n"
+                    "v 0.0000 0.0000 2.0000\n"
+                    "f 1 2 3\n"
+                    "f 1 4 2\n")
+        self.assertEqual(expected, result)
+
+    def test_ply(self):
+        mesh = marble_path.Mesh.from_triangles(marble_path.generate_cube(10))
+        marble_path.write_ply(mesh, self.test_file.name)
+        with open(self.test_file.name, "rb") as fin:
+            data = fin.read()
+        header, body = data.split(b"end_header\n")
+        self.assertIn(b"format binary_little_endian 1.0\n", header)
+        self.assertIn(b"element vertex 36\n", header)
+        self.assertIn(b"element face 12\n", header)
+        vertices = np.frombuffer(body, dtype=marble_path.PLY_VERTEX, count=36)
+        faces = np.frombuffer(body, dtype=marble_path.PLY_FACE, offset=36 * marble_path.PLY_VERTEX.itemsize)
+        self.assertEqual(12, len(faces))
+        self.assertTrue(np.all(faces['count'] == 3))
+        np.testing.assert_array_equal(mesh.faces, faces['vertex_indices'])
+        np.testing.assert_array_equal(mesh.vertices, np.stack([vertices['x'], vertices['y'], vertices['z']], axis=-1))
+
+    def test_output_filename(self):
+        self.assertEqual("trig.obj", marble_path.output_filename("trig.stl", marble_path.OutputFormat.OBJ))
+        self.assertEqual("trig.ply", marble_path.output_filename("trig.STL", marble_path.OutputFormat.PLY))
+        self.assertEqual("trig.stl", marble_path.output_filename("trig.stl", marble_path.OutputFormat.STL))
+        self.assertEqual("trig.mesh", marble_path.output_filename("trig.mesh", marble_path.OutputFormat.OBJ))
+
+if __name__ == '__main__':
+    unittest.main()
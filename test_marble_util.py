@@ -0,0 +1,32 @@
+import unittest
+
+import marble_util
+
+class TestMarbleUtil(unittest.TestCase):
+    def test_get_time_step(self):
+        times = [0.0, 0.5, 1.0, 1.0, 2.0]
+        self.assertEqual(0, marble_util.get_time_step(times, -1.0))
+        self.assertEqual(0, marble_util.get_time_step(times, 0.0))
+        self.assertEqual(0, marble_util.get_time_step(times, 0.25))
+        self.assertEqual(1, marble_util.get_time_step(times, 0.5))
+        self.assertEqual(3, marble_util.get_time_step(times, 1.0))
+        self.assertEqual(3, marble_util.get_time_step(times, 1.5))
+        # the old linear scan crashed on exactly the last time
+        self.assertEqual(4, marble_util.get_time_step(times, 2.0))
+        self.assertEqual(4, marble_util.get_time_step(times, 3.0))
+
+    def test_time_grid(self):
+        time_grid = marble_util.TimeGrid.from_time_t(lambda t: t * 0.5 - 1, 4,
+                                                     arclengths=[0.0, 2.0, 3.0, 7.0, 8.0])
+        self.assertEqual(5, len(time_grid))
+        self.assertEqual(0.5, time_grid.t(3))
+        self.assertEqual(2, time_grid.time_step(0.2))
+        self.assertAlmostEqual(2.4, time_grid.fractional_time_step(0.2))
+        self.assertEqual(0.0, time_grid.fractional_time_step(-5))
+        self.assertEqual(4.0, time_grid.fractional_time_step(5))
+        self.assertEqual(2, time_grid.arclength_time_step(5.0))
+        self.assertAlmostEqual(2.5, time_grid.fractional_arclength_time_step(5.0))
+        self.assertEqual(time_grid.time_step(0.2), marble_util.get_time_step(time_grid, 0.2))
+
+if __name__ == '__main__':
+    unittest.main()
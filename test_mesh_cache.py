@@ -0,0 +1,119 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import generate_helix
+import marble_path
+import mesh_cache
+
+class TestMeshCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        self.generated = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.output_dir)
+
+    def parse_args(self, *extra_args):
+        parser = argparse.ArgumentParser()
+        marble_path.add_tube_arguments(parser, default_slope_angle=5.0, default_output_name='cube.stl')
+        parser.add_argument('--size', default=10.0, type=float)
+        return parser.parse_args(['--output_name', os.path.join(self.output_dir, 'cube.stl'),
+                                  '--cache_dir', self.cache_dir] + list(extra_args))
+
+    def write_cube(self, args):
+        def generate():
+            self.generated += 1
+            return marble_path.Mesh.from_triangles(marble_path.generate_cube(args.size))
+        with contextlib.redirect_stdout(io.StringIO()):
+            return mesh_cache.write_output(generate_helix, args, generate)
+
+    def test_hit(self):
+        args = self.parse_args()
+        filename = self.write_cube(args)
+        self.assertEqual(1, self.generated)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        with open(filename) as fin:
+            expected = fin.read()
+        os.unlink(filename)
+
+        # a different output name and engine still hit the cache
+        args = self.parse_args('--mesh_engine', 'numpy', '--jobs', '2')
+        self.assertEqual(filename, self.write_cube(args))
+        self.assertEqual(1, self.generated)
+        with open(filename) as fin:
+            self.assertEqual(expected, fin.read())
+
+    def test_miss(self):
+        self.write_cube(self.parse_args())
+        self.write_cube(self.parse_args('--size', '12'))
+        self.assertEqual(2, self.generated)
+        self.write_cube(self.parse_args('--stl_format', 'binary'))
+        self.assertEqual(3, self.generated)
+        self.assertEqual(3, len(os.listdir(self.cache_dir)))
+
+    def test_indexed_format_engine(self):
+        """
+        The engine and bands can change the vertices of an obj, so they are part of its key
+        """
+        self.write_cube(self.parse_args('--output_format', 'obj'))
+        self.write_cube(self.parse_args('--output_format', 'obj'))
+        self.assertEqual(1, self.generated)
+        self.write_cube(self.parse_args('--output_format', 'obj', '--stream_band_size', '7'))
+        self.write_cube(self.parse_args('--output_format', 'obj', '--mesh_engine', 'numpy'))
+        self.write_cube(self.parse_args('--output_format', 'obj', '--jobs', '2'))
+        self.assertEqual(4, self.generated)
+
+    def test_no_cache(self):
+        self.write_cube(self.parse_args('--no_cache'))
+        self.write_cube(self.parse_args('--no_cache'))
+        self.assertEqual(2, self.generated)
+        self.assertEqual(0, len(os.listdir(self.cache_dir)))
+
+    def test_evict(self):
+        """
+        The least recently used file goes first
+        """
+        self.write_cube(self.parse_args('--size', '1'))
+        self.write_cube(self.parse_args('--size', '2'))
+        cached = {}
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            cached[path] = os.path.getsize(path)
+        os.utime(min(cached), (0, 0))
+        os.utime(max(cached), (1, 1))
+        # room for two of the three files
+        cache_size = (sum(cached.values()) * 1.2) / 1024 / 1024
+        self.write_cube(self.parse_args('--size', '3', '--cache_size', str(cache_size)))
+        remaining = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+        self.assertEqual(2, len(remaining))
+        self.assertNotIn(min(cached), remaining)
+        self.assertIn(max(cached), remaining)
+
+    def test_evict_partial(self):
+        """
+        A file another process is still copying into the cache is never evicted
+        """
+        self.write_cube(self.parse_args())
+        partial_file = os.path.join(self.cache_dir, "key.stl.123.partial")
+        with open(partial_file, "w") as fout:
+            fout.write("x" * 10000)
+        mesh_cache.evict(self.cache_dir, 0)
+        self.assertEqual(["key.stl.123.partial"], os.listdir(self.cache_dir))
+
+    def test_source_version(self):
+        self.assertEqual(64, len(mesh_cache.source_version('generate_helix')))
+        self.assertNotEqual(mesh_cache.source_version('generate_helix'), mesh_cache.source_version('generate_limacon'))
+        self.assertEqual(mesh_cache.cache_key('generate_helix', self.parse_args()),
+                         mesh_cache.cache_key('generate_helix', self.parse_args('--output_name', 'other.stl')))
+        self.assertNotEqual(mesh_cache.cache_key('generate_helix', self.parse_args()),
+                            mesh_cache.cache_key('generate_limacon', self.parse_args()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import marble_path
+import mesh_compare
+
+class TestMeshCompare(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.mesh = marble_path.Mesh.from_triangles(marble_path.generate_cube(10.12345))
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_read_triangles(self):
+        """
+        Every format reads back as the same triangles, up to the precision of the format
+        """
+        writers = [("ascii.stl", lambda mesh, filename: marble_path.write_stl(mesh, filename, marble_path.StlFormat.ASCII)),
+                   ("binary.stl", lambda mesh, filename: marble_path.write_stl(mesh, filename, marble_path.StlFormat.BINARY)),
+                   ("mesh.obj", marble_path.write_obj),
+                   ("mesh.ply", marble_path.write_ply)]
+        for name, write in writers:
+            with self.subTest(name=name):
+                filename = os.path.join(self.output_dir, name)
+                write(self.mesh, filename)
+                triangles = mesh_compare.read_triangles(filename)
+                self.assertEqual((12, 3, 3), triangles.shape)
+                np.testing.assert_allclose(self.mesh.triangles(), triangles, atol=1e-4)
+
+    def test_compare_triangles(self):
+        expected = self.mesh.triangles()
+        result = expected.copy()
+        result[5, 2] += (0.0, 3e-5, 4e-5)
+        result[7, 1, 0] -= 1e-6
+
+        difference = mesh_compare.compare_triangles(expected, result, 1e-4)
+        self.assertAlmostEqual(5e-5, difference.max_deviation)
+        self.assertEqual((5, 2), (difference.facet, difference.vertex))
+        self.assertEqual(0, difference.num_over_epsilon)
+        self.assertEqual(tuple(expected[5, 2]), difference.expected)
+
+        difference = mesh_compare.compare_triangles(expected, result, 1e-6)
+        self.assertEqual(1, difference.num_over_epsilon)
+        self.assertIn("1 vertices are further apart than 1e-06", mesh_compare.describe_difference(difference))
+
+        with self.assertRaises(ValueError):
+            mesh_compare.compare_triangles(expected, result[:-1], 1e-4)
+
+    def test_main(self):
+        expected = os.path.join(self.output_dir, "expected.stl")
+        result = os.path.join(self.output_dir, "result.stl")
+        marble_path.write_stl(self.mesh, expected)
+        marble_path.write_stl(self.mesh, result, marble_path.StlFormat.BINARY)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(mesh_compare.main([expected, result]))
+            self.assertFalse(mesh_compare.main([expected, result, '--epsilon', '1e-9']))
+
+if __name__ == '__main__':
+    unittest.main()
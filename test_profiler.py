@@ -0,0 +1,95 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import combine_functions
+import generate_hypotrochoid
+import marble_util
+import profiler
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_not_profiling(self):
+        f_t = lambda t: t
+        self.assertIs(f_t, profiler.counted('f_t', f_t))
+        with profiler.stage("nothing"):
+            profiler.count('f_t')
+
+    def test_stages_and_counts(self):
+        output_name = os.path.join(self.output_dir, 'test.stl')
+        args = argparse.Namespace(profile=True)
+        piecewise_t = combine_functions.PiecewiseFunction.from_function(lambda t: 2 * t)
+        with contextlib.redirect_stdout(io.StringIO()):
+            with profiler.profiling(args, output_name):
+                f_t = profiler.counted('f_t', lambda t: t + 1)
+                g_t = profiler.counted('g_t', piecewise_t)
+                self.assertTrue(hasattr(g_t, 'evaluate'))
+                self.assertFalse(hasattr(f_t, 'evaluate'))
+                with profiler.stage("outer"):
+                    with profiler.stage("inner"):
+                        big = [0.0] * 100000
+                        self.assertEqual(3, f_t(2))
+                    del big
+                    self.assertEqual(marble_util.evaluate_times(piecewise_t, [1, 2, 3]),
+                                     marble_util.evaluate_times(g_t, [1, 2, 3]))
+                    self.assertEqual(8, g_t(4))
+        self.assertEqual(os.path.join(self.output_dir, 'test.profile.json'), profiler.report_filename(output_name))
+        with open(profiler.report_filename(output_name)) as fin:
+            report = json.load(fin)
+        self.assertEqual(["outer", "outer/inner"], [entry["stage"] for entry in report["stages"]])
+        self.assertEqual({'f_t': 1, 'g_t': 4}, report["counts"])
+        outer, inner = report["stages"]
+        # the inner list is part of the outer stage's peak as well
+        self.assertGreater(inner["peak_memory_mb"], 0.7)
+        self.assertGreaterEqual(outer["peak_memory_mb"], inner["peak_memory_mb"])
+        self.assertGreaterEqual(outer["seconds"], inner["seconds"])
+        # profiling stops at the end of the block
+        self.assertIs(profiler._profile, None)
+
+    def test_generator(self):
+        output_name = os.path.join(self.output_dir, 'hypo.stl')
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_hypotrochoid.main(['--num_time_steps', '40', '--tube_sides', '8',
+                                        '--output_name', output_name, '--no_cache', '--profile'])
+        with open(profiler.report_filename(output_name)) as fin:
+            report = json.load(fin)
+        self.assertEqual(output_name, report["output"])
+        stages = [entry["stage"] for entry in report["stages"]]
+        for stage in ("generate", "generate/centerline/slope_function",
+                      "generate/centerline/arclength_height_function", "generate/generate_path", "write_output"):
+            self.assertIn(stage, stages)
+        for name in ('x_t', 'y_t', 'z_t', 'r_t', 'frame_t', 'tube_function'):
+            self.assertGreater(report["counts"][name], 0)
+        # each frame of the tube is only evaluated once
+        self.assertEqual(41, report["counts"]['frame_t'])
+
+    def test_jobs(self):
+        """
+        The tube is meshed in worker processes with --jobs, and their counts are added to the report
+        """
+        counts = []
+        for jobs in ('1', '2'):
+            output_name = os.path.join(self.output_dir, 'hypo%s.stl' % jobs)
+            with contextlib.redirect_stdout(io.StringIO()):
+                generate_hypotrochoid.main(['--num_time_steps', '40', '--tube_sides', '8', '--jobs', jobs,
+                                            '--output_name', output_name, '--no_cache', '--profile'])
+            with open(profiler.report_filename(output_name)) as fin:
+                counts.append(json.load(fin)["counts"])
+        serial, parallel = counts
+        # the ring where the two bands meet is built by both workers
+        self.assertGreaterEqual(parallel['tube_function'], serial['tube_function'])
+        self.assertLess(parallel['tube_function'], serial['tube_function'] * 1.1)
+        self.assertEqual(serial['frame_t'], parallel['frame_t'])
+
+if __name__ == '__main__':
+    unittest.main()
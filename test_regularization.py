@@ -88,5 +88,35 @@ class TestRegularization(unittest.TestCase):
         self.assertAlmostEqual(factor(15), 2 / 3)
         self.assertAlmostEqual(factor(20), 0.5)
 
+    def test_regularize_derivatives(self):
+        """
+        Compare the derivatives of the regularized functions against finite differences
+        """
+        methods = [Namespace(regularization_method=regularization.Regularization.INVERSE_QUADRATIC,
+                             regularization=0.2, y_regularization=0.1, regularization_radius=1.0),
+                   Namespace(regularization_method=regularization.Regularization.CAPPED_LINEAR,
+                             regularization_linear_cap=5.0),
+                   Namespace(regularization_method=regularization.Regularization.HYPERBOLIC,
+                             regularization_x_trans=1.0, regularization_y_trans=2.0,
+                             regularization_slope=0.5),
+                   Namespace(regularization_method=regularization.Regularization.LOGISTIC,
+                             regularization_x_trans=1.0, regularization_y_trans=0.5,
+                             regularization_x_scale=0.3, regularization_y_scale=4.0),
+                   Namespace(regularization_method=None)]
+        x_t = lambda t: 3 * math.cos(t) + t
+        y_t = lambda t: 2 * math.sin(2 * t)
+        dx_t = lambda t: -3 * math.sin(t) + 1
+        dy_t = lambda t: 4 * math.cos(2 * t)
+        epsilon = 1e-6
+        for reg_args in methods:
+            reg_x_t, reg_y_t = regularization.regularize(x_t, y_t, reg_args)
+            reg_dx_t, reg_dy_t = regularization.regularize_derivatives(x_t, y_t, dx_t, dy_t, reg_args)
+            # the capped linear factor covers all three pieces by t = 3
+            for t in (0.3, 1.1, 2.0, 3.0, 5.5):
+                expected_dx = (reg_x_t(t + epsilon) - reg_x_t(t - epsilon)) / (2 * epsilon)
+                expected_dy = (reg_y_t(t + epsilon) - reg_y_t(t - epsilon)) / (2 * epsilon)
+                self.assertAlmostEqual(expected_dx, reg_dx_t(t), places=5)
+                self.assertAlmostEqual(expected_dy, reg_dy_t(t), places=5)
+
 if __name__ == '__main__':
     unittest.main()
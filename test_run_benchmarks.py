@@ -0,0 +1,83 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import generate_tube
+import marble_path
+import run_benchmarks
+
+class TestRunBenchmarks(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_count_triangles(self):
+        mesh = marble_path.Mesh.from_triangles(marble_path.generate_cube(10))
+        filename = os.path.join(self.output_dir, "cube.stl")
+        for stl_format in marble_path.StlFormat:
+            marble_path.write_stl(mesh, filename, stl_format)
+            self.assertEqual(12, run_benchmarks.count_triangles(filename))
+        for extension, write in ((".obj", marble_path.write_obj), (".ply", marble_path.write_ply)):
+            filename = os.path.join(self.output_dir, "cube" + extension)
+            write(mesh, filename)
+            self.assertEqual(12, run_benchmarks.count_triangles(filename))
+
+    def test_compare(self):
+        baselines = {"a": {"seconds": 10.0, "peak_rss_mb": 100.0},
+                     "b": {"seconds": 0.01, "peak_rss_mb": 100.0}}
+        results = {"a": {"seconds": 12.0, "peak_rss_mb": 130.0},
+                   "b": {"seconds": 0.02, "peak_rss_mb": 100.0},
+                   "new": {"seconds": 100.0, "peak_rss_mb": 1000.0}}
+        regressions = run_benchmarks.compare(results, baselines, 0.25, min_seconds=0.1)
+        self.assertEqual(1, len(regressions))
+        self.assertTrue(regressions[0].startswith("a: peak_rss_mb"))
+        self.assertEqual(3, len(run_benchmarks.compare(results, baselines, 0.1)))
+
+    def test_scenarios(self):
+        """
+        Every scenario names a generator with a main
+        """
+        scenarios = run_benchmarks.load_scenarios(os.path.join(run_benchmarks.BENCHMARK_DIR, "scenarios.json"))
+        with open(os.path.join(run_benchmarks.BENCHMARK_DIR, "baselines.json")) as fin:
+            baselines = json.load(fin)["scenarios"]
+        self.assertEqual(len(scenarios), len(set(scenario["name"] for scenario in scenarios)))
+        for scenario in scenarios:
+            self.assertIn(scenario["generator"], run_benchmarks.run_recipes.available_generators())
+            self.assertIn(scenario["name"], baselines)
+
+    def test_main(self):
+        scenario_file = os.path.join(self.output_dir, "scenarios.json")
+        baseline_file = os.path.join(self.output_dir, "baselines.json")
+        with open(scenario_file, "w") as fout:
+            json.dump({"scenarios": [{"name": "small_tube", "generator": "generate_tube",
+                                      "args": "--num_time_steps 10 --tube_sides 8"}]}, fout)
+        args = ['--scenarios', scenario_file, '--baselines', baseline_file]
+        with contextlib.redirect_stdout(io.StringIO()):
+            results, regressions = run_benchmarks.main(args + ['--update_baselines'])
+        self.assertEqual([], regressions)
+        result = results["small_tube"]
+        filename = os.path.join(self.output_dir, "tube.stl")
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_tube.main(['--num_time_steps', '10', '--tube_sides', '8', '--no_cache', '--output_name', filename])
+        self.assertEqual(run_benchmarks.count_triangles(filename), result["triangles"])
+        self.assertGreater(result["peak_rss_mb"], 0)
+
+        # make the baseline impossibly fast
+        with open(baseline_file) as fin:
+            baselines = json.load(fin)
+        baselines["scenarios"]["small_tube"]["seconds"] = 1e-6
+        baselines["scenarios"]["small_tube"]["peak_rss_mb"] = 1.0
+        with open(baseline_file, "w") as fout:
+            json.dump(baselines, fout)
+        with contextlib.redirect_stdout(io.StringIO()):
+            results, regressions = run_benchmarks.main(args + ['--min_seconds', '0'])
+        self.assertEqual(2, len(regressions))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import contextlib
+import filecmp
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import run_recipes
+
+class TestRunRecipes(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def write_recipes(self, filename, text):
+        recipe_file = os.path.join(self.output_dir, filename)
+        with open(recipe_file, "w") as fout:
+            fout.write(text)
+        return recipe_file
+
+    def test_run_recipes(self):
+        recipes = [{"generator": "generate_basic_ramp",
+                    "args": "--num_time_steps 24 --tube_sides 10 --no_cache",
+                    "output": "ramp.stl"},
+                   {"generator": "generate_basic_ramp",
+                    "args": ["--num_time_steps", "24", "--tube_sides", "10", "--no_cache",
+                             "--output_format", "obj"],
+                    "output": "ramp.stl"},
+                   {"generator": "generate_nothing",
+                    "output": "nothing.stl"},
+                   {"generator": "generate_basic_ramp",
+                    "args": "--not_an_argument 3",
+                    "output": "broken.stl"}]
+        recipe_file = self.write_recipes("recipes.json", json.dumps({"recipes": recipes}))
+        with contextlib.redirect_stdout(io.StringIO()):
+            manifest = run_recipes.main([recipe_file, '--jobs', '2', '--output_dir', self.output_dir])
+
+        self.assertEqual(2, manifest["succeeded"])
+        self.assertEqual(2, manifest["failed"])
+        with open(os.path.join(self.output_dir, "recipes.manifest.json")) as fin:
+            self.assertEqual(manifest, json.load(fin))
+
+        runs = manifest["runs"]
+        self.assertEqual([0, 1, 2, 3], [run["index"] for run in runs])
+        self.assertEqual(["ok", "ok", "failed", "failed"], [run["status"] for run in runs])
+        self.assertEqual(os.path.join(self.output_dir, "ramp.stl"), runs[0]["output"])
+        self.assertEqual(os.path.join(self.output_dir, "ramp.obj"), runs[1]["output"])
+        self.assertTrue(filecmp.cmp(runs[0]["output"], "test_files/basic_ramp.stl", shallow=False))
+        # the generator's stats are captured
+        self.assertIn("Start of the curve", runs[0]["stdout"])
+        self.assertIn("Unknown generator", runs[2]["error"])
+        self.assertIn("unrecognized arguments", runs[3]["stdout"])
+
+    def test_toml(self):
+        recipe_file = self.write_recipes("recipes.toml",
+                                         '[[recipes]]\n'
+                                         'generator = "generate_basic_ramp"\n'
+                                         'args = "--num_time_steps 24 --tube_sides 10"\n'
+                                         'output = "ramp.stl"\n')
+        recipes = run_recipes.load_recipes(recipe_file)
+        self.assertEqual(1, len(recipes))
+        self.assertEqual(["--num_time_steps", "24", "--tube_sides", "10"], run_recipes.recipe_args(recipes[0]))
+
+    def test_example_recipes(self):
+        recipes = run_recipes.load_recipes("recipes/hypotrochoid_three_leaf.json")
+        self.assertEqual(3, len(recipes))
+        for recipe in recipes:
+            self.assertIn(recipe["generator"], run_recipes.available_generators())
+
+if __name__ == '__main__':
+    unittest.main()
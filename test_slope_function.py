@@ -0,0 +1,46 @@
+import random
+import unittest
+
+import slope_function
+
+def bisect_drop_angle(arclengths, slope_angle, start_time_step, end_time_step, needed_dz):
+    """
+    The plain binary search which get_drop_angle is meant to reproduce
+    """
+    min_angle = slope_angle
+    max_angle = 45
+    while max_angle - min_angle > 0.01:
+        test_angle = (max_angle + min_angle) / 2
+        total_drop = slope_function.get_drop(arclengths, slope_angle, test_angle, start_time_step, end_time_step)
+        if total_drop < needed_dz:
+            min_angle = test_angle
+        else:
+            max_angle = test_angle
+    return (max_angle + min_angle) / 2.0
+
+class TestSlopeFunction(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(1234)
+        self.arclengths = [0.0]
+        for i in range(300):
+            self.arclengths.append(self.arclengths[-1] + rand.uniform(0.1, 2.0))
+
+    def test_drop_function(self):
+        for start, end in ((0, 300), (10, 14), (50, 51), (100, 250)):
+            drop = slope_function.drop_function(self.arclengths, 2.0, start, end)
+            for angle in (2.0, 10.0, 33.3, 45.0):
+                self.assertAlmostEqual(slope_function.get_drop(self.arclengths, 2.0, angle, start, end),
+                                       drop(angle))
+
+    def test_get_drop_angle(self):
+        for start, end, needed_dz in ((0, 300, 50.0), (10, 40, 5.0), (100, 250, 30.0)):
+            expected = bisect_drop_angle(self.arclengths, 2.0, start, end, needed_dz)
+            self.assertEqual(expected, slope_function.get_drop_angle(self.arclengths, 2.0, start, end, needed_dz))
+
+        # already drops far enough
+        self.assertIsNone(slope_function.get_drop_angle(self.arclengths, 2.0, 0, 300, 1.0))
+        with self.assertRaises(ValueError):
+            slope_function.get_drop_angle(self.arclengths, 2.0, 0, 10, 1000.0)
+
+if __name__ == '__main__':
+    unittest.main()